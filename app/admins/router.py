@@ -4,7 +4,8 @@ from app.database.session import get_db
 from app.users.models import AdminMicroempresa
 from app.auth.base_user import Usuario
 from app.users.schemas import UsuarioResponse
-from app.core.dependencies import get_current_user, get_user_role
+from app.users.service import listar_directorio_por_rol
+from app.core.dependencies import get_current_user, get_user_role, invalidar_principal
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(
@@ -21,21 +22,11 @@ class AdminUpdate(BaseModel):
 @router.get("/", response_model=list[UsuarioResponse])
 def listar_admins(db: Session = Depends(get_db), user=Depends(get_current_user)):
     rol = get_user_role(user, db)
-    def build_response(adm):
-        usuario = adm.usuario
-        return {
-            "id_usuario": usuario.id_usuario,
-            "nombre": usuario.nombre,
-            "email": usuario.email,
-            "estado": usuario.estado,
-            "rol": "adminmicroempresa",
-            "id_microempresa": adm.id_microempresa
-        }
     if rol == 'superadmin':
-        return [build_response(adm) for adm in db.query(AdminMicroempresa).all()]
+        return listar_directorio_por_rol(db, AdminMicroempresa, "adminmicroempresa")
     elif rol == 'adminmicroempresa':
         id_micro = user.admin_microempresa.id_microempresa
-        return [build_response(adm) for adm in db.query(AdminMicroempresa).filter_by(id_microempresa=id_micro).all()]
+        return listar_directorio_por_rol(db, AdminMicroempresa, "adminmicroempresa", id_microempresa=id_micro)
     else:
         raise HTTPException(status_code=403, detail="No autorizado")
 
@@ -70,6 +61,7 @@ def eliminar_admin(id_usuario: int, db: Session = Depends(get_db), user=Depends(
     if rol == 'superadmin' or (rol == 'adminmicroempresa' and user.id_usuario == id_usuario):
         db.delete(admin)
         db.commit()
+        invalidar_principal(id_usuario)
         return {"detail": "Admin eliminado"}
     else:
         raise HTTPException(status_code=403, detail="No autorizado")
@@ -89,6 +81,7 @@ def actualizar_admin(id_usuario: int, data: AdminUpdate, db: Session = Depends(g
         usuario.nombre = data.nombre
         usuario.email = data.email
         db.commit()
+        invalidar_principal(id_usuario)
         db.refresh(usuario)
         return usuario
     else:
@@ -5,7 +5,8 @@ from app.auth.base_user import Usuario
 from app.auth.models import SuperAdmin
 from app.users.models import Vendedor, AdminMicroempresa
 from app.core.security import hash_password, verify_password, create_access_token
-from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
+from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, JWT_CLAIMS_PRINCIPAL
+from app.core.dependencies import cargar_principal, invalidar_principal
 
 
 def get_user_by_email(db: Session, email: str):
@@ -78,6 +79,7 @@ def asignar_microempresa_a_admin(db: Session, id_usuario: int, id_microempresa:
     if admin:
         admin.id_microempresa = id_microempresa
         db.commit()
+        invalidar_principal(id_usuario)
         db.refresh(admin)
         return admin
     # Si no es admin, lo crea
@@ -87,6 +89,7 @@ def asignar_microempresa_a_admin(db: Session, id_usuario: int, id_microempresa:
     )
     db.add(nuevo_admin)
     db.commit()
+    invalidar_principal(id_usuario)
     db.refresh(nuevo_admin)
     return nuevo_admin
 
@@ -122,8 +125,12 @@ def login(db: Session, email: str, password: str):
     if not user or not verify_password(password, user.password_hash):
         raise HTTPException(status_code=401, detail="Credenciales incorrectas")
 
+    datos = {"sub": str(user.id_usuario)}
+    if JWT_CLAIMS_PRINCIPAL:
+        # Rol y microempresa viajan en el token: get_current_user no consulta la base
+        datos.update(cargar_principal(db, user.id_usuario).a_claims())
     token = create_access_token(
-        data={"sub": str(user.id_usuario)},
+        data=datos,
         expires_minutes=ACCESS_TOKEN_EXPIRE_MINUTES
     )
     return token
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
 class Cliente(Base):
     __tablename__ = "cliente"
+    __table_args__ = (
+        Index('ix_cliente_microempresa_fecha_id', 'id_microempresa', 'fecha_creacion', 'id_cliente'),
+    )
 
     id_cliente = Column(Integer, primary_key=True, index=True)
     id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa", ondelete="CASCADE"), nullable=False)
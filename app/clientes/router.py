@@ -1,9 +1,10 @@
 
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from app.database.session import get_db
 from . import schemas, service
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
 from app.core.dependencies import get_current_user, get_user_role
 
 router = APIRouter(
@@ -38,18 +39,18 @@ def crear_cliente(cliente: schemas.ClienteCreate, db: Session = Depends(get_db),
     return service.crear_cliente(db, cliente_data)
 
 @router.get("/", response_model=list[schemas.ClienteResponse])
-def listar_clientes(db: Session = Depends(get_db)):
-    return service.listar_clientes(db)
+def listar_clientes(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes(db, pagina.cursor, pagina.limit))
 
 # Ruta para listar clientes activos (sin filtrar por microempresa)
 @router.get("/activos", response_model=list[schemas.ClienteResponse])
-def listar_clientes_activos(db: Session = Depends(get_db)):
-    return service.listar_clientes_activos(db)
+def listar_clientes_activos(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes_activos(db, pagina.cursor, pagina.limit))
 
 # Ruta para listar clientes inactivos (sin filtrar por microempresa)
 @router.get("/inactivos", response_model=list[schemas.ClienteResponse])
-def listar_clientes_inactivos(db: Session = Depends(get_db)):
-    return service.listar_clientes_inactivos(db)
+def listar_clientes_inactivos(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes_inactivos(db, pagina.cursor, pagina.limit))
 
 @router.get("/{id_cliente}", response_model=schemas.ClienteResponse)
 def obtener_cliente(id_cliente: int, db: Session = Depends(get_db)):
@@ -80,16 +81,16 @@ def eliminar_cliente(id_cliente: int, db: Session = Depends(get_db)):
 
 
 @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.ClienteResponse])
-def listar_clientes_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_clientes_por_microempresa(db, id_microempresa)
+def listar_clientes_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/activos", response_model=list[schemas.ClienteResponse])
-def listar_clientes_activos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_clientes_activos_por_microempresa(db, id_microempresa)
+def listar_clientes_activos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes_activos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/inactivos", response_model=list[schemas.ClienteResponse])
-def listar_clientes_inactivos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_clientes_inactivos_por_microempresa(db, id_microempresa)
+def listar_clientes_inactivos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_clientes_inactivos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.put("/{id_cliente}/habilitar", response_model=schemas.ClienteResponse)
 def habilitar_cliente(id_cliente: int, db: Session = Depends(get_db)):
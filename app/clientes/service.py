@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from . import models, schemas
 from datetime import datetime
+from app.core.paginacion import paginar
 
 def crear_cliente(db: Session, data: schemas.ClienteCreate):
     cliente = models.Cliente(
@@ -22,25 +23,28 @@ def obtener_cliente(db: Session, id_cliente: int):
 
 
 # Listar todos los clientes (sin filtrar por estado)
-def listar_clientes(db: Session):
-    return db.query(models.Cliente).all()
+def _paginar_clientes(consulta, cursor: str = None, limit: int = None):
+    return paginar(consulta, models.Cliente.id_cliente, models.Cliente.fecha_creacion, cursor, limit)
+
+def listar_clientes(db: Session, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente), cursor, limit)
 
 # Listar clientes activos (sin filtrar por microempresa)
-def listar_clientes_activos(db: Session):
-    return db.query(models.Cliente).filter_by(estado=True).all()
+def listar_clientes_activos(db: Session, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente).filter_by(estado=True), cursor, limit)
 
 # Listar clientes inactivos (sin filtrar por microempresa)
-def listar_clientes_inactivos(db: Session):
-    return db.query(models.Cliente).filter_by(estado=False).all()
+def listar_clientes_inactivos(db: Session, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente).filter_by(estado=False), cursor, limit)
 
-def listar_clientes_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Cliente).filter_by(id_microempresa=id_microempresa).all()
+def listar_clientes_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente).filter_by(id_microempresa=id_microempresa), cursor, limit)
 
-def listar_clientes_activos_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Cliente).filter_by(id_microempresa=id_microempresa, estado=True).all()
+def listar_clientes_activos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente).filter_by(id_microempresa=id_microempresa, estado=True), cursor, limit)
 
-def listar_clientes_inactivos_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Cliente).filter_by(id_microempresa=id_microempresa, estado=False).all()
+def listar_clientes_inactivos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    return _paginar_clientes(db.query(models.Cliente).filter_by(id_microempresa=id_microempresa, estado=False), cursor, limit)
 
 def actualizar_cliente(db: Session, id_cliente: int, data: schemas.ClienteUpdate):
     cliente = db.query(models.Cliente).filter_by(id_cliente=id_cliente).first()
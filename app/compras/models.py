@@ -1,11 +1,14 @@
 # models.py para el módulo de compras
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Numeric, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.base import Base
 
 class Compra(Base):
 	__tablename__ = "compra"
+	__table_args__ = (
+		Index('ix_compra_microempresa_fecha_id', 'id_microempresa', 'fecha', 'id_compra'),
+	)
 
 	id_compra = Column(Integer, primary_key=True, index=True)
 	id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa"), nullable=False)
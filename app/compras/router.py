@@ -1,23 +1,25 @@
 from fastapi.responses import StreamingResponse
 import io
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Body
+from fastapi import APIRouter, Depends, HTTPException, Path, Body, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.core.dependencies import get_db
 from app.compras import service, schemas
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, verificar_microempresa
+from app.core.importacion import leer_filas
 
 router = APIRouter(prefix="/compras", tags=["Compras"])
 
-from fastapi import Query # Asegúrate de importar Query
+from fastapi import Query, Response # Asegúrate de importar Query
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
 
 # 1️⃣9️⃣ Listar compras de una microempresa (ESTE FALTABA)
 @router.get("", response_model=List[schemas.CompraResponse])
-def listar_compras(id_microempresa: int = Query(None), db: Session = Depends(get_db)):
+def listar_compras(response: Response, id_microempresa: int = Query(None), pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     if id_microempresa is None:
         raise HTTPException(status_code=400, detail="Debe especificar la microempresa")
-    return service.listar_compras(db, id_microempresa)
+    return responder_pagina(response, service.listar_compras(db, id_microempresa, pagina.cursor, pagina.limit))
 
 # 1️⃣2️⃣ Crear compra
 @router.post("", response_model=schemas.CompraResponse)
@@ -25,6 +27,22 @@ def crear_compra(data: schemas.CompraCreate, db: Session = Depends(get_db), user
 	# TODO: Reemplazar None por user.id_microempresa cuando haya autenticación
 	return service.crear_compra(db, data, id_microempresa=None, usuario_actual=user)
 
+# Importar factura de compra (CSV / JSON / NDJSON / XLSX, miles de líneas)
+@router.post("/importar", response_model=schemas.ImportacionCompraResponse)
+def importar_factura_compra(
+	archivo: UploadFile = File(...),
+	id_microempresa: int = Form(...),
+	id_proveedor: int = Form(...),
+	metodo_pago: str = Form("EFECTIVO"),
+	observacion: Optional[str] = Form(None),
+	formato: Optional[str] = Form(None, description="csv, json, ndjson o xlsx; por defecto según la extensión"),
+	db: Session = Depends(get_db),
+	user=Depends(get_current_user)
+):
+	verificar_microempresa(user, id_microempresa)
+	filas = leer_filas(archivo, formato, clave_lista="detalles")
+	return service.importar_factura_compra(db, id_microempresa, id_proveedor, metodo_pago, observacion, filas)
+
 # 1️⃣3️⃣ Agregar detalle a compra
 @router.post("/{id_compra}/detalles", response_model=schemas.DetalleCompraResponse)
 def agregar_detalle_compra(id_compra: int = Path(...), data: schemas.DetalleCompraCreate = Body(...), db: Session = Depends(get_db)):
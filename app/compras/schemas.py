@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 from datetime import datetime
 from app.proveedores.schemas import ProveedorResponse # Importar esquema de proveedor
@@ -9,6 +9,19 @@ class DetalleCompraCreate(BaseModel):
     cantidad: int
     precio_unitario: float
 
+class LineaFacturaCompra(BaseModel):
+    """Fila de una factura importada (CSV/JSON): el producto va por id_producto o por codigo."""
+    id_producto: Optional[int] = None
+    codigo: Optional[str] = None
+    cantidad: int = Field(gt=0)
+    precio_unitario: float = Field(ge=0)
+
+    @model_validator(mode="after")
+    def producto_identificado(self):
+        if self.id_producto is None and not self.codigo:
+            raise ValueError("Debe indicar id_producto o codigo")
+        return self
+
 class DetalleCompraResponse(BaseModel):
     id_detalle_compra: int
     id_producto: int
@@ -39,6 +52,12 @@ class CompraResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ImportacionCompraResponse(BaseModel):
+    compra: CompraResponse
+    lineas: int
+    productos: int
+    unidades: int
+
 # --------- PagoCompra ---------
 class PagoCompraCreate(BaseModel):
     id_metodo_pago: Optional[int] = None
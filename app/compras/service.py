@@ -1,6 +1,7 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select, insert, update, case
 from fastapi import HTTPException
+from pydantic import ValidationError
 from app.compras import models, schemas
 from app.proveedores.models import Proveedor, ProveedorProducto, ProveedorMetodoPago
 from app.productos.models import Producto
@@ -9,9 +10,21 @@ from app.inventario import service as inventario_service
 from app.notificaciones import service as notificaciones_service
 from app.users.models import AdminMicroempresa
 from app.notificaciones.schemas import NotificacionCreate
+from app.reportes.service import registrar_compra_en_resumen, ESTADOS_COMPRA_RESUMEN
+from app.productos.service import invalidar_cache_portal
+from app.core.paginacion import paginar
+from app.core.config import IMPORTACION_TAM_LOTE
+from app.core.importacion import describir_error
+from app.database.session import al_confirmar
 
 # 1️⃣ Crear compra (Con actualización automática de Stock)
 def crear_compra(db: Session, data: schemas.CompraCreate, id_microempresa: int = None, usuario_actual=None):
+    """
+    Registra la compra y todo su detalle en una sola transacción, en bloque:
+    productos en un IN por lote, detalles en un INSERT multi-fila, stock y precios con un
+    UPDATE por lote, un único evento COMPRA_REGISTRADA y un solo commit.
+    Las líneas con productos inexistentes o de otra microempresa se omiten.
+    """
     # 1. Validar Proveedor
     proveedor = db.query(Proveedor).filter_by(id_proveedor=data.id_proveedor, estado=True).first()
     if not proveedor:
@@ -37,72 +50,137 @@ def crear_compra(db: Session, data: schemas.CompraCreate, id_microempresa: int =
     db.add(compra)
     db.flush() # Obtenemos el ID de la compra
 
-    # 4. Procesar Detalles y ACTUALIZAR STOCK
-    total_acumulado = 0
-    
-    if data.detalles:
-        for item in data.detalles:
-            # Validar producto
-            producto = db.query(Producto).filter_by(id_producto=item.id_producto).first()
-            if not producto:
-                continue 
-
-            # Validar pertenencia del producto
-            if producto.id_microempresa != micro_id:
-                continue
-
-            subtotal = item.cantidad * item.precio_unitario
-
-            detalle = models.DetalleCompra(
-                id_compra=compra.id_compra,
-                id_producto=item.id_producto,
-                cantidad=item.cantidad,
-                precio_unitario=item.precio_unitario,
-                subtotal=subtotal
-            )
-            db.add(detalle)
-            total_acumulado += subtotal
-
-            # --- 🟢 ACTUALIZACIÓN DE STOCK (Lógica Robusta) ---
-            try:
-                # Opción A: Usar servicio de inventario si existe
-                if hasattr(inventario_service, 'aumentar_stock'):
-                    inventario_service.aumentar_stock(db, item.id_producto, item.cantidad)
-                elif hasattr(inventario_service, 'ajuste_stock'):
-                    inventario_service.ajuste_stock(db, item.id_producto, item.cantidad)
-                # Opción B (Fallback): Actualizar modelo directamente
-                else:
-                    if producto.stock is None:
-                        producto.stock = 0
-                    producto.stock += item.cantidad
-                    db.add(producto) # Marcamos para guardar
-            except Exception as e:
-                print(f"Advertencia: Error al actualizar stock para producto {item.id_producto}: {str(e)}")
-            # ----------------------------------------------------
-
-            # --- 🟢 ACTUALIZACIÓN DE PRECIO DE COMPRA Y PRECIO DE VENTA ---
-            try:
-                producto.costo_compra = item.precio_unitario
-                producto.precio_venta = round(float(item.precio_unitario) * 1.105, 2)
-                db.add(producto)
-            except Exception as e:
-                print(f"Advertencia: Error al actualizar precios para producto {item.id_producto}: {str(e)}")
+    # 4. Detalles, stock (+ kardex) y precios en bloque
+    resumen = _registrar_detalles_compra(db, compra, data.detalles or [])
 
     # 5. Guardar Cambios Finales
-    compra.total = total_acumulado
+    registrar_compra_en_resumen(db, compra)
+    # 6. Un único evento de compra registrada, después del commit
+    _programar_evento_compra(db, compra, resumen)
     db.commit()
     db.refresh(compra)
+    invalidar_cache_portal(micro_id)
+    return compra
+
+def _lotes(valores, tam: int = IMPORTACION_TAM_LOTE):
+    valores = list(valores)
+    for i in range(0, len(valores), tam):
+        yield valores[i:i + tam]
+
+def _productos_de_microempresa(db: Session, id_microempresa: int, ids):
+    """Ids (de `ids`) que existen y pertenecen a la microempresa, con un IN por lote."""
+    encontrados = set()
+    for lote in _lotes(set(ids)):
+        encontrados.update(db.scalars(
+            select(Producto.id_producto).where(Producto.id_producto.in_(lote), Producto.id_microempresa == id_microempresa)
+        ))
+    return encontrados
+
+def _registrar_detalles_compra(db: Session, compra, detalles):
+    """
+    Inserta el detalle de la compra, suma el stock y actualiza costo/precio de venta de los
+    productos con sentencias por lote (no por línea). Fija compra.total. No hace commit.
+    """
+    validos = _productos_de_microempresa(db, compra.id_microempresa, [d.id_producto for d in detalles])
+    filas, cantidades, precios = [], {}, {}
+    total_acumulado = 0
+    for item in detalles:
+        if item.id_producto not in validos:
+            continue
+        subtotal = item.cantidad * item.precio_unitario
+        filas.append({
+            "id_compra": compra.id_compra,
+            "id_producto": item.id_producto,
+            "cantidad": item.cantidad,
+            "precio_unitario": item.precio_unitario,
+            "subtotal": subtotal,
+        })
+        total_acumulado += subtotal
+        cantidades[item.id_producto] = cantidades.get(item.id_producto, 0) + item.cantidad
+        # Si un producto se repite, queda el precio de su última línea
+        precios[item.id_producto] = item.precio_unitario
+
+    for lote in _lotes(filas):
+        db.execute(insert(models.DetalleCompra), lote)
+    for lote in _lotes(cantidades):
+        # --- 🟢 ACTUALIZACIÓN DE STOCK: un UPDATE por lote + movimientos COMPRA en el kardex ---
+        inventario_service.sumar_stock_lote(db, {i: cantidades[i] for i in lote}, "COMPRA", compra.id_compra)
+        # --- 🟢 ACTUALIZACIÓN DE PRECIO DE COMPRA Y PRECIO DE VENTA ---
+        db.execute(
+            update(Producto)
+            .where(Producto.id_producto.in_(lote))
+            .values(
+                costo_compra=case({i: precios[i] for i in lote}, value=Producto.id_producto),
+                precio_venta=case({i: round(float(precios[i]) * 1.105, 2) for i in lote}, value=Producto.id_producto),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    compra.total = total_acumulado
+    return {"lineas": len(filas), "productos": len(cantidades), "unidades": sum(cantidades.values())}
 
-    # 6. Evento y notificación automática de compra registrada
-    from app.notificaciones import service as notif_service
-    notif_service.generar_evento(
-        tipo_evento="COMPRA_REGISTRADA",
-        mensaje=f"Se ha realizado una nueva compra (ID: {compra.id_compra}) en la microempresa.",
-        id_microempresa=compra.id_microempresa,
-        referencia_id=compra.id_compra,
-        db=db
+def _programar_evento_compra(db: Session, compra, resumen):
+    id_compra, id_microempresa = compra.id_compra, compra.id_microempresa
+    mensaje = (
+        f"Se ha realizado una nueva compra (ID: {id_compra}) en la microempresa: "
+        f"{resumen['productos']} productos, {resumen['unidades']} unidades ingresadas al inventario."
     )
-    return compra
+
+    def emitir(sesion: Session):
+        from app.notificaciones import service as notif_service
+        notif_service.generar_evento(
+            tipo_evento="COMPRA_REGISTRADA",
+            mensaje=mensaje,
+            id_microempresa=id_microempresa,
+            referencia_id=id_compra,
+            db=sesion
+        )
+
+    al_confirmar(db, emitir)
+
+def importar_factura_compra(db: Session, id_microempresa: int, id_proveedor: int, metodo_pago: str, observacion: str, filas):
+    """
+    Crea una compra desde las filas de una factura (CSV/JSON/NDJSON, ver app.core.importacion).
+    Cada fila identifica el producto por id_producto o por codigo. A diferencia de crear_compra,
+    la factura se rechaza completa (422, con el detalle por línea) si alguna fila es inválida o
+    su producto no existe en la microempresa.
+    """
+    lineas, errores = [], []
+    for numero, fila in filas:
+        try:
+            lineas.append((numero, schemas.LineaFacturaCompra.model_validate(fila)))
+        except ValidationError as e:
+            errores.append({"linea": numero, "error": describir_error(e)})
+    if not lineas and not errores:
+        raise HTTPException(status_code=400, detail="La factura no tiene líneas")
+
+    # Resolver códigos de producto en un IN por lote
+    codigos = {l.codigo for _, l in lineas if l.id_producto is None}
+    por_codigo = {}
+    for lote in _lotes(codigos):
+        por_codigo.update(db.execute(
+            select(Producto.codigo, Producto.id_producto).where(Producto.id_microempresa == id_microempresa, Producto.codigo.in_(lote))
+        ).all())
+    validos = _productos_de_microempresa(db, id_microempresa, [l.id_producto for _, l in lineas if l.id_producto is not None])
+    detalles = []
+    for numero, linea in lineas:
+        id_producto = linea.id_producto if linea.id_producto is not None else por_codigo.get(linea.codigo)
+        if id_producto is None or (linea.id_producto is not None and id_producto not in validos):
+            errores.append({"linea": numero, "error": f"Producto no encontrado: {linea.id_producto or linea.codigo}"})
+            continue
+        detalles.append(schemas.DetalleCompraCreate(id_producto=id_producto, cantidad=linea.cantidad, precio_unitario=linea.precio_unitario))
+    if errores:
+        errores.sort(key=lambda e: e["linea"])
+        raise HTTPException(status_code=422, detail={"mensaje": "La factura tiene líneas inválidas", "errores": errores[:100], "total_errores": len(errores)})
+
+    data = schemas.CompraCreate(
+        id_microempresa=id_microempresa,
+        id_proveedor=id_proveedor,
+        observacion=observacion,
+        metodo_pago=metodo_pago,
+        detalles=detalles,
+    )
+    compra = crear_compra(db, data, id_microempresa=id_microempresa)
+    return {"compra": compra, "lineas": len(detalles), "productos": len({d.id_producto for d in detalles}), "unidades": sum(d.cantidad for d in detalles)}
 
 # 2️⃣ Agregar detalle a compra (También actualiza stock)
 def agregar_detalle_compra(db: Session, id_compra: int, data: schemas.DetalleCompraCreate, id_microempresa: int = None):
@@ -123,16 +201,18 @@ def agregar_detalle_compra(db: Session, id_compra: int, data: schemas.DetalleCom
     )
     db.add(detalle)
     
-    # 🟢 Actualizar Stock (Manual directo para asegurar)
+    # 🟢 Actualizar Stock (y kardex)
     producto = db.query(Producto).filter_by(id_producto=data.id_producto).first()
     if producto:
-        producto.stock = (producto.stock or 0) + data.cantidad
-        db.add(producto)
+        inventario_service.sumar_stock_lote(db, {data.id_producto: data.cantidad}, "COMPRA", id_compra)
 
-    db.commit()
+    db.flush()
     
     # Recalcular total de la compra
     total = db.query(func.sum(models.DetalleCompra.subtotal)).filter_by(id_compra=id_compra).scalar() or 0
+    if compra.estado in ESTADOS_COMPRA_RESUMEN and total != compra.total:
+        # Solo la diferencia: la compra ya estaba contada en el resumen diario
+        registrar_compra_en_resumen(db, compra, total=total - (compra.total or 0), cantidad=0)
     compra.total = total
     db.commit()
     db.refresh(detalle)
@@ -157,6 +237,8 @@ def confirmar_compra(db: Session, id_compra: int, id_microempresa: int = None):
     
     # Si la compra estaba en borrador y pasa a confirmada, aquí se debería sumar stock si no se hizo antes.
     # Como en este flujo sumamos al crear, solo cambiamos estado si fuese necesario.
+    if compra.estado not in ESTADOS_COMPRA_RESUMEN:
+        registrar_compra_en_resumen(db, compra)
     compra.estado = "CONFIRMADA"
     db.commit()
     db.refresh(compra)
@@ -184,12 +266,12 @@ def listar_pagos(db: Session, id_compra: int):
     return db.query(models.PagoCompra).filter_by(id_compra=id_compra).all()
 
 # 7️⃣ Listar compras
-def listar_compras(db: Session, id_microempresa: int):
-    # Retorna las compras de la microempresa ordenadas por fecha (más reciente primero)
-    return db.query(models.Compra)\
-             .filter_by(id_microempresa=id_microempresa)\
-             .order_by(models.Compra.fecha.desc())\
-             .all()
+def listar_compras(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    # Retorna las compras de la microempresa ordenadas por fecha (más reciente primero), por páginas
+    consulta = db.query(models.Compra)\
+             .options(joinedload(models.Compra.proveedor))\
+             .filter_by(id_microempresa=id_microempresa)
+    return paginar(consulta, models.Compra.id_compra, models.Compra.fecha, cursor, limit)
 
 # 8️⃣ Finalizar compra (Opcional, si usas flujo de 2 pasos)
 def finalizar_compra(db: Session, id_compra: int, id_microempresa: int = None):
@@ -198,6 +280,8 @@ def finalizar_compra(db: Session, id_compra: int, id_microempresa: int = None):
         raise HTTPException(status_code=404, detail="Compra no encontrada")
         
     # Lógica adicional si se requiere marcar como "PAGADA" u otro estado final
+    if compra.estado not in ESTADOS_COMPRA_RESUMEN:
+        registrar_compra_en_resumen(db, compra)
     compra.estado = "FINALIZADA"
     db.commit()
     db.refresh(compra)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """
+    Cache en memoria (por proceso) con expiración por TTL y desalojo LRU.
+
+    Cada clave lleva un número de versión que sube en cada invalidar(): quien calcula un
+    valor toma la versión antes de consultar la BD y guardar() lo descarta si mientras
+    tanto hubo una invalidación, así una lectura lenta no vuelve a dejar datos viejos.
+    """
+    def __init__(self, max_items: int = 512, ttl: float = 60.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._versiones = {}
+        self._epoca = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def version(self, clave):
+        with self._lock:
+            return (self._epoca, self._versiones.get(clave, 0))
+
+    def guardar(self, clave, valor, version=None):
+        with self._lock:
+            if version is not None and version != (self._epoca, self._versiones.get(clave, 0)):
+                return False
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+            return True
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._versiones[clave] = self._versiones.get(clave, 0) + 1
+            self.invalidaciones += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._epoca += 1
+            self._datos.clear()
+
+    def metricas(self) -> dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "capacidad": self.max_items,
+                "ttl_s": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0,
+                "invalidaciones": self.invalidaciones,
+            }
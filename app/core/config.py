@@ -14,3 +14,116 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+
+# Usuario autenticado: cache por id_usuario (rol e id_microempresa) y claims opcionales en el JWT
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", 4096))
+JWT_CLAIMS_PRINCIPAL = os.getenv("JWT_CLAIMS_PRINCIPAL", "false").lower() == "true"
+
+# Bus de eventos (notificaciones fuera del request)
+EVENTOS_ASINCRONOS = os.getenv("EVENTOS_ASINCRONOS", "true").lower() == "true"
+EVENTOS_COLA_MAX = int(os.getenv("EVENTOS_COLA_MAX", 1000))
+EVENTOS_WORKERS = int(os.getenv("EVENTOS_WORKERS", 2))
+EVENTOS_TAM_LOTE = int(os.getenv("EVENTOS_TAM_LOTE", 50))
+EVENTOS_ESPERA_MAX = float(os.getenv("EVENTOS_ESPERA_MAX", 0.5))
+EVENTOS_MAX_INTENTOS = int(os.getenv("EVENTOS_MAX_INTENTOS", 5))
+EVENTOS_BACKOFF_BASE = float(os.getenv("EVENTOS_BACKOFF_BASE", 1))
+EVENTOS_BACKOFF_MAX = float(os.getenv("EVENTOS_BACKOFF_MAX", 60))
+
+# Correo saliente: servidor SMTP (EMAIL_* y, como respaldo, las antiguas GMAIL_*). Puerto 465 = SSL directo;
+# con EMAIL_STARTTLS=false y sin usuario sirve un servidor local de pruebas (aiosmtpd)
+EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER") or os.getenv("GMAIL_USER")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD") or os.getenv("GMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("EMAIL_FROM") or EMAIL_HOST_USER
+EMAIL_STARTTLS = os.getenv("EMAIL_STARTTLS", "true").lower() == "true"
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", 20))
+# Cola de correo (tabla notificacion_email_log): envío fuera del request con una sesión SMTP reutilizada,
+# reintentos con backoff exponencial y límite de envíos por minuto por dominio destino
+CORREO_ASINCRONO = os.getenv("CORREO_ASINCRONO", "true").lower() == "true"
+CORREO_TAM_LOTE = int(os.getenv("CORREO_TAM_LOTE", 50))
+CORREO_MAX_INTENTOS = int(os.getenv("CORREO_MAX_INTENTOS", 6))
+CORREO_BACKOFF_BASE = float(os.getenv("CORREO_BACKOFF_BASE", 30))
+CORREO_BACKOFF_MAX = float(os.getenv("CORREO_BACKOFF_MAX", 3600))
+CORREO_LIMITE_DOMINIO = int(os.getenv("CORREO_LIMITE_DOMINIO", 60))  # por minuto; 0 = sin límite
+CORREO_SMTP_INACTIVIDAD = float(os.getenv("CORREO_SMTP_INACTIVIDAD", 60))
+CORREO_ARRENDAMIENTO = float(os.getenv("CORREO_ARRENDAMIENTO", 300))
+CORREO_INTERVALO = float(os.getenv("CORREO_INTERVALO", 5))
+
+# WebSocket de notificaciones: mensajes pendientes por conexión antes de desconectar a un cliente lento,
+# intervalo del ping y silencio máximo del cliente (0 = no exigir respuesta al ping)
+WS_COLA_MAX = int(os.getenv("WS_COLA_MAX", 100))
+WS_HEARTBEAT_INTERVALO = float(os.getenv("WS_HEARTBEAT_INTERVALO", 30))
+WS_HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", 0))
+# Reparto entre workers: memoria (un proceso), postgres (LISTEN/NOTIFY, varios hosts) o unix (sockets en un host)
+WS_BACKPLANE = os.getenv("WS_BACKPLANE", "memoria").lower()
+WS_BACKPLANE_CANAL = os.getenv("WS_BACKPLANE_CANAL", "notificaciones_ws")
+WS_BACKPLANE_CARPETA = os.getenv("WS_BACKPLANE_CARPETA", "/tmp/backend-taller-ws")
+# Reposición al reconectar con last_event_id: filas por consulta y máximo por conexión
+WS_REPOSICION_PAGINA = int(os.getenv("WS_REPOSICION_PAGINA", 200))
+WS_REPOSICION_MAX = int(os.getenv("WS_REPOSICION_MAX", 1000))
+# Contador de notificaciones no leídas: cache por usuario y cada cuántos segundos se reconcilia con la tabla (0 = nunca)
+CONTADOR_CACHE_TTL = float(os.getenv("CONTADOR_CACHE_TTL", 30))
+CONTADOR_CACHE_MAX = int(os.getenv("CONTADOR_CACHE_MAX", 10000))
+CONTADOR_RECONCILIAR_INTERVALO = float(os.getenv("CONTADOR_RECONCILIAR_INTERVALO", 300))
+
+# Cache del portal público de productos (JSON serializado por microempresa)
+PORTAL_CACHE_TTL = float(os.getenv("PORTAL_CACHE_TTL", 60))
+PORTAL_CACHE_MAX = int(os.getenv("PORTAL_CACHE_MAX", 512))
+
+# Paginación por cursor de los listados
+PAGINACION_LIMITE = int(os.getenv("PAGINACION_LIMITE", 100))
+PAGINACION_LIMITE_MAX = int(os.getenv("PAGINACION_LIMITE_MAX", 500))
+
+# Búsqueda de productos: índice en memoria (motores sin pg_trgm) y similitud mínima para errores de tipeo
+BUSQUEDA_INDICE_TTL = float(os.getenv("BUSQUEDA_INDICE_TTL", 300))
+BUSQUEDA_INDICE_MAX = int(os.getenv("BUSQUEDA_INDICE_MAX", 256))
+BUSQUEDA_UMBRAL_SIMILITUD = float(os.getenv("BUSQUEDA_UMBRAL_SIMILITUD", 0.4))
+
+# Idempotency-Key de checkout y pagos: cache de respuestas, vigencia de las claves y espera por duplicados en curso
+IDEMPOTENCIA_CACHE_TTL = float(os.getenv("IDEMPOTENCIA_CACHE_TTL", 600))
+IDEMPOTENCIA_CACHE_MAX = int(os.getenv("IDEMPOTENCIA_CACHE_MAX", 10000))
+IDEMPOTENCIA_VIGENCIA_HORAS = int(os.getenv("IDEMPOTENCIA_VIGENCIA_HORAS", 24))
+IDEMPOTENCIA_ESPERA_MAX = float(os.getenv("IDEMPOTENCIA_ESPERA_MAX", 30))
+# Segundos tras los que una clave EN_CURSO sin confirmar se considera de un proceso caído y se puede recuperar
+IDEMPOTENCIA_ARRENDAMIENTO = float(os.getenv("IDEMPOTENCIA_ARRENDAMIENTO", 300))
+
+# Kardex: días de historial detallado que conserva compactar_kardex.py (lo anterior queda como un CIERRE por producto)
+KARDEX_RETENCION_DIAS = int(os.getenv("KARDEX_RETENCION_DIAS", 365))
+
+# Exportaciones en streaming: filas por lote del cursor del servidor
+EXPORTACION_TAM_LOTE = int(os.getenv("EXPORTACION_TAM_LOTE", 1000))
+
+# Cargas masivas (facturas de compra, productos): máximo de filas por archivo y filas por sentencia
+IMPORTACION_MAX_FILAS = int(os.getenv("IMPORTACION_MAX_FILAS", 20000))
+IMPORTACION_TAM_LOTE = int(os.getenv("IMPORTACION_TAM_LOTE", 1000))
+
+# Imágenes subidas: carpeta por contenido (hash), tamaño máximo, bloque de copia y variantes (webp o jpeg) en un pool de hilos
+IMAGENES_CARPETA = os.getenv("IMAGENES_CARPETA", "public/imagenes")
+IMAGENES_MAX_BYTES = int(os.getenv("IMAGENES_MAX_MB", 10)) * 1024 * 1024
+IMAGENES_TAM_BLOQUE = int(os.getenv("IMAGENES_TAM_BLOQUE", 64 * 1024))
+IMAGENES_WORKERS = int(os.getenv("IMAGENES_WORKERS", 2))
+IMAGENES_FORMATO = os.getenv("IMAGENES_FORMATO", "webp").lower()
+IMAGENES_CALIDAD = int(os.getenv("IMAGENES_CALIDAD", 80))
+# Archivos de /public: Cache-Control de los archivos con hash en el nombre (no cambian nunca) y del resto,
+# y LRU en memoria para archivos chicos (cantidad, tamaño máximo por archivo en bytes y TTL)
+ESTATICOS_MAX_AGE_INMUTABLE = int(os.getenv("ESTATICOS_MAX_AGE_INMUTABLE", 31536000))
+ESTATICOS_MAX_AGE = int(os.getenv("ESTATICOS_MAX_AGE", 0))
+ESTATICOS_CACHE_MAX = int(os.getenv("ESTATICOS_CACHE_MAX", 256))  # 0 = sin cache en memoria
+ESTATICOS_CACHE_ARCHIVO_MAX = int(os.getenv("ESTATICOS_CACHE_ARCHIVO_MAX", 64 * 1024))
+ESTATICOS_CACHE_TTL = float(os.getenv("ESTATICOS_CACHE_TTL", 300))
+
+# Pool de conexiones y diagnóstico SQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))  # 0 = sin límite
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# Capa async opcional (asyncpg / aiosqlite). Si no se define, se deriva de DATABASE_URL.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+# Routers que usan las variantes async de sus lecturas, separados por coma: productos,ventas,inventario,reportes
+ROUTERS_ASYNC = {nombre.strip() for nombre in os.getenv("ROUTERS_ASYNC", "").split(",") if nombre.strip()}
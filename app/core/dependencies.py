@@ -1,18 +1,95 @@
+from typing import NamedTuple, Optional
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 
-from app.core.config import SECRET_KEY, ALGORITHM
+from app.core.cache import CacheTTL
+from app.core.config import SECRET_KEY, ALGORITHM, PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX, JWT_CLAIMS_PRINCIPAL
 from app.database.session import get_db
 from app.users.models import Usuario
-from sqlalchemy.orm import joinedload
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+
+class _Asignacion(NamedTuple):
+    """Reemplaza a user.admin_microempresa / user.vendedor: solo expone id_microempresa."""
+    id_microempresa: Optional[int]
+
+
+class Principal:
+    """
+    Usuario autenticado que devuelve get_current_user.
+
+    No está ligado a ninguna sesión: se guarda en cache entre requests. Conserva la forma
+    que usan los routers (user.id_usuario, user.admin_microempresa.id_microempresa,
+    user.vendedor, ...) y además trae rol e id_microempresa ya resueltos.
+    """
+    __slots__ = ("id_usuario", "nombre", "email", "estado", "rol", "id_microempresa")
+
+    def __init__(self, id_usuario: int, nombre: str, email: str, estado: bool, rol: str, id_microempresa: int = None):
+        self.id_usuario = id_usuario
+        self.nombre = nombre
+        self.email = email
+        self.estado = estado
+        self.rol = rol
+        self.id_microempresa = id_microempresa
+
+    @property
+    def super_admin(self):
+        return True if self.rol == "superadmin" else None
+
+    @property
+    def admin_microempresa(self):
+        return _Asignacion(self.id_microempresa) if self.rol == "adminmicroempresa" else None
+
+    @property
+    def vendedor(self):
+        return _Asignacion(self.id_microempresa) if self.rol == "vendedor" else None
+
+    def a_claims(self) -> dict:
+        return {
+            "rol": self.rol,
+            "id_microempresa": self.id_microempresa,
+            "nombre": self.nombre,
+            "email": self.email,
+            "estado": self.estado,
+        }
+
+    @classmethod
+    def desde_claims(cls, payload: dict):
+        return cls(
+            id_usuario=int(payload["sub"]),
+            nombre=payload.get("nombre"),
+            email=payload.get("email"),
+            estado=payload.get("estado", True),
+            rol=payload["rol"],
+            id_microempresa=payload.get("id_microempresa"),
+        )
+
+
+cache_principal = CacheTTL(max_items=PRINCIPAL_CACHE_MAX, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def cargar_principal(db: Session, id_usuario: int):
+    """Resuelve usuario, rol e id_microempresa en una sola consulta (directorio de usuarios)."""
+    from app.users.service import consulta_directorio_usuarios
+    fila = db.execute(consulta_directorio_usuarios().where(Usuario.id_usuario == id_usuario)).first()
+    if fila is None:
+        return None
+    return Principal(**fila._mapping)
+
+
+def invalidar_principal(id_usuario: int):
+    """Llamar después del commit que cambia un usuario o sus roles (admin, vendedor, superadmin)."""
+    cache_principal.invalidar(int(id_usuario))
+
+
 def get_user_role(user, db: Session):
     """Devuelve el rol principal del usuario: 'superadmin', 'adminmicroempresa', 'vendedor' o 'usuario'"""
+    if isinstance(user, Principal):
+        return user.rol
     # SuperAdmin
     if hasattr(user, 'super_admin') and user.super_admin:
         return 'superadmin'
@@ -25,28 +102,57 @@ def get_user_role(user, db: Session):
     return 'usuario'
 
 
+def verificar_microempresa(user, id_microempresa: int):
+    """Superadmin, o admin/vendedor de la microempresa; si no, 403."""
+    if getattr(user, "super_admin", None):
+        return
+    if hasattr(user, "admin_microempresa") and user.admin_microempresa:
+        propia = user.admin_microempresa.id_microempresa
+    elif hasattr(user, "vendedor") and user.vendedor:
+        propia = user.vendedor.id_microempresa
+    else:
+        propia = None
+    if propia is None or propia != id_microempresa:
+        raise HTTPException(status_code=403, detail="No autorizado para esta microempresa")
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
+    return principal_desde_token(token, db)
+
+
+def solo_superadmin(user=Depends(get_current_user)):
+    """Dependencia de los endpoints operativos (métricas de pool, colas, caches): 403 si no es superadmin."""
+    if get_user_role(user, None) != "superadmin":
+        raise HTTPException(status_code=403, detail="Solo superadmins pueden ver esta información")
+    return user
+
+
+def principal_desde_token(token: str, db: Session):
+    """Valida el JWT y devuelve el Principal (401 si no es válido). Lo usan get_current_user y el stream de notificaciones."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401)
-    except JWTError:
+        user_id = int(user_id)
+    except (JWTError, ValueError):
         raise HTTPException(status_code=401)
 
-    user = (
-        db.query(Usuario)
-        .options(
-            joinedload(Usuario.admin_microempresa),
-            joinedload(Usuario.vendedor)
-        )
-        .filter(Usuario.id_usuario == user_id)
-        .first()
-    )
-    if not user:
-        raise HTTPException(status_code=401)
+    user = cache_principal.obtener(user_id)
+    if user is None:
+        version = cache_principal.version(user_id)
+        user = cargar_principal(db, user_id)
+        if not user:
+            raise HTTPException(status_code=401)
+        cache_principal.guardar(user_id, user, version)
+
+    # Token con claims de rol (JWT_CLAIMS_PRINCIPAL): solo vale mientras coincidan con el usuario
+    # actual; si lo dieron de baja, lo desactivaron o le cambiaron el rol, debe volver a iniciar sesión
+    if JWT_CLAIMS_PRINCIPAL and "rol" in payload:
+        if Principal.desde_claims(payload).a_claims() != user.a_claims():
+            raise HTTPException(status_code=401)
 
     return user
@@ -0,0 +1,147 @@
+"""
+Archivos estáticos de /public.
+
+- Los archivos con nombre por contenido (imágenes con hash, en `carpetas_inmutables`) nunca
+  cambian: Cache-Control inmutable por ESTATICOS_MAX_AGE_INMUTABLE segundos y ETag fuerte
+  con el hash del nombre. El resto se revalida (ESTATICOS_MAX_AGE) con ETag / Last-Modified.
+- Para tipos comprimibles (CSS, JS, SVG, JSON, texto) se sirve el hermano precomprimido
+  `.br` o `.gz` si existe y el cliente lo acepta, con Vary: Accept-Encoding.
+- Range (206) lo resuelve FileResponse.
+- Los archivos chicos (ESTATICOS_CACHE_ARCHIVO_MAX) se guardan en un LRU en memoria; la
+  clave incluye mtime y tamaño, así que un archivo reemplazado se vuelve a leer.
+"""
+import os
+import re
+import stat
+from mimetypes import guess_type
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+from app.core.cache import CacheTTL
+from app.core.config import (
+    ESTATICOS_MAX_AGE,
+    ESTATICOS_MAX_AGE_INMUTABLE,
+    ESTATICOS_CACHE_MAX,
+    ESTATICOS_CACHE_ARCHIVO_MAX,
+    ESTATICOS_CACHE_TTL,
+)
+
+_NOMBRE_CON_HASH = re.compile(r"^[0-9a-f]{32}(_[a-z]+)?$")
+_TIPOS_COMPRIMIBLES = ("application/javascript", "application/json", "application/xml", "image/svg+xml")
+_PRECOMPRIMIDOS = (("br", ".br"), ("gzip", ".gz"))
+
+# (ruta, mtime_ns, tamaño) -> bytes
+cache_estaticos = CacheTTL(max_items=max(ESTATICOS_CACHE_MAX, 1), ttl=ESTATICOS_CACHE_TTL)
+
+
+def _comprimible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in _TIPOS_COMPRIMIBLES
+
+
+def _codificaciones_aceptadas(request_headers: Headers) -> set:
+    aceptadas = set()
+    for parte in request_headers.get("accept-encoding", "").split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if parametros.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+class ArchivosEstaticos(StaticFiles):
+    def __init__(self, *args, carpetas_inmutables=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.carpetas_inmutables = tuple(
+            os.path.realpath(os.path.join(str(self.directory), carpeta)) + os.sep
+            for carpeta in carpetas_inmutables
+        )
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            try:
+                respuesta = await anyio.to_thread.run_sync(self._respuesta_archivo, path, scope)
+            except (OSError, ValueError):
+                respuesta = None  # StaticFiles repite la búsqueda y responde el error
+            if respuesta is not None:
+                return respuesta
+        return await super().get_response(path, scope)
+
+    def _respuesta_archivo(self, path: str, scope):
+        """
+        lookup_path, los stat() de los precomprimidos y la lectura al LRU en un solo paso por el
+        hilo (dos saltos costaban más que el 304 de StaticFiles). None si no es un archivo regular.
+        """
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        return self.file_response(full_path, stat_result, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type = guess_type(str(full_path))[0] or "application/octet-stream"
+        ruta, stat_ruta, codificacion = str(full_path), stat_result, None
+        headers = {}
+        if _comprimible(media_type):
+            headers["Vary"] = "Accept-Encoding"
+            ruta, stat_ruta, codificacion = self._precomprimido(ruta, stat_result, request_headers)
+            if codificacion:
+                headers["Content-Encoding"] = codificacion
+
+        nombre = self._nombre_con_hash(str(full_path))
+        if nombre:
+            headers["Cache-Control"] = f"public, max-age={ESTATICOS_MAX_AGE_INMUTABLE}, immutable"
+            headers["ETag"] = f'"{nombre}-{codificacion}"' if codificacion else f'"{nombre}"'
+        else:
+            headers["Cache-Control"] = f"public, max-age={ESTATICOS_MAX_AGE}, must-revalidate"
+
+        respuesta = FileResponse(ruta, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_ruta)
+        if self.is_not_modified(respuesta.headers, request_headers):
+            return NotModifiedResponse(respuesta.headers)
+
+        if (
+            ESTATICOS_CACHE_MAX
+            and status_code == 200
+            and scope["method"] == "GET"
+            and "range" not in request_headers
+            and stat_ruta.st_size <= ESTATICOS_CACHE_ARCHIVO_MAX
+        ):
+            return Response(self._leer(ruta, stat_ruta), status_code=status_code, headers=dict(respuesta.headers))
+        return respuesta
+
+    # ------------------- INTERNOS -------------------
+    def _nombre_con_hash(self, full_path: str):
+        # lookup_path ya devuelve la ruta resuelta (realpath)
+        if not self.carpetas_inmutables or not full_path.startswith(self.carpetas_inmutables):
+            return None
+        nombre = os.path.splitext(os.path.basename(full_path))[0]
+        return nombre if _NOMBRE_CON_HASH.match(nombre) else None
+
+    def _precomprimido(self, ruta: str, stat_result, request_headers: Headers):
+        aceptadas = _codificaciones_aceptadas(request_headers)
+        for codificacion, sufijo in _PRECOMPRIMIDOS:
+            if codificacion not in aceptadas:
+                continue
+            try:
+                stat_variante = os.stat(ruta + sufijo)
+            except OSError:
+                continue
+            # Un .br/.gz más viejo que el original quedó desactualizado
+            if stat.S_ISREG(stat_variante.st_mode) and stat_variante.st_mtime >= stat_result.st_mtime:
+                return ruta + sufijo, stat_variante, codificacion
+        return ruta, stat_result, None
+
+    def _leer(self, ruta: str, stat_result) -> bytes:
+        clave = (ruta, stat_result.st_mtime_ns, stat_result.st_size)
+        contenido = cache_estaticos.obtener(clave)
+        if contenido is None:
+            with open(ruta, "rb") as archivo:
+                contenido = archivo.read()
+            cache_estaticos.guardar(clave, contenido)
+        return contenido
+
+
+def obtener_metricas_estaticos() -> dict:
+    return cache_estaticos.metricas()
@@ -0,0 +1,86 @@
+"""
+Exportación en streaming (NDJSON / CSV) para listados grandes.
+
+La consulta se ejecuta con yield_per (cursor del lado del servidor en PostgreSQL) en una
+sesión propia del generador: la sesión de get_db se cierra antes de que StreamingResponse
+termine de enviar el cuerpo. Las filas se serializan y se envían por bloques, así que la
+memoria no depende del tamaño del historial.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.config import EXPORTACION_TAM_LOTE
+
+FORMATOS_EXPORTACION = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Bytes acumulados antes de enviar un bloque al cliente
+_TAM_BLOQUE = 64 * 1024
+
+
+def _valor(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+def filas_en_streaming(consulta, tam_lote: int = EXPORTACION_TAM_LOTE):
+    """Itera las filas de un select() en lotes de tam_lote, con su propia sesión."""
+    from app.database.session import SessionLocal
+    db = SessionLocal()
+    try:
+        resultado = db.execute(consulta.execution_options(yield_per=tam_lote))
+        for fila in resultado:
+            yield fila
+    finally:
+        db.close()
+
+
+def _ndjson(filas, columnas):
+    bloque = []
+    tam = 0
+    for fila in filas:
+        linea = json.dumps({c: _valor(v) for c, v in zip(columnas, fila)}, ensure_ascii=False) + "\n"
+        bloque.append(linea)
+        tam += len(linea)
+        if tam >= _TAM_BLOQUE:
+            yield "".join(bloque).encode("utf-8")
+            bloque, tam = [], 0
+    if bloque:
+        yield "".join(bloque).encode("utf-8")
+
+
+def _csv(filas, columnas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow([_valor(v) for v in fila])
+        if buffer.tell() >= _TAM_BLOQUE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def respuesta_exportacion(consulta, columnas, formato: str, nombre_archivo: str):
+    """StreamingResponse NDJSON o CSV para las filas de `consulta` (un select de columnas)."""
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado. Use: {', '.join(FORMATOS_EXPORTACION)}")
+    serializar = _ndjson if formato == "ndjson" else _csv
+    return StreamingResponse(
+        serializar(filas_en_streaming(consulta), columnas),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre_archivo}.{formato}"'},
+    )
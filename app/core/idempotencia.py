@@ -0,0 +1,307 @@
+"""
+Idempotency-Key para los endpoints de cobro (checkout, venta presencial, pago).
+
+El cliente envía una cabecera Idempotency-Key única por intento lógico. La primera
+solicitud se ejecuta y su respuesta queda guardada (tabla idempotencia + cache en memoria
+con TTL); los reintentos con la misma clave reciben esa misma respuesta, con la cabecera
+Idempotent-Replayed: true, sin volver a ejecutar nada.
+
+- Un duplicado concurrente espera el resultado de la solicitud en curso: con un Event si
+  está en el mismo proceso, consultando la fila EN_CURSO si está en otro.
+- La clave es propia de quien la envía (alcance: el usuario del token, o "anonimo" en el
+  checkout sin sesión): otro usuario con la misma clave y el mismo cuerpo no recibe la
+  respuesta guardada, sino que ejecuta su propia solicitud.
+- La clave se asocia a la huella (alcance, método, ruta y cuerpo): reutilizarla con otro
+  cuerpo responde 422.
+- Con `db` (la sesión del endpoint), el primer commit de la operación marca la clave como
+  EJECUTADA en la misma transacción. Desde ahí la clave no se libera nunca: si el proceso cae
+  antes de guardar la respuesta, o la respuesta no se puede serializar, los reintentos reciben
+  409 en vez de crear otra venta.
+- Si la solicitud original falla antes de confirmar nada, la clave se libera y un reintento la
+  vuelve a ejecutar. Una clave EN_CURSO cuyo dueño cayó sin confirmar se recupera pasados
+  IDEMPOTENCIA_ARRENDAMIENTO segundos; la fecha de reserva funciona como testigo, así que si el
+  dueño original siguiera vivo, su commit falla en vez de duplicar la operación.
+- Sin cabecera, el endpoint se comporta como siempre.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Request, Response
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from pydantic import TypeAdapter
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, UniqueConstraint, Index, delete, event, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.cache import CacheTTL
+from app.core.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    IDEMPOTENCIA_CACHE_TTL,
+    IDEMPOTENCIA_CACHE_MAX,
+    IDEMPOTENCIA_VIGENCIA_HORAS,
+    IDEMPOTENCIA_ESPERA_MAX,
+    IDEMPOTENCIA_ARRENDAMIENTO,
+)
+from app.database.base import Base
+
+CABECERA_REPETIDA = "Idempotent-Replayed"
+
+
+class SolicitudIdempotente(Base):
+    __tablename__ = "idempotencia"
+    __table_args__ = (
+        UniqueConstraint('alcance', 'ruta', 'clave', name='uq_idempotencia_alcance_ruta_clave'),
+        Index('ix_idempotencia_expiracion', 'fecha_expiracion'),
+    )
+    id_idempotencia = Column(Integer, primary_key=True, index=True)
+    alcance = Column(String(50), nullable=False)  # usuario:<id_usuario> o anonimo
+    clave = Column(String(100), nullable=False)
+    ruta = Column(String(200), nullable=False)
+    huella = Column(String(64), nullable=False)
+    estado = Column(String(20), nullable=False)  # EN_CURSO, EJECUTADA (confirmada, sin respuesta guardada), COMPLETADA
+    codigo_estado = Column(Integer)
+    respuesta = Column(Text)
+    fecha_creacion = Column(TIMESTAMP, nullable=False)
+    fecha_expiracion = Column(TIMESTAMP, nullable=False)
+
+
+# (alcance, ruta, clave) -> (huella, codigo_estado, cuerpo)
+cache_idempotencia = CacheTTL(max_items=IDEMPOTENCIA_CACHE_MAX, ttl=IDEMPOTENCIA_CACHE_TTL)
+
+_en_curso = {}
+_lock_en_curso = threading.Lock()
+
+
+def _responder(codigo_estado: int, cuerpo: bytes, repetida: bool) -> Response:
+    headers = {CABECERA_REPETIDA: "true"} if repetida else None
+    return Response(content=cuerpo, status_code=codigo_estado, media_type="application/json", headers=headers)
+
+
+class ContextoIdempotencia:
+    def __init__(self, clave: Optional[str], ruta: str, huella: str, alcance: str = "anonimo"):
+        self.clave = clave
+        self.ruta = ruta
+        self.huella = huella
+        self.alcance = alcance
+        self.llave = (alcance, ruta, clave)
+        self._reserva = None  # fecha_creacion de nuestra fila EN_CURSO (testigo de la reserva)
+        self._ejecutada = False
+
+    def ejecutar(self, funcion, modelo_respuesta, codigo_estado: int = 200, db=None):
+        """
+        Ejecuta `funcion` una sola vez por clave y devuelve su respuesta (o la guardada). `db` es
+        la sesión con la que `funcion` confirma la operación.
+        """
+        if not self.clave:
+            return funcion()
+        llave = self.llave
+
+        # 1. Ya respondida y en cache
+        guardada = self._desde_cache(llave)
+        if guardada is not None:
+            return guardada
+
+        # 2. En curso en este proceso: esperar su resultado
+        with _lock_en_curso:
+            evento = _en_curso.get(llave)
+            propietario = evento is None
+            if propietario:
+                evento = _en_curso[llave] = threading.Event()
+        if not propietario:
+            if not evento.wait(IDEMPOTENCIA_ESPERA_MAX):
+                raise HTTPException(status_code=409, detail="Hay una solicitud con la misma Idempotency-Key en curso")
+            guardada = self._desde_cache(llave)
+            if guardada is not None:
+                return guardada
+            # La original falló sin guardar nada: se ejecuta como una nueva
+            return self.ejecutar(funcion, modelo_respuesta, codigo_estado, db)
+
+        try:
+            # 3. Reservar la clave en la BD (otro proceso pudo haberla tomado o completado)
+            guardada = self._reservar()
+            if guardada is not None:
+                return guardada
+            if db is not None:
+                event.listen(db, "before_commit", self._marcar_ejecutada)
+            try:
+                resultado = funcion()
+            except BaseException:
+                if not self._ejecutada:
+                    if db is not None:
+                        db.rollback()  # Descarta lo que quedó sin confirmar antes de liberar la clave
+                    self._liberar()
+                raise
+            finally:
+                if db is not None:
+                    event.remove(db, "before_commit", self._marcar_ejecutada)
+            # funcion() terminó: la operación ya está hecha y la clave no se vuelve a liberar
+            try:
+                adaptador = TypeAdapter(modelo_respuesta)
+                cuerpo = adaptador.dump_json(adaptador.validate_python(resultado, from_attributes=True))
+            except BaseException:
+                self._completar(None, None)
+                raise
+            self._completar(codigo_estado, cuerpo)
+            cache_idempotencia.guardar(llave, (self.huella, codigo_estado, cuerpo))
+            return _responder(codigo_estado, cuerpo, repetida=False)
+        finally:
+            with _lock_en_curso:
+                _en_curso.pop(llave, None)
+            evento.set()
+
+    # ------------------- INTERNOS -------------------
+    def _desde_cache(self, llave):
+        guardada = cache_idempotencia.obtener(llave)
+        if guardada is None:
+            return None
+        huella, codigo_estado, cuerpo = guardada
+        self._verificar_huella(huella)
+        return _responder(codigo_estado, cuerpo, repetida=True)
+
+    def _verificar_huella(self, huella: str):
+        if huella != self.huella:
+            raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otra solicitud")
+
+    def _reservar(self):
+        """Inserta la fila EN_CURSO; si ya existe, devuelve la respuesta guardada o espera a que termine."""
+        from app.database.session import SessionLocal
+        limite = time.monotonic() + IDEMPOTENCIA_ESPERA_MAX
+        while True:
+            db = SessionLocal()
+            try:
+                ahora = datetime.now()
+                self._reserva = ahora
+                db.add(SolicitudIdempotente(
+                    alcance=self.alcance,
+                    clave=self.clave,
+                    ruta=self.ruta,
+                    huella=self.huella,
+                    estado="EN_CURSO",
+                    fecha_creacion=ahora,
+                    fecha_expiracion=ahora + timedelta(hours=IDEMPOTENCIA_VIGENCIA_HORAS),
+                ))
+                try:
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+                fila = db.query(SolicitudIdempotente).filter_by(alcance=self.alcance, ruta=self.ruta, clave=self.clave).first()
+                if fila is None:
+                    continue
+                if fila.fecha_expiracion < ahora:
+                    # Vencida: se libera y la clave vuelve a estar disponible
+                    db.delete(fila)
+                    db.commit()
+                    continue
+                self._verificar_huella(fila.huella)
+                if fila.estado == "COMPLETADA":
+                    cuerpo = fila.respuesta.encode("utf-8")
+                    cache_idempotencia.guardar(self.llave, (fila.huella, fila.codigo_estado, cuerpo))
+                    return _responder(fila.codigo_estado, cuerpo, repetida=True)
+                vencido = fila.fecha_creacion < ahora - timedelta(seconds=IDEMPOTENCIA_ARRENDAMIENTO)
+                if vencido and fila.estado == "EJECUTADA":
+                    raise HTTPException(status_code=409, detail="La solicitud con esta Idempotency-Key ya se ejecutó y su respuesta no está disponible")
+                if vencido:
+                    # EN_CURSO de un proceso que cayó sin confirmar: se toma si nadie la tomó antes
+                    tomada = db.query(SolicitudIdempotente).filter_by(
+                        id_idempotencia=fila.id_idempotencia, estado="EN_CURSO", fecha_creacion=fila.fecha_creacion,
+                    ).update({"fecha_creacion": ahora, "fecha_expiracion": ahora + timedelta(hours=IDEMPOTENCIA_VIGENCIA_HORAS)})
+                    db.commit()
+                    if tomada:
+                        self._reserva = ahora
+                        return None
+                    continue
+            finally:
+                db.close()
+            # EN_CURSO o EJECUTADA en otro proceso
+            if time.monotonic() >= limite:
+                raise HTTPException(status_code=409, detail="Hay una solicitud con la misma Idempotency-Key en curso")
+            time.sleep(0.1)
+
+    def _filtro_reserva(self):
+        return (
+            SolicitudIdempotente.alcance == self.alcance,
+            SolicitudIdempotente.ruta == self.ruta,
+            SolicitudIdempotente.clave == self.clave,
+            SolicitudIdempotente.fecha_creacion == self._reserva,
+        )
+
+    def _marcar_ejecutada(self, db):
+        """before_commit de la sesión del endpoint: la clave pasa a EJECUTADA en la misma transacción."""
+        if self._ejecutada:
+            return
+        marcadas = db.execute(
+            update(SolicitudIdempotente)
+            .where(*self._filtro_reserva(), SolicitudIdempotente.estado == "EN_CURSO")
+            .values(estado="EJECUTADA")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not marcadas:
+            # Otro proceso recuperó la clave por arrendamiento vencido: no se confirma la operación
+            raise HTTPException(status_code=409, detail="La Idempotency-Key fue tomada por otra solicitud")
+        self._ejecutada = True
+
+    def _completar(self, codigo_estado: Optional[int], cuerpo: Optional[bytes]):
+        """Guarda la respuesta (COMPLETADA) o, sin cuerpo, deja la clave EJECUTADA para que no se reutilice."""
+        from app.database.session import SessionLocal
+        valores = {"estado": "EJECUTADA"} if cuerpo is None else {
+            "estado": "COMPLETADA",
+            "codigo_estado": codigo_estado,
+            "respuesta": cuerpo.decode("utf-8"),
+        }
+        db = SessionLocal()
+        try:
+            db.execute(update(SolicitudIdempotente).where(*self._filtro_reserva()).values(**valores))
+            db.commit()
+        finally:
+            db.close()
+
+    def _liberar(self):
+        from app.database.session import SessionLocal
+        db = SessionLocal()
+        try:
+            db.execute(delete(SolicitudIdempotente).where(*self._filtro_reserva(), SolicitudIdempotente.estado == "EN_CURSO"))
+            db.commit()
+        finally:
+            db.close()
+
+
+_token_opcional = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
+
+
+def alcance_de_token(token: Optional[str]) -> str:
+    """Dueño de las claves: el usuario del JWT o "anonimo" (checkout sin sesión o token inválido)."""
+    if token:
+        try:
+            id_usuario = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            id_usuario = None
+        if id_usuario is not None:
+            return f"usuario:{id_usuario}"
+    return "anonimo"
+
+
+async def contexto_idempotencia(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    token: Optional[str] = Depends(_token_opcional),
+) -> ContextoIdempotencia:
+    """Dependencia de los endpoints idempotentes: lee la clave, su alcance y calcula la huella de la solicitud."""
+    ruta = f"{request.method} {request.url.path}"
+    alcance = alcance_de_token(token)
+    huella = ""
+    if idempotency_key:
+        cuerpo = await request.body()
+        huella = hashlib.sha256(alcance.encode() + b"\n" + ruta.encode() + b"\n" + cuerpo).hexdigest()
+    return ContextoIdempotencia(idempotency_key, ruta, huella, alcance)
+
+
+def purgar_claves_vencidas(db) -> int:
+    """Borra las claves vencidas (IDEMPOTENCIA_VIGENCIA_HORAS). Devuelve cuántas borró."""
+    resultado = db.execute(delete(SolicitudIdempotente).where(SolicitudIdempotente.fecha_expiracion < datetime.now()))
+    db.commit()
+    return resultado.rowcount
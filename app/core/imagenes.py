@@ -0,0 +1,180 @@
+"""
+Imágenes subidas (productos, logos): almacenamiento por contenido y variantes redimensionadas.
+
+- guardar_imagen copia el upload a disco por bloques (IMAGENES_TAM_BLOQUE) mientras calcula
+  su SHA-256, sin cargarlo completo en memoria. El tipo se valida por los primeros bytes, no
+  por la extensión. El nombre final es el hash: si ya existía, se reutiliza el archivo.
+- programar_variantes genera en un pool de hilos las variantes (miniatura, tarjeta, completa)
+  en IMAGENES_FORMATO y después llama a `al_terminar(rutas)`. Las variantes también llevan el
+  hash en el nombre, así que una imagen repetida no se vuelve a procesar.
+- Pillow es opcional y se importa bajo demanda: sin Pillow se conserva solo el original.
+
+Como los nombres cambian cuando cambia el contenido, los archivos de IMAGENES_CARPETA se
+sirven con cache inmutable (ver app/core/estaticos.py).
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import (
+    IMAGENES_CARPETA,
+    IMAGENES_MAX_BYTES,
+    IMAGENES_TAM_BLOQUE,
+    IMAGENES_WORKERS,
+    IMAGENES_FORMATO,
+    IMAGENES_CALIDAD,
+)
+
+# nombre -> lado máximo en píxeles
+VARIANTES = {"miniatura": 160, "tarjeta": 480, "completa": 1280}
+
+_FIRMAS = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+class ImagenGuardada(NamedTuple):
+    hash: str
+    ruta: str  # relativa al directorio de trabajo: public/imagenes/ab/<hash>.jpg
+    nueva: bool  # False si el mismo contenido ya estaba guardado
+
+
+def _extension(cabecera: bytes):
+    for firma, extension in _FIRMAS:
+        if cabecera.startswith(firma):
+            return extension
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return ".webp"
+    if cabecera[4:8] == b"ftyp" and cabecera[8:12] in (b"avif", b"avis"):
+        return ".avif"
+    return None
+
+
+def _carpeta(hash_imagen: str) -> str:
+    # Dos niveles para no acumular miles de archivos en un solo directorio
+    return os.path.join(IMAGENES_CARPETA, hash_imagen[:2])
+
+
+def url_publica(ruta: str) -> str:
+    """public/imagenes/... -> /public/imagenes/... (lo que guarda el producto)."""
+    return "/" + ruta.replace("\\", "/").lstrip("/")
+
+
+def guardar_imagen(archivo: UploadFile, max_bytes: int = IMAGENES_MAX_BYTES) -> ImagenGuardada:
+    """Guarda el upload por bloques con nombre = SHA-256 del contenido. 400 si no es una imagen, 413 si excede max_bytes."""
+    os.makedirs(IMAGENES_CARPETA, exist_ok=True)
+    digest = hashlib.sha256()
+    total = 0
+    descriptor, temporal = tempfile.mkstemp(dir=IMAGENES_CARPETA, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            archivo.file.seek(0)
+            cabecera = archivo.file.read(IMAGENES_TAM_BLOQUE)
+            extension = _extension(cabecera)
+            if extension is None:
+                raise HTTPException(status_code=400, detail="Solo se permiten imágenes JPEG, PNG, GIF, WebP o AVIF")
+            bloque = cabecera
+            while bloque:
+                total += len(bloque)
+                if total > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"La imagen supera el máximo de {max_bytes // (1024 * 1024)} MB")
+                digest.update(bloque)
+                destino.write(bloque)
+                bloque = archivo.file.read(IMAGENES_TAM_BLOQUE)
+        hash_imagen = digest.hexdigest()[:32]
+        os.makedirs(_carpeta(hash_imagen), exist_ok=True)
+        ruta = os.path.join(_carpeta(hash_imagen), hash_imagen + extension)
+        if os.path.exists(ruta):
+            os.remove(temporal)
+            return ImagenGuardada(hash_imagen, ruta.replace("\\", "/"), False)
+        os.replace(temporal, ruta)
+        return ImagenGuardada(hash_imagen, ruta.replace("\\", "/"), True)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+# ------------------- VARIANTES -------------------
+
+def rutas_variantes(hash_imagen: str, variantes=tuple(VARIANTES)) -> dict:
+    extension = ".jpg" if IMAGENES_FORMATO == "jpeg" else "." + IMAGENES_FORMATO
+    return {
+        nombre: os.path.join(_carpeta(hash_imagen), f"{hash_imagen}_{nombre}{extension}").replace("\\", "/")
+        for nombre in variantes
+    }
+
+
+def generar_variantes(imagen: ImagenGuardada, variantes=tuple(VARIANTES)) -> dict:
+    """
+    Genera (o reutiliza) las variantes y devuelve {nombre: ruta}. Si Pillow no está instalado
+    o la imagen no se puede decodificar, devuelve {} y se sigue usando el original.
+    """
+    rutas = rutas_variantes(imagen.hash, variantes)
+    pendientes = {nombre: ruta for nombre, ruta in rutas.items() if not os.path.exists(ruta)}
+    if not pendientes:
+        return rutas
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("[Imágenes] Pillow no está instalado; se conserva solo el original")
+        return {}
+    try:
+        with Image.open(imagen.ruta) as original:
+            original = ImageOps.exif_transpose(original)
+            if IMAGENES_FORMATO == "jpeg" and original.mode not in ("RGB", "L"):
+                original = original.convert("RGB")
+            elif original.mode not in ("RGB", "RGBA", "L"):
+                original = original.convert("RGBA")
+            for nombre, ruta in pendientes.items():
+                lado = VARIANTES[nombre]
+                copia = original.copy()
+                copia.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+                temporal = ruta + ".tmp"
+                copia.save(temporal, format=IMAGENES_FORMATO.upper(), quality=IMAGENES_CALIDAD, optimize=True)
+                os.replace(temporal, ruta)
+    except Exception as e:
+        print(f"[Imágenes] No se pudieron generar las variantes de {imagen.ruta}: {e}")
+        return {}
+    return rutas
+
+
+_pool = None
+
+
+def _obtener_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=IMAGENES_WORKERS, thread_name_prefix="imagenes")
+    return _pool
+
+
+def programar_variantes(imagen: ImagenGuardada, al_terminar, variantes=tuple(VARIANTES)):
+    """
+    Genera las variantes en segundo plano y llama a `al_terminar({nombre: ruta})` desde el
+    worker (solo si se generaron). `al_terminar` debe abrir su propia sesión de BD.
+    """
+    def tarea():
+        rutas = generar_variantes(imagen, variantes)
+        if rutas:
+            try:
+                al_terminar(rutas)
+            except Exception as e:
+                print(f"[Imágenes] Error al registrar las variantes de {imagen.ruta}: {e}")
+
+    return _obtener_pool().submit(tarea)
+
+
+def detener_pool():
+    """Espera las variantes en curso (shutdown de la app)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -0,0 +1,133 @@
+"""
+Lectura de archivos de carga masiva (CSV, JSON, NDJSON, XLSX) como filas dict.
+
+Contraparte de app.core.exportacion: CSV y NDJSON se leen línea a línea desde el archivo
+temporal de UploadFile, sin cargar todo el contenido en memoria; JSON se parsea completo.
+XLSX usa openpyxl en modo solo lectura; es opcional y se importa bajo demanda.
+Las claves se normalizan (minúsculas, sin espacios alrededor) y las celdas vacías se
+descartan, para que el modelo de validación aplique sus valores por defecto.
+"""
+import codecs
+import csv
+import json
+import os
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+
+from app.core.config import IMPORTACION_MAX_FILAS
+
+FORMATOS_IMPORTACION = ("csv", "json", "ndjson", "xlsx")
+
+_TIPOS_CONTENIDO = {
+    "text/csv": "csv",
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+
+
+def formato_archivo(archivo: UploadFile, formato: str = None) -> str:
+    """Formato explícito, o el de la extensión / content-type del archivo."""
+    if not formato:
+        extension = os.path.splitext(archivo.filename or "")[1].lstrip(".").lower()
+        tipo = (archivo.content_type or "").split(";")[0].strip()
+        formato = extension if extension in FORMATOS_IMPORTACION else _TIPOS_CONTENIDO.get(tipo)
+    if formato not in FORMATOS_IMPORTACION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no soportado. Use uno de: {', '.join(FORMATOS_IMPORTACION)}"
+        )
+    return formato
+
+
+def _limpiar(fila: dict) -> dict:
+    limpia = {}
+    for clave, valor in fila.items():
+        if clave is None:
+            continue
+        if isinstance(valor, str):
+            valor = valor.strip()
+        if valor not in ("", None):
+            limpia[str(clave).strip().lower()] = valor
+    return limpia
+
+
+def _filas_csv(archivo):
+    # El separador (coma, punto y coma o tabulador) se deduce del encabezado
+    encabezado = archivo.file.readline(4096).decode("utf-8-sig", errors="ignore")
+    archivo.file.seek(0)
+    try:
+        delimitador = csv.Sniffer().sniff(encabezado, ",;\t").delimiter
+    except csv.Error:
+        delimitador = ","
+    lector = csv.DictReader(codecs.getreader("utf-8-sig")(archivo.file), delimiter=delimitador)
+    for fila in lector:
+        yield lector.line_num, fila
+
+
+def _filas_ndjson(archivo):
+    for numero, linea in enumerate(codecs.getreader("utf-8-sig")(archivo.file), start=1):
+        if linea.strip():
+            yield numero, json.loads(linea)
+
+
+def _filas_json(archivo, clave_lista: str = None):
+    datos = json.load(codecs.getreader("utf-8-sig")(archivo.file))
+    if isinstance(datos, dict) and clave_lista:
+        datos = datos.get(clave_lista)
+    if not isinstance(datos, list):
+        raise ValueError("se esperaba una lista de filas" + (f" (o un objeto con '{clave_lista}')" if clave_lista else ""))
+    yield from enumerate(datos, start=1)
+
+
+def _filas_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise HTTPException(status_code=400, detail="La importación XLSX requiere openpyxl; use CSV o NDJSON")
+    try:
+        libro = load_workbook(archivo.file, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"no es un XLSX válido ({e})")
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else None for c in next(filas, ())]
+        for numero, valores in enumerate(filas, start=2):
+            if any(v is not None for v in valores):
+                yield numero, dict(zip(encabezado, valores))
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo: UploadFile, formato: str = None, clave_lista: str = None, max_filas: int = IMPORTACION_MAX_FILAS):
+    """
+    Itera (número de línea o posición, fila) del archivo. 400 si el archivo no se puede leer,
+    413 si supera max_filas.
+    """
+    formato = formato_archivo(archivo, formato)
+    if formato == "csv":
+        filas = _filas_csv(archivo)
+    elif formato == "ndjson":
+        filas = _filas_ndjson(archivo)
+    elif formato == "xlsx":
+        filas = _filas_xlsx(archivo)
+    else:
+        filas = _filas_json(archivo, clave_lista)
+    try:
+        for leidas, (numero, fila) in enumerate(filas, start=1):
+            if max_filas and leidas > max_filas:
+                raise HTTPException(status_code=413, detail=f"El archivo supera el máximo de {max_filas} filas")
+            if not isinstance(fila, dict):
+                raise ValueError(f"la fila {numero} no es un objeto")
+            yield numero, _limpiar(fila)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Archivo inválido: {e}")
+
+
+def describir_error(error: ValidationError) -> str:
+    """Mensaje de una línea para el reporte de errores por fila."""
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc']))}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()
+    )
@@ -0,0 +1,115 @@
+"""
+Paginación por cursor (keyset) compartida por los listados.
+
+El cursor codifica (fecha, id) del último elemento devuelto. La página siguiente filtra
+(fecha, id) < cursor con ORDER BY fecha DESC, id DESC y LIMIT, de modo que el costo de una
+página no depende de su profundidad (a diferencia de OFFSET) mientras exista un índice
+que termine en (fecha, id). Las filas sin fecha también se recorren: van primero, por id.
+
+- El cuerpo sigue siendo la lista de siempre; el cursor de la página siguiente viaja en la
+  cabecera X-Next-Cursor, que no se envía en la última página.
+- La paginación es opcional: un cliente que no envía ni `cursor` ni `limit` recibe la lista
+  completa, como antes (el POS descarga así el catálogo y las no leídas). Con `cursor` y sin
+  `limit` se usa PAGINACION_LIMITE.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+
+from app.core.config import PAGINACION_LIMITE, PAGINACION_LIMITE_MAX
+
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+class Pagina(list):
+    """Lista de resultados que además lleva el cursor de la página siguiente (o None)."""
+    def __init__(self, items=(), siguiente_cursor: Optional[str] = None):
+        super().__init__(items)
+        self.siguiente_cursor = siguiente_cursor
+
+
+class ParametrosPagina(NamedTuple):
+    cursor: Optional[str]
+    limit: Optional[int]  # None = sin paginar
+
+
+def parametros_pagina(
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=PAGINACION_LIMITE_MAX, description="Sin cursor ni limit se devuelve la lista completa"),
+) -> ParametrosPagina:
+    if cursor and limit is None:
+        limit = PAGINACION_LIMITE
+    return ParametrosPagina(cursor, limit)
+
+
+def codificar_cursor(fecha, id_) -> str:
+    valor = [fecha.isoformat() if fecha is not None else None, id_]
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return (datetime.fromisoformat(fecha) if fecha else None), int(id_)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def aplicar_keyset(consulta, columna_id, columna_fecha=None, cursor: str = None, limit: int = None):
+    """
+    Agrega el filtro del cursor, ORDER BY (fecha, id) DESC y LIMIT+1 a un Query o a un select().
+
+    Las filas con fecha NULL van primero (NULLS FIRST, el orden del índice DESC en PostgreSQL;
+    SQLite también lo recorre por índice), ordenadas por id; después siguen las fechadas.
+    """
+    if columna_fecha is None:
+        if cursor:
+            consulta = consulta.filter(columna_id < decodificar_cursor(cursor)[1])
+        return _ordenar(consulta, [columna_id.desc()], limit)
+
+    if cursor:
+        fecha, id_ = decodificar_cursor(cursor)
+        if fecha is None:
+            # Resto del tramo sin fecha y, detrás, todas las fechadas
+            condicion = or_(and_(columna_fecha.is_(None), columna_id < id_), columna_fecha.isnot(None))
+        else:
+            # El `fecha <= x` redundante acota el rango del índice; el OR solo no lo usa como rango
+            condicion = and_(columna_fecha <= fecha, or_(columna_fecha < fecha, and_(columna_fecha == fecha, columna_id < id_)))
+        consulta = consulta.filter(condicion)
+    return _ordenar(consulta, [columna_fecha.desc().nulls_first(), columna_id.desc()], limit)
+
+
+def _ordenar(consulta, orden, limit: int = None):
+    consulta = consulta.order_by(None).order_by(*orden)
+    if limit:
+        # Una fila de más indica que hay página siguiente sin hacer un COUNT
+        consulta = consulta.limit(limit + 1)
+    return consulta
+
+
+def cerrar_pagina(filas, columna_id, columna_fecha=None, limit: int = None) -> Pagina:
+    if not limit or len(filas) <= limit:
+        return Pagina(filas)
+    filas = filas[:limit]
+    ultimo = filas[-1]
+    fecha = getattr(ultimo, columna_fecha.key) if columna_fecha is not None else None
+    return Pagina(filas, codificar_cursor(fecha, getattr(ultimo, columna_id.key)))
+
+
+def paginar(consulta, columna_id, columna_fecha=None, cursor: str = None, limit: int = None) -> Pagina:
+    """Ejecuta un Query con keyset y devuelve la Pagina."""
+    filas = aplicar_keyset(consulta, columna_id, columna_fecha, cursor, limit).all()
+    return cerrar_pagina(filas, columna_id, columna_fecha, limit)
+
+
+def responder_pagina(response: Response, pagina):
+    """Pone el cursor en la cabecera X-Next-Cursor y devuelve la lista para el response_model."""
+    cursor = getattr(pagina, "siguiente_cursor", None)
+    if cursor:
+        response.headers[CABECERA_CURSOR] = cursor
+    return pagina
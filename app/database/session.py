@@ -1,17 +1,313 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.core.config import DATABASE_URL
-
-engine = create_engine(
+import threading
+import time
+from collections import deque
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+from app.core.config import (
     DATABASE_URL,
-    echo=True  # 👈 muestra SQL en consola (útil para pruebas)
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_ECHO,
+    ASYNC_DATABASE_URL,
+    ROUTERS_ASYNC,
 )
 
+
+# --- MÉTRICAS DE POOL Y DE CONSULTAS POR REQUEST ---
+
+class MetricasRequest:
+    """Consultas ejecutadas por una sesión de get_db (un request)."""
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.inicio = time.perf_counter()
+
+
+class EstadisticasDB:
+    def __init__(self, historial: int = 200):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.conexiones_nuevas = 0
+        self.invalidaciones = 0
+        self.en_uso = 0
+        self.en_uso_max = 0
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.requests = 0
+        self.consultas_total = 0
+        self.consultas_max = 0
+        self.tiempo_sql_total = 0.0
+        self.ultimos_requests = deque(maxlen=historial)
+
+    def sumar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def registrar_espera(self, segundos: float):
+        with self._lock:
+            self.esperas += 1
+            self.espera_total += segundos
+            self.espera_max = max(self.espera_max, segundos)
+
+    def registrar_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.en_uso += 1
+            self.en_uso_max = max(self.en_uso_max, self.en_uso)
+
+    def registrar_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.en_uso = max(self.en_uso - 1, 0)
+
+    def registrar_request(self, metricas: MetricasRequest):
+        duracion = time.perf_counter() - metricas.inicio
+        with self._lock:
+            self.requests += 1
+            self.consultas_total += metricas.consultas
+            self.consultas_max = max(self.consultas_max, metricas.consultas)
+            self.tiempo_sql_total += metricas.tiempo_sql
+            self.ultimos_requests.append((metricas.consultas, metricas.tiempo_sql, duracion))
+
+    def resumen(self, engine=None) -> dict:
+        with self._lock:
+            ultimos = list(self.ultimos_requests)
+            datos = {
+                "pool": {
+                    "checkouts": self.checkouts,
+                    "checkins": self.checkins,
+                    "conexiones_nuevas": self.conexiones_nuevas,
+                    "invalidaciones": self.invalidaciones,
+                    "en_uso": self.en_uso,
+                    "en_uso_max": self.en_uso_max,
+                    "espera_media_ms": round(self.espera_total * 1000 / self.esperas, 3) if self.esperas else 0.0,
+                    "espera_max_ms": round(self.espera_max * 1000, 3),
+                },
+                "requests": {
+                    "total": self.requests,
+                    "consultas_total": self.consultas_total,
+                    "consultas_media": round(self.consultas_total / self.requests, 2) if self.requests else 0.0,
+                    "consultas_max": self.consultas_max,
+                    "tiempo_sql_medio_ms": round(self.tiempo_sql_total * 1000 / self.requests, 3) if self.requests else 0.0,
+                },
+            }
+        if ultimos:
+            datos["requests"]["ultimos"] = {
+                "muestras": len(ultimos),
+                "consultas_media": round(sum(u[0] for u in ultimos) / len(ultimos), 2),
+                "tiempo_sql_medio_ms": round(sum(u[1] for u in ultimos) * 1000 / len(ultimos), 3),
+                "duracion_media_ms": round(sum(u[2] for u in ultimos) * 1000 / len(ultimos), 3),
+            }
+        if engine is not None:
+            datos["pool"]["estado"] = engine.pool.status()
+        return datos
+
+
+estadisticas_db = EstadisticasDB()
+
+
+class _PoolMedido(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre."""
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            estadisticas_db.registrar_espera(time.perf_counter() - inicio)
+
+
+def _registrar_eventos(engine):
+    @event.listens_for(engine, "connect")
+    def _al_conectar(dbapi_connection, connection_record):
+        estadisticas_db.sumar("conexiones_nuevas")
+
+    @event.listens_for(engine, "checkout")
+    def _al_checkout(dbapi_connection, connection_record, connection_proxy):
+        estadisticas_db.registrar_checkout()
+
+    @event.listens_for(engine, "checkin")
+    def _al_checkin(dbapi_connection, connection_record):
+        estadisticas_db.registrar_checkin()
+        connection_record.info.pop("metricas_request", None)
+
+    @event.listens_for(engine, "invalidate")
+    def _al_invalidar(dbapi_connection, connection_record, exception):
+        estadisticas_db.sumar("invalidaciones")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    def _cerrar_consulta(conn):
+        inicio = conn.info["inicio_consulta"].pop()
+        metricas = conn.info.get("metricas_request")
+        if metricas is not None:
+            metricas.consultas += 1
+            metricas.tiempo_sql += time.perf_counter() - inicio
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues_consulta(conn, cursor, statement, parameters, context, executemany):
+        _cerrar_consulta(conn)
+
+    @event.listens_for(engine, "handle_error")
+    def _error_consulta(contexto):
+        # Una sentencia que falla no dispara after_cursor_execute: su inicio quedaría en la pila
+        conn = contexto.connection
+        if conn is not None and contexto.execution_context is not None and conn.info.get("inicio_consulta"):
+            _cerrar_consulta(conn)
+
+
+def crear_engine(url: str = DATABASE_URL, **opciones):
+    """
+    Crea el engine con la configuración de pool de app.core.config.
+    - PostgreSQL/MySQL: QueuePool medido, pre-ping, recycle y statement_timeout (PostgreSQL)
+    - SQLite: sin opciones de pool (pruebas locales)
+    """
+    kwargs = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        kwargs.update(
+            poolclass=_PoolMedido,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+        if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql"):
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    kwargs.update(opciones)
+    nuevo_engine = create_engine(url, **kwargs)
+    _registrar_eventos(nuevo_engine)
+    return nuevo_engine
+
+
+engine = crear_engine()
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False)
 
+
+@event.listens_for(Session, "after_begin")
+def _asociar_metricas(session, transaction, connection):
+    # Las consultas de la conexión se cuentan en las métricas del request dueño de la sesión
+    metricas = session.info.get("metricas_request")
+    if metricas is not None:
+        connection.info["metricas_request"] = metricas
+
+
+# --- EFECTOS POSTERIORES AL COMMIT ---
+
+def al_confirmar(db: Session, accion):
+    """
+    Programa `accion(sesion)` para cuando la transacción de `db` se confirme; si se revierte,
+    se descarta. Dentro de after_commit la sesión original ya no puede emitir SQL, así que la
+    acción recibe una sesión nueva; sus errores se registran sin afectar lo ya confirmado.
+    """
+    db.info.setdefault("al_confirmar", []).append(accion)
+
+
+@event.listens_for(Session, "after_commit")
+def _ejecutar_al_confirmar(session):
+    acciones = session.info.pop("al_confirmar", None)
+    if not acciones:
+        return
+    db = SessionLocal(bind=session.get_bind())
+    try:
+        for accion in acciones:
+            try:
+                accion(db)
+            except Exception as e:
+                db.rollback()
+                print(f"[al_confirmar] Error en efecto posterior al commit: {e}")
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_al_confirmar(session, previous_transaction):
+    session.info.pop("al_confirmar", None)
+
+
+def obtener_metricas_db() -> dict:
+    return estadisticas_db.resumen(engine)
+
+
 def get_db():
     db = SessionLocal()
+    metricas = MetricasRequest()
+    db.info["metricas_request"] = metricas
     try:
         yield db
     finally:
         db.close()
+        estadisticas_db.registrar_request(metricas)
+
+
+# --- CAPA ASYNC OPCIONAL ---
+# Se crea bajo demanda para no exigir asyncpg/aiosqlite a quien solo usa la capa síncrona.
+
+_async_engine = None
+_async_session_local = None
+
+
+def _url_async(url: str) -> str:
+    esquema, resto = url.split("://", 1)
+    if "+" in esquema and esquema.split("+", 1)[1] in ("asyncpg", "aiosqlite"):
+        return url
+    if esquema.startswith("postgresql"):
+        return f"postgresql+asyncpg://{resto}"
+    if esquema.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{resto}"
+    return url
+
+
+def _obtener_async_session_local():
+    global _async_engine, _async_session_local
+    if _async_session_local is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = ASYNC_DATABASE_URL or _url_async(DATABASE_URL)
+        kwargs = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+        if not url.startswith("sqlite"):
+            kwargs.update(
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+            )
+            if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql+asyncpg"):
+                kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        _async_engine = create_async_engine(url, **kwargs)
+        _registrar_eventos(_async_engine.sync_engine)
+        _async_session_local = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_session_local
+
+
+async def get_async_db():
+    AsyncSessionLocal = _obtener_async_session_local()
+    metricas = MetricasRequest()
+    async with AsyncSessionLocal() as db:
+        db.sync_session.info["metricas_request"] = metricas
+        try:
+            yield db
+        finally:
+            estadisticas_db.registrar_request(metricas)
+
+
+async def cerrar_async_engine():
+    global _async_engine, _async_session_local
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_local = None
+
+
+def usa_async(nombre_router: str) -> bool:
+    """True si el router debe registrar las variantes async de sus lecturas (ROUTERS_ASYNC)."""
+    return nombre_router in ROUTERS_ASYNC
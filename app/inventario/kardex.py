@@ -0,0 +1,162 @@
+"""
+Kardex (tabla movimiento_stock): registro append-only de cada cambio de stock.
+
+Cada fila guarda el delta, el origen (venta, compra, ajuste...) y el saldo resultante, así
+que el stock de un producto a cualquier fecha es su última fila hasta esa fecha: una
+búsqueda en el índice (id_producto, fecha, id_movimiento), sin recorrer el historial.
+
+Stock.cantidad sigue siendo la lectura rápida (una proyección del kardex):
+- verificar_kardex compara ambos y reconstruir_stock corrige Stock desde el kardex.
+- compactar_kardex reemplaza el historial anterior a una fecha por una fila CIERRE por
+  producto con el saldo a esa fecha (ver compactar_kardex.py).
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert, update, delete, func, literal, exists
+from sqlalchemy.orm import Session, aliased
+
+from app.core.paginacion import paginar
+from app.productos.models import Producto
+from . import models
+
+TIPOS_ORIGEN = ("VENTA", "COMPRA", "AJUSTE", "EDICION", "INICIAL", "BAJA", "CIERRE")
+
+
+# ------------------- ESCRITURA -------------------
+
+def registrar_movimientos(db: Session, movimientos, tipo_origen: str, id_origen: int = None, fecha: datetime = None):
+    """
+    Agrega al kardex los movimientos [(id_producto, cantidad, saldo), ...] con un solo INSERT
+    multi-fila; los de cantidad 0 se omiten. No hace commit: se confirma junto con la venta,
+    compra o ajuste que lo origina.
+    """
+    fecha = fecha or datetime.now()
+    filas = [
+        {
+            "id_producto": id_producto,
+            "cantidad": cantidad,
+            "saldo": saldo,
+            "tipo_origen": tipo_origen,
+            "id_origen": id_origen,
+            "fecha": fecha,
+        }
+        for id_producto, cantidad, saldo in movimientos
+        if cantidad
+    ]
+    if filas:
+        db.execute(insert(models.MovimientoStock), filas)
+
+
+def registrar_movimiento(db: Session, id_producto: int, cantidad: int, saldo: int, tipo_origen: str, id_origen: int = None):
+    registrar_movimientos(db, [(id_producto, cantidad, saldo)], tipo_origen, id_origen)
+
+
+# ------------------- CONSULTAS -------------------
+
+def _consulta_ultimo_saldo(id_producto, fecha: datetime = None):
+    """Saldo del último movimiento del producto (hasta `fecha`): una búsqueda en el índice."""
+    m = models.MovimientoStock
+    consulta = select(m.saldo).where(m.id_producto == id_producto)
+    if fecha is not None:
+        consulta = consulta.where(m.fecha <= fecha)
+    return consulta.order_by(m.fecha.desc(), m.id_movimiento.desc()).limit(1)
+
+
+def stock_a_fecha(db: Session, id_producto: int, fecha: datetime) -> int:
+    return db.scalar(_consulta_ultimo_saldo(id_producto, fecha)) or 0
+
+
+def stock_microempresa_a_fecha(db: Session, id_microempresa: int, fecha: datetime):
+    """Stock de cada producto de la microempresa a `fecha` (una subconsulta indexada por producto)."""
+    saldo = func.coalesce(_consulta_ultimo_saldo(Producto.id_producto, fecha).scalar_subquery(), 0)
+    filas = db.execute(
+        select(Producto.id_producto, Producto.nombre, saldo.label("cantidad"))
+        .where(Producto.id_microempresa == id_microempresa)
+        .order_by(Producto.id_producto)
+    ).all()
+    return [dict(f._mapping) for f in filas]
+
+
+def listar_movimientos(db: Session, id_producto: int, desde: datetime = None, hasta: datetime = None, cursor: str = None, limit: int = None):
+    m = models.MovimientoStock
+    consulta = db.query(m).filter(m.id_producto == id_producto)
+    if desde is not None:
+        consulta = consulta.filter(m.fecha >= desde)
+    if hasta is not None:
+        consulta = consulta.filter(m.fecha <= hasta)
+    return paginar(consulta, m.id_movimiento, m.fecha, cursor, limit)
+
+
+# ------------------- CONCILIACIÓN Y MANTENIMIENTO -------------------
+
+def _productos_de(id_microempresa: int):
+    return select(Producto.id_producto).where(Producto.id_microempresa == id_microempresa)
+
+
+def verificar_kardex(db: Session, id_microempresa: int = None):
+    """Compara Stock.cantidad con el último saldo del kardex de cada producto y lista las diferencias."""
+    saldo = _consulta_ultimo_saldo(models.Stock.id_producto).scalar_subquery()
+    consulta = select(models.Stock.id_producto, models.Stock.cantidad, saldo.label("saldo"))
+    if id_microempresa is not None:
+        consulta = consulta.where(models.Stock.id_producto.in_(_productos_de(id_microempresa)))
+    filas = db.execute(consulta).all()
+    diferencias = [
+        {"id_producto": f.id_producto, "stock": f.cantidad, "kardex": f.saldo}
+        for f in filas
+        if (f.saldo or 0) != f.cantidad
+    ]
+    return {"consistente": not diferencias, "revisados": len(filas), "diferencias": diferencias}
+
+
+def reconstruir_stock(db: Session, id_microempresa: int = None) -> int:
+    """Iguala Stock.cantidad al último saldo del kardex (solo productos con movimientos)."""
+    m = models.MovimientoStock
+    consulta = (
+        update(models.Stock)
+        .values(cantidad=_consulta_ultimo_saldo(models.Stock.id_producto).scalar_subquery(), ultima_actualizacion=datetime.now())
+        .where(exists().where(m.id_producto == models.Stock.id_producto))
+        .execution_options(synchronize_session=False)
+    )
+    if id_microempresa is not None:
+        consulta = consulta.where(models.Stock.id_producto.in_(_productos_de(id_microempresa)))
+    resultado = db.execute(consulta)
+    db.commit()
+    return resultado.rowcount
+
+
+def compactar_kardex(db: Session, antes_de: datetime, id_microempresa: int = None):
+    """
+    Reemplaza los movimientos anteriores a `antes_de` por una fila CIERRE por producto, con el
+    saldo a esa fecha como cantidad (el historial posterior sigue sumando hasta el saldo actual).
+    Las consultas de stock a una fecha solo son exactas desde la fecha del cierre en adelante.
+    """
+    m = models.MovimientoStock
+    tope = db.scalar(select(func.max(m.id_movimiento)))
+    if tope is None:
+        return {"productos": 0, "movimientos_eliminados": 0}
+    viejos = (m.fecha < antes_de, m.id_movimiento <= tope)
+    candidatos = select(m.id_producto).where(*viejos).group_by(m.id_producto).having(func.count() > 1)
+    if id_microempresa is not None:
+        candidatos = candidatos.where(m.id_producto.in_(_productos_de(id_microempresa)))
+    ids = db.scalars(candidatos).all()
+    if not ids:
+        return {"productos": 0, "movimientos_eliminados": 0}
+
+    ultimo = aliased(m)
+    id_ultimo = (
+        select(ultimo.id_movimiento)
+        .where(ultimo.id_producto == m.id_producto, ultimo.fecha < antes_de, ultimo.id_movimiento <= tope)
+        .order_by(ultimo.fecha.desc(), ultimo.id_movimiento.desc())
+        .limit(1)
+        .correlate(m)
+        .scalar_subquery()
+    )
+    cierres = select(m.id_producto, m.saldo, m.saldo, literal("CIERRE"), m.fecha).where(
+        m.id_producto.in_(ids), m.id_movimiento == id_ultimo
+    )
+    db.execute(insert(m).from_select(["id_producto", "cantidad", "saldo", "tipo_origen", "fecha"], cierres))
+    borrados = db.execute(
+        delete(m).where(m.id_producto.in_(ids), *viejos).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return {"productos": len(ids), "movimientos_eliminados": borrados}
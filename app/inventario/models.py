@@ -1,6 +1,6 @@
 # models.py para inventario (stock)
 
-from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, String, ForeignKey, TIMESTAMP, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
@@ -12,3 +12,18 @@ class Stock(Base):
     stock_minimo = Column(Integer, default=0, nullable=False)
     ultima_actualizacion = Column(TIMESTAMP, nullable=False)
     producto = relationship("Producto")
+
+class MovimientoStock(Base):
+    """Kardex: cada cambio de stock agrega una fila (nunca se editan); saldo es el stock resultante."""
+    __tablename__ = "movimiento_stock"
+    __table_args__ = (
+        # Stock a una fecha y kardex por producto: WHERE id_producto = ? ORDER BY fecha DESC, id DESC
+        Index('ix_movimiento_stock_producto_fecha_id', 'id_producto', 'fecha', 'id_movimiento'),
+    )
+    id_movimiento = Column(Integer, primary_key=True, index=True)
+    id_producto = Column(Integer, ForeignKey("producto.id_producto", ondelete="CASCADE"), nullable=False)
+    cantidad = Column(Integer, nullable=False)  # + entra, - sale
+    saldo = Column(Integer, nullable=False)
+    tipo_origen = Column(String(20), nullable=False)  # VENTA, COMPRA, AJUSTE, EDICION, INICIAL, BAJA, CIERRE
+    id_origen = Column(Integer, nullable=True)  # id_venta / id_compra según tipo_origen
+    fecha = Column(TIMESTAMP, nullable=False)
@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
-from app.database.session import get_db
+from app.database.session import get_db, get_async_db, usa_async
 from . import schemas, service
 
 # --- IMPORTS NUEVOS PARA LAS NOTIFICACIONES ---
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, verificar_microempresa
 from app.notificaciones import service as notif_service
 from app.notificaciones.schemas import NotificacionCreate
 from app.productos.models import Producto 
@@ -79,10 +79,15 @@ def baja_logica_stock(id_stock: int, db: Session = Depends(get_db)):
 
 
 
-@router.get("/microempresa/{id_microempresa}", response_model=list[schemas.StockResponse])
-def listar_stock_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    # Solo admins pueden consultar el stock de su microempresa
-    return service.listar_stock_por_microempresa(db, id_microempresa)
+if usa_async("inventario"):
+    @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.StockResponse])
+    async def listar_stock_por_microempresa(id_microempresa: int, db=Depends(get_async_db)):
+        return await service.listar_stock_por_microempresa_async(db, id_microempresa)
+else:
+    @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.StockResponse])
+    def listar_stock_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
+        # Solo admins pueden consultar el stock de su microempresa
+        return service.listar_stock_por_microempresa(db, id_microempresa)
 
 @router.get("/{id_stock}", response_model=schemas.StockResponse)
 def obtener_stock(id_stock: int, db: Session = Depends(get_db)):
@@ -108,7 +113,61 @@ def registrar_stock_inicial(id_producto: int = Body(...), cantidad: int = Body(.
 def ajuste_stock(id_producto: int = Body(...), ajuste: int = Body(...), db: Session = Depends(get_db)):
     return service.ajuste_stock(db, id_producto, ajuste)
 
-@router.get("/microempresas/{id_microempresa}/stock", response_model=list)
-def listar_stock_por_microempresa_con_alerta(id_microempresa: int, db: Session = Depends(get_db)):
-    # Solo admins pueden consultar el stock de su microempresa
-    return service.listar_stock_por_microempresa_con_alerta(db, id_microempresa)
\ No newline at end of file
+if usa_async("inventario"):
+    @router.get("/microempresas/{id_microempresa}/stock", response_model=list)
+    async def listar_stock_por_microempresa_con_alerta(id_microempresa: int, db=Depends(get_async_db)):
+        return await service.listar_stock_por_microempresa_con_alerta_async(db, id_microempresa)
+else:
+    @router.get("/microempresas/{id_microempresa}/stock", response_model=list)
+    def listar_stock_por_microempresa_con_alerta(id_microempresa: int, db: Session = Depends(get_db)):
+        # Solo admins pueden consultar el stock de su microempresa
+        return service.listar_stock_por_microempresa_con_alerta(db, id_microempresa)
+
+# --- KARDEX (movimiento_stock) ---
+from datetime import datetime
+from typing import Optional
+from fastapi import Query, Response
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
+from . import kardex
+
+def _verificar_producto(db: Session, current_user, id_producto: int):
+    """El kardex de un producto solo lo ve alguien de su microempresa (o un superadmin)."""
+    producto = db.get(Producto, id_producto)
+    if producto is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    verificar_microempresa(current_user, producto.id_microempresa)
+
+def _alcance_kardex(current_user, id_microempresa: Optional[int]):
+    """Sin id_microempresa el superadmin verifica todas las microempresas; los demás, solo la suya."""
+    if id_microempresa is None and not getattr(current_user, "super_admin", None):
+        id_microempresa = getattr(current_user, "id_microempresa", None)
+    verificar_microempresa(current_user, id_microempresa)
+    return id_microempresa
+
+@router.get("/producto/{id_producto}/movimientos", response_model=list[schemas.MovimientoStockResponse])
+def listar_movimientos_producto(
+    response: Response,
+    id_producto: int,
+    desde: Optional[datetime] = Query(None),
+    hasta: Optional[datetime] = Query(None),
+    pagina: ParametrosPagina = Depends(parametros_pagina),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    _verificar_producto(db, current_user, id_producto)
+    return responder_pagina(response, kardex.listar_movimientos(db, id_producto, desde, hasta, pagina.cursor, pagina.limit))
+
+@router.get("/producto/{id_producto}/stock-a-fecha", response_model=schemas.StockAFechaResponse)
+def stock_producto_a_fecha(id_producto: int, fecha: datetime = Query(...), db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    _verificar_producto(db, current_user, id_producto)
+    return {"id_producto": id_producto, "fecha": fecha, "cantidad": kardex.stock_a_fecha(db, id_producto, fecha)}
+
+@router.get("/microempresas/{id_microempresa}/stock-a-fecha", response_model=list[schemas.StockProductoAFecha])
+def stock_microempresa_a_fecha(id_microempresa: int, fecha: datetime = Query(...), db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    verificar_microempresa(current_user, id_microempresa)
+    return kardex.stock_microempresa_a_fecha(db, id_microempresa, fecha)
+
+@router.get("/kardex/verificar")
+def verificar_kardex(id_microempresa: int = None, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    # Sin id_microempresa recorre todas las microempresas: solo superadmin
+    return kardex.verificar_kardex(db, _alcance_kardex(current_user, id_microempresa))
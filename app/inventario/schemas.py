@@ -22,3 +22,24 @@ class StockResponse(StockBase):
     ultima_actualizacion: datetime
     class Config:
         from_attributes = True
+
+class MovimientoStockResponse(BaseModel):
+    id_movimiento: int
+    id_producto: int
+    cantidad: int
+    saldo: int
+    tipo_origen: str
+    id_origen: Optional[int] = None
+    fecha: datetime
+    class Config:
+        from_attributes = True
+
+class StockAFechaResponse(BaseModel):
+    id_producto: int
+    fecha: datetime
+    cantidad: int
+
+class StockProductoAFecha(BaseModel):
+    id_producto: int
+    nombre: str
+    cantidad: int
@@ -1,8 +1,11 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import update, case, select, insert
 from . import models, schemas
 from app.productos.models import Producto
+from app.productos.service import invalidar_cache_portal
 from datetime import datetime
 from fastapi import HTTPException
+from .kardex import registrar_movimiento, registrar_movimientos
 
 # --- FUNCIÓN CORREGIDA ---
 def crear_stock(db: Session, stock: schemas.StockCreate):
@@ -12,18 +15,23 @@ def crear_stock(db: Session, stock: schemas.StockCreate):
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     existente = db.query(models.Stock).filter(models.Stock.id_producto == stock.id_producto).first()
     if existente:
+        anterior = existente.cantidad
         for key, value in stock.dict(exclude_unset=True).items():
             setattr(existente, key, value)
         existente.ultima_actualizacion = datetime.now()
+        registrar_movimiento(db, existente.id_producto, existente.cantidad - anterior, existente.cantidad, "EDICION")
         db.commit()
         db.refresh(existente)
+        invalidar_cache_portal(producto.id_microempresa)
         return existente
     data = stock.dict()
     data["ultima_actualizacion"] = datetime.now()
     db_stock = models.Stock(**data)
     db.add(db_stock)
+    registrar_movimiento(db, db_stock.id_producto, db_stock.cantidad, db_stock.cantidad, "INICIAL")
     db.commit()
     db.refresh(db_stock)
+    invalidar_cache_portal(producto.id_microempresa)
     return db_stock
 
 def actualizar_stock(db: Session, id_stock: int, stock: schemas.StockUpdate):
@@ -34,12 +42,15 @@ def actualizar_stock(db: Session, id_stock: int, stock: schemas.StockUpdate):
     producto = db.query(Producto).filter(Producto.id_producto == db_stock.id_producto).first()
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado para el stock")
+    anterior = db_stock.cantidad
     for key, value in stock.dict(exclude_unset=True).items():
         setattr(db_stock, key, value)
     if db_stock.cantidad is not None and db_stock.cantidad < 0:
         db_stock.cantidad = 0
+    registrar_movimiento(db, db_stock.id_producto, db_stock.cantidad - anterior, db_stock.cantidad, "EDICION")
     db.commit()
     db.refresh(db_stock)
+    invalidar_cache_portal(producto.id_microempresa)
     # Notificación y evento si el stock está igual o por debajo del mínimo
     from app.notificaciones import service as notif_service
     if db_stock.cantidad == 0:
@@ -68,18 +79,30 @@ def baja_logica_stock(db: Session, id_stock: int):
     producto = db.query(Producto).filter(Producto.id_producto == db_stock.id_producto).first()
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado para el stock")
+    registrar_movimiento(db, db_stock.id_producto, -db_stock.cantidad, 0, "BAJA")
     db_stock.cantidad = 0
     db.commit()
+    invalidar_cache_portal(producto.id_microempresa)
     return db_stock
 
 def listar_stock(db: Session):
     # No exponer todos los stocks sin filtro de microempresa
     raise HTTPException(status_code=403, detail="No permitido listar todo el stock globalmente")
 
+def _consulta_stock_microempresa(id_microempresa: int):
+    # Un solo JOIN en vez de traer primero los ids de producto y luego el stock con IN (...)
+    return (
+        select(models.Stock)
+        .join(Producto, Producto.id_producto == models.Stock.id_producto)
+        .where(Producto.id_microempresa == id_microempresa)
+    )
+
 def listar_stock_por_microempresa(db: Session, id_microempresa: int):
-    productos_ids = db.query(Producto.id_producto).filter(Producto.id_microempresa == id_microempresa).all()
-    productos_ids = [pid[0] for pid in productos_ids]
-    return db.query(models.Stock).filter(models.Stock.id_producto.in_(productos_ids)).all()
+    return db.scalars(_consulta_stock_microempresa(id_microempresa)).all()
+
+async def listar_stock_por_microempresa_async(db, id_microempresa: int):
+    resultado = await db.scalars(_consulta_stock_microempresa(id_microempresa))
+    return resultado.all()
 
 def crear_stock_inicial(db: Session, id_producto: int):
     # Solo crear si no existe stock para ese producto
@@ -107,6 +130,7 @@ def registrar_stock_inicial(db: Session, id_producto: int, cantidad: int, stock_
     stock = db.query(models.Stock).filter(models.Stock.id_producto == id_producto).first()
     if stock and stock.cantidad > 0:
         raise HTTPException(status_code=400, detail="El stock ya tiene existencias. Use la función de ajuste o edición.")
+    anterior = stock.cantidad if stock else 0
     if not stock:
         stock = models.Stock(
             id_producto=id_producto,
@@ -119,8 +143,10 @@ def registrar_stock_inicial(db: Session, id_producto: int, cantidad: int, stock_
         stock.cantidad = cantidad
         stock.stock_minimo = stock_minimo
         stock.ultima_actualizacion = datetime.now()
+    registrar_movimiento(db, id_producto, cantidad - anterior, cantidad, "INICIAL")
     db.commit()
     db.refresh(stock)
+    invalidar_cache_portal(producto.id_microempresa)
     return stock
 
 def ajuste_stock(db: Session, id_producto: int, ajuste: int):
@@ -130,12 +156,15 @@ def ajuste_stock(db: Session, id_producto: int, ajuste: int):
     producto = db.query(Producto).filter(Producto.id_producto == id_producto).first()
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado para el stock")
+    anterior = stock.cantidad
     stock.cantidad += ajuste
     if stock.cantidad < 0:
         stock.cantidad = 0
     stock.ultima_actualizacion = datetime.now()
+    registrar_movimiento(db, id_producto, stock.cantidad - anterior, stock.cantidad, "AJUSTE")
     db.commit()
     db.refresh(stock)
+    invalidar_cache_portal(producto.id_microempresa)
     # Evento por ajuste manual
     from app.notificaciones import service as notif_service
     notif_service.generar_evento(
@@ -164,10 +193,7 @@ def ajuste_stock(db: Session, id_producto: int, ajuste: int):
         )
     return stock
 
-def listar_stock_por_microempresa_con_alerta(db: Session, id_microempresa: int):
-    productos_ids = db.query(Producto.id_producto).filter(Producto.id_microempresa == id_microempresa).all()
-    productos_ids = [pid[0] for pid in productos_ids]
-    stocks = db.query(models.Stock).filter(models.Stock.id_producto.in_(productos_ids)).all()
+def _stock_con_alerta(stocks):
     resultado = []
     for s in stocks:
         bajo_minimo = s.cantidad <= s.stock_minimo
@@ -175,4 +201,148 @@ def listar_stock_por_microempresa_con_alerta(db: Session, id_microempresa: int):
             **schemas.StockResponse.from_orm(s).dict(),
             "bajo_minimo": bajo_minimo
         })
-    return resultado
\ No newline at end of file
+    return resultado
+
+def listar_stock_por_microempresa_con_alerta(db: Session, id_microempresa: int):
+    return _stock_con_alerta(listar_stock_por_microempresa(db, id_microempresa))
+
+async def listar_stock_por_microempresa_con_alerta_async(db, id_microempresa: int):
+    return _stock_con_alerta(await listar_stock_por_microempresa_async(db, id_microempresa))
+
+# --- RESERVA DE STOCK POR CARRITO (validación y descuento en bloque) ---
+
+def _cantidades_por_producto(detalles):
+    """Agrupa las cantidades solicitadas por producto (un carrito puede repetir un producto en varias líneas)."""
+    cantidades = {}
+    for det in detalles:
+        cantidades[det.id_producto] = cantidades.get(det.id_producto, 0) + det.cantidad
+    return cantidades
+
+def validar_stock_carrito(db: Session, detalles, bloquear: bool = False):
+    """
+    Valida el stock de todo el carrito con una sola consulta (id_producto IN (...)).
+    Con bloquear=True las filas de stock quedan bloqueadas (SELECT ... FOR UPDATE) hasta el commit.
+    Devuelve la lista de errores por línea (vacía si todo el carrito tiene stock).
+    """
+    cantidades = _cantidades_por_producto(detalles)
+    if not cantidades:
+        return []
+    query = db.query(models.Stock.id_producto, models.Stock.cantidad).filter(
+        models.Stock.id_producto.in_(list(cantidades.keys()))
+    )
+    if bloquear:
+        # Orden fijo para que dos checkouts concurrentes bloqueen las filas en el mismo orden (sin deadlocks)
+        query = query.order_by(models.Stock.id_producto).with_for_update()
+    disponibles = {id_producto: cantidad for id_producto, cantidad in query.all()}
+    errores_stock = []
+    for det in detalles:
+        disponible = disponibles.get(det.id_producto)
+        if disponible is None:
+            errores_stock.append({
+                "id_producto": det.id_producto,
+                "error": "Producto no encontrado en inventario",
+                "cantidad_solicitada": det.cantidad,
+                "stock_disponible": 0
+            })
+        elif disponible < cantidades[det.id_producto]:
+            errores_stock.append({
+                "id_producto": det.id_producto,
+                "error": "Stock insuficiente",
+                "cantidad_solicitada": det.cantidad,
+                "stock_disponible": disponible
+            })
+    return errores_stock
+
+def _error_stock_carrito(errores_stock):
+    return HTTPException(
+        status_code=400,
+        detail={
+            "mensaje": "No se puede registrar la venta por problemas de stock.",
+            "errores": errores_stock
+        }
+    )
+
+def verificar_stock_carrito(db: Session, detalles):
+    """Valida el carrito completo y lanza 400 con el reporte por línea si falta stock."""
+    errores_stock = validar_stock_carrito(db, detalles)
+    if errores_stock:
+        raise _error_stock_carrito(errores_stock)
+
+def descontar_stock_carrito(db: Session, detalles, id_venta: int = None):
+    """
+    Descuenta el stock de todo el carrito de forma atómica:
+    1. Bloquea y valida las filas de stock del carrito en una sola consulta.
+    2. Descuenta todas las líneas con un único UPDATE condicionado a cantidad >= solicitada.
+    3. Registra las salidas en el kardex (tipo VENTA) con un solo INSERT.
+    Si otra transacción consumió las unidades entre medio, el UPDATE no afecta todas las filas
+    y la venta se rechaza (dos checkouts de la última unidad no pueden confirmarse ambos).
+    No hace commit: el descuento se confirma junto con la venta.
+    Devuelve las filas (id_producto, cantidad, stock_minimo) con el saldo resultante.
+    """
+    cantidades = _cantidades_por_producto(detalles)
+    if not cantidades:
+        return []
+    errores_stock = validar_stock_carrito(db, detalles, bloquear=True)
+    if errores_stock:
+        raise _error_stock_carrito(errores_stock)
+
+    solicitada = case(cantidades, value=models.Stock.id_producto)
+    resultado = db.execute(
+        update(models.Stock)
+        .where(
+            models.Stock.id_producto.in_(list(cantidades.keys())),
+            models.Stock.cantidad >= solicitada
+        )
+        .values(
+            cantidad=models.Stock.cantidad - solicitada,
+            ultima_actualizacion=datetime.now()
+        )
+        .returning(models.Stock.id_producto, models.Stock.cantidad, models.Stock.stock_minimo)
+        .execution_options(synchronize_session=False)
+    )
+    actualizados = resultado.all()
+    if len(actualizados) != len(cantidades):
+        db.rollback()
+        errores_stock = validar_stock_carrito(db, detalles)
+        raise _error_stock_carrito(errores_stock or [{
+            "id_producto": None,
+            "error": "El stock cambió durante la operación. Intente nuevamente.",
+            "cantidad_solicitada": 0,
+            "stock_disponible": 0
+        }])
+    registrar_movimientos(
+        db, [(f.id_producto, -cantidades[f.id_producto], f.cantidad) for f in actualizados], "VENTA", id_venta
+    )
+    return actualizados
+
+def sumar_stock_lote(db: Session, cantidades: dict, tipo_origen: str = "COMPRA", id_origen: int = None):
+    """
+    Suma {id_producto: cantidad} al stock con un único UPDATE (CASE por producto) y registra
+    las entradas en el kardex con un solo INSERT. Los productos sin fila de stock la obtienen.
+    No hace commit. Devuelve las filas (id_producto, cantidad, stock_minimo) con el saldo resultante.
+    """
+    cantidades = {id_producto: cantidad for id_producto, cantidad in cantidades.items() if cantidad}
+    if not cantidades:
+        return []
+    ahora = datetime.now()
+    sumada = case(cantidades, value=models.Stock.id_producto)
+    actualizados = db.execute(
+        update(models.Stock)
+        .where(models.Stock.id_producto.in_(list(cantidades.keys())))
+        .values(cantidad=models.Stock.cantidad + sumada, ultima_actualizacion=ahora)
+        .returning(models.Stock.id_producto, models.Stock.cantidad, models.Stock.stock_minimo)
+        .execution_options(synchronize_session=False)
+    ).all()
+    faltantes = set(cantidades) - {f.id_producto for f in actualizados}
+    if faltantes:
+        actualizados += db.execute(
+            insert(models.Stock).returning(models.Stock.id_producto, models.Stock.cantidad, models.Stock.stock_minimo),
+            [
+                {"id_producto": id_producto, "cantidad": cantidades[id_producto], "stock_minimo": 0, "ultima_actualizacion": ahora}
+                for id_producto in sorted(faltantes)
+            ]
+        ).all()
+    registrar_movimientos(
+        db, [(f.id_producto, cantidades[f.id_producto], f.cantidad) for f in actualizados], tipo_origen, id_origen, ahora
+    )
+    return actualizados
@@ -1,7 +1,6 @@
 import os
 from fastapi import FastAPI, Depends, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 # --- IMPORTS DE ROUTERS ---
 from app.microempresas.router import router as microempresas_router
@@ -9,7 +8,12 @@ from app.users.router import router as users_router
 from app.auth.router import router as auth_router
 from app.auth import service as auth_service
 from app.auth.schemas import TokenResponse
-from app.database.session import get_db
+from app.database.session import get_db, obtener_metricas_db, cerrar_async_engine, SessionLocal
+from app.core.idempotencia import purgar_claves_vencidas
+from app.core.dependencies import solo_superadmin
+from app.core.estaticos import ArchivosEstaticos, obtener_metricas_estaticos
+from app.core.imagenes import detener_pool as detener_pool_imagenes
+from app.core.config import IMAGENES_CARPETA
 from app.database.init_db import init_db
 from app.planes.router import router as planes_router
 from app.suscripciones.router import router as suscripciones_router
@@ -22,7 +26,10 @@ from app.productos.router import router as productos_router
 from app.inventario.router import router as inventario_router
 
 from app.notificaciones.router import router as notificaciones_router
-from app.notificaciones.websocket import router as notificaciones_ws_router
+from app.notificaciones.websocket import router as notificaciones_ws_router, hub as hub_notificaciones
+from app.notificaciones.bus import bus as bus_eventos
+from app.notificaciones.correo import cola_correo
+from app.notificaciones.contador import reconciliador as reconciliador_contadores
 from app.ventas.router import router as ventas_router
 from app.proveedores.router import router as proveedores_router
 from app.compras.router import router as compras_router
@@ -45,14 +52,21 @@ app.add_middleware(
     allow_credentials=True,     # Permitir cookies/tokens
     allow_methods=["*"],        # Permitir todos los métodos (GET, POST, etc.)
     allow_headers=["*"],        # Permitir todos los headers
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],  # Cursor de paginación, versión del portal y reintentos idempotentes
 )
 
 # --- ARCHIVOS ESTÁTICOS (IMÁGENES) ---
 # 1. Aseguramos que la carpeta exista para que no de error al arrancar
 os.makedirs("public/productos", exist_ok=True)
+os.makedirs(IMAGENES_CARPETA, exist_ok=True)
 
 # 2. Montamos la ruta "/public" para que sirva los archivos de la carpeta física "public"
-app.mount("/public", StaticFiles(directory="public"), name="public")
+#    (cache inmutable para las imágenes con hash, .br/.gz precomprimidos, Range y LRU de archivos chicos)
+app.mount(
+    "/public",
+    ArchivosEstaticos(directory="public", carpetas_inmutables=[os.path.relpath(IMAGENES_CARPETA, "public")]),
+    name="public"
+)
 
 # --- INCLUSIÓN DE ROUTERS ---
 # Orden lógico para la documentación de Swagger
@@ -90,7 +104,37 @@ def login_root(
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
     return {"access_token": token}
 
+# --- MÉTRICAS DE BASE DE DATOS (pool y consultas por request) ---
+@app.get("/metricas/db", tags=["Metricas"])
+def metricas_db(user = Depends(solo_superadmin)):
+    # Expone el estado interno del pool: solo superadmin
+    return obtener_metricas_db()
+
+@app.get("/metricas/estaticos", tags=["Metricas"])
+def metricas_estaticos(user = Depends(solo_superadmin)):
+    return obtener_metricas_estaticos()
+
 # --- EVENTO DE INICIO ---
 @app.on_event("startup")
-def startup_event():
-    init_db()
\ No newline at end of file
+async def startup_event():
+    init_db()
+    bus_eventos.iniciar()
+    cola_correo.iniciar()
+    reconciliador_contadores.iniciar()
+    await hub_notificaciones.iniciar()
+    db = SessionLocal()
+    try:
+        print(f"[Idempotencia] Claves vencidas eliminadas: {purgar_claves_vencidas(db)}")
+    except Exception as e:
+        print(f"[Idempotencia] No se pudieron purgar las claves vencidas: {e}")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    bus_eventos.detener()
+    cola_correo.detener()
+    reconciliador_contadores.detener()
+    detener_pool_imagenes()
+    await hub_notificaciones.detener()
+    await cerrar_async_engine()
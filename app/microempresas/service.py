@@ -181,25 +181,27 @@ def subir_logo_microempresa(db: Session, id_microempresa: int, file: UploadFile)
     micro = db.query(models.Microempresa).filter_by(id_microempresa=id_microempresa).first()
     if not micro:
         raise HTTPException(status_code=404, detail="Microempresa no encontrada")
-    # Validar tipo de archivo
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Solo se permiten archivos de imagen")
-    # Validar tamaño (ejemplo: 2MB máximo)
-    contents = file.file.read()
-    max_size = 2 * 1024 * 1024
-    if len(contents) > max_size:
-        raise HTTPException(status_code=400, detail="El archivo es demasiado grande (máx 2MB)")
-    # Guardar archivo
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in [".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"]:
-        raise HTTPException(status_code=400, detail="Formato de imagen no soportado")
-    dir_path = os.path.join("public", str(micro.id_microempresa))
-    os.makedirs(dir_path, exist_ok=True)
-    file_path = os.path.join(dir_path, f"logo{ext}")
-    with open(file_path, "wb") as f:
-        f.write(contents)
-    # Guardar ruta en DB (relativa)
-    micro.logo = file_path.replace("\\", "/")
+    # Se valida el tipo por contenido y el tamaño (2MB máximo) mientras se copia por bloques
+    from app.core.imagenes import guardar_imagen, programar_variantes
+    imagen = guardar_imagen(file, max_bytes=2 * 1024 * 1024)
+    # Guardar ruta en DB (relativa); la variante redimensionada la reemplaza al estar lista
+    micro.logo = imagen.ruta
     db.commit()
     db.refresh(micro)
-    return micro
\ No newline at end of file
+    programar_variantes(
+        imagen,
+        lambda rutas: _registrar_variante_logo(id_microempresa, imagen.ruta, rutas["tarjeta"]),
+        variantes=("tarjeta",)
+    )
+    return micro
+
+def _registrar_variante_logo(id_microempresa: int, logo_original: str, ruta: str):
+    from app.database.session import SessionLocal
+    db = SessionLocal()
+    try:
+        db.query(models.Microempresa).filter_by(id_microempresa=id_microempresa, logo=logo_original).update(
+            {"logo": ruta}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
\ No newline at end of file
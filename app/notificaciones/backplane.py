@@ -0,0 +1,255 @@
+"""
+Backplane del WebSocket de notificaciones: reparte cada mensaje entre todos los procesos
+(`uvicorn --workers N`) para que llegue al worker que tiene abierto el socket del usuario.
+
+- BackplaneMemoria (WS_BACKPLANE=memoria): un solo proceso, entrega directa.
+- BackplanePostgres (WS_BACKPLANE=postgres): NOTIFY en el canal WS_BACKPLANE_CANAL y una
+  conexión psycopg2 dedicada con LISTEN, leída desde el loop con add_reader. Sirve entre
+  hosts. Cada worker recibe también sus propios NOTIFY, así que no entrega localmente aparte.
+- BackplaneUnix (WS_BACKPLANE=unix): un socket Unix de datagramas por worker en
+  WS_BACKPLANE_CARPETA (<pid>.sock). Publicar envía un datagrama a cada par; los sockets de
+  procesos muertos se eliminan al detectarlos. Solo para un host.
+
+Todos los métodos se ejecutan en el loop del hub; `entregar(id_usuario, mensaje, id_notificacion)`
+reparte a las conexiones locales (id_usuario None = broadcast).
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+
+from app.core.config import WS_BACKPLANE, WS_BACKPLANE_CANAL, WS_BACKPLANE_CARPETA
+
+# Límite de PostgreSQL para el payload de NOTIFY (8000 bytes)
+MAX_PAYLOAD_POSTGRES = 7900
+MAX_DATAGRAMA = 65536
+
+
+def _codificar(id_usuario, mensaje: str, id_notificacion=None) -> str:
+    return json.dumps({"u": id_usuario, "m": mensaje, "i": id_notificacion}, ensure_ascii=False, separators=(",", ":"))
+
+
+def _decodificar(datos):
+    valor = json.loads(datos)
+    return valor["u"], valor["m"], valor.get("i")
+
+
+class Backplane:
+    nombre = "base"
+
+    def __init__(self):
+        self.entregar = None
+        self.loop = None
+        self._metricas = {"publicados": 0, "recibidos": 0, "solo_locales": 0, "errores": 0}
+
+    async def iniciar(self, entregar):
+        self.entregar = entregar
+        self.loop = asyncio.get_running_loop()
+
+    async def publicar(self, id_usuario, mensaje: str, id_notificacion=None):
+        raise NotImplementedError
+
+    async def detener(self):
+        pass
+
+    def _recibir(self, datos):
+        try:
+            id_usuario, mensaje, id_notificacion = _decodificar(datos)
+        except (ValueError, KeyError, TypeError):
+            self._metricas["errores"] += 1
+            return
+        self._metricas["recibidos"] += 1
+        self.entregar(id_usuario, mensaje, id_notificacion)
+
+    def _solo_local(self, id_usuario, mensaje: str, id_notificacion, motivo: str):
+        print(f"[WebSocket] Backplane {self.nombre}: {motivo}; el mensaje se entrega solo en este proceso")
+        self._metricas["solo_locales"] += 1
+        self.entregar(id_usuario, mensaje, id_notificacion)
+
+    def metricas(self) -> dict:
+        return {"backplane": self.nombre, **self._metricas}
+
+
+class BackplaneMemoria(Backplane):
+    nombre = "memoria"
+
+    async def publicar(self, id_usuario, mensaje: str, id_notificacion=None):
+        self._metricas["publicados"] += 1
+        self.entregar(id_usuario, mensaje, id_notificacion)
+
+
+class BackplanePostgres(Backplane):
+    nombre = "postgres"
+
+    def __init__(self, canal: str = WS_BACKPLANE_CANAL, reintento: float = 5.0):
+        super().__init__()
+        self.canal = canal
+        self.reintento = reintento
+        self._tarea = None
+        self._escuchando = False
+
+    async def iniciar(self, entregar):
+        await super().iniciar(entregar)
+        self._tarea = self.loop.create_task(self._escuchar())
+
+    async def publicar(self, id_usuario, mensaje: str, id_notificacion=None):
+        payload = _codificar(id_usuario, mensaje, id_notificacion)
+        if len(payload.encode("utf-8")) > MAX_PAYLOAD_POSTGRES:
+            self._solo_local(id_usuario, mensaje, id_notificacion, "mensaje demasiado grande para NOTIFY")
+            return
+        try:
+            await self.loop.run_in_executor(None, self._notificar, payload)
+            self._metricas["publicados"] += 1
+        except Exception as e:
+            self._metricas["errores"] += 1
+            self._solo_local(id_usuario, mensaje, id_notificacion, f"NOTIFY falló ({e})")
+
+    def _notificar(self, payload: str):
+        from sqlalchemy import text
+        from app.database.session import engine
+        with engine.connect() as conexion:
+            conexion.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": self.canal, "payload": payload})
+            conexion.commit()
+
+    def _conectar_escucha(self):
+        # Conexión propia (fuera del pool): queda tomada mientras dure el LISTEN
+        from app.database.session import engine
+        argumentos, parametros = engine.dialect.create_connect_args(engine.url)
+        parametros.update(keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        conexion = engine.dialect.connect(*argumentos, **parametros)
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.canal}"')
+        return conexion
+
+    async def _escuchar(self):
+        while True:
+            conexion = None
+            descriptor = None
+            try:
+                conexion = await self.loop.run_in_executor(None, self._conectar_escucha)
+                descriptor = conexion.fileno()
+                listo = asyncio.Event()
+                self.loop.add_reader(descriptor, listo.set)
+                self._escuchando = True
+                print(f"[WebSocket] Backplane PostgreSQL escuchando el canal {self.canal}")
+                while True:
+                    await listo.wait()
+                    listo.clear()
+                    conexion.poll()
+                    while conexion.notifies:
+                        self._recibir(conexion.notifies.pop(0).payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._metricas["errores"] += 1
+                print(f"[WebSocket] Backplane PostgreSQL desconectado: {e}; reintento en {self.reintento} s")
+            finally:
+                self._escuchando = False
+                if descriptor is not None:
+                    self.loop.remove_reader(descriptor)
+                if conexion is not None:
+                    try:
+                        conexion.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(self.reintento)
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._tarea = None
+
+    def metricas(self) -> dict:
+        return {**super().metricas(), "escuchando": self._escuchando, "canal": self.canal}
+
+
+class BackplaneUnix(Backplane):
+    nombre = "unix"
+
+    def __init__(self, carpeta: str = WS_BACKPLANE_CARPETA, refresco_pares: float = 1.0):
+        super().__init__()
+        self.carpeta = carpeta
+        self.refresco_pares = refresco_pares
+        self.ruta = None
+        self.socket = None
+        self._pares = []
+        self._pares_leidos = 0.0
+
+    async def iniciar(self, entregar):
+        await super().iniciar(entregar)
+        os.makedirs(self.carpeta, exist_ok=True)
+        self.ruta = os.path.join(self.carpeta, f"{os.getpid()}.sock")
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.ruta)
+        self.socket.setblocking(False)
+        self.loop.add_reader(self.socket.fileno(), self._leer)
+
+    def _leer(self):
+        while True:
+            try:
+                datos = self.socket.recv(MAX_DATAGRAMA)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._recibir(datos.decode("utf-8"))
+
+    def _listar_pares(self):
+        ahora = time.monotonic()
+        if ahora - self._pares_leidos > self.refresco_pares:
+            with os.scandir(self.carpeta) as entradas:
+                self._pares = [e.path for e in entradas if e.name.endswith(".sock") and e.path != self.ruta]
+            self._pares_leidos = ahora
+        return self._pares
+
+    async def publicar(self, id_usuario, mensaje: str, id_notificacion=None):
+        datos = _codificar(id_usuario, mensaje, id_notificacion).encode("utf-8")
+        self._metricas["publicados"] += 1
+        self.entregar(id_usuario, mensaje, id_notificacion)
+        if len(datos) > MAX_DATAGRAMA:
+            print(f"[WebSocket] Backplane unix: mensaje demasiado grande para un datagrama; se entrega solo en este proceso")
+            self._metricas["solo_locales"] += 1
+            return
+        for ruta in self._listar_pares():
+            try:
+                self.socket.sendto(datos, ruta)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket de un worker que ya terminó
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+                self._pares_leidos = 0.0
+            except OSError as e:
+                # Buffer del otro worker lleno (o error del socket): ese worker pierde el mensaje
+                self._metricas["errores"] += 1
+                print(f"[WebSocket] Backplane unix: no se pudo enviar a {ruta}: {e}")
+
+    async def detener(self):
+        if self.socket is not None:
+            self.loop.remove_reader(self.socket.fileno())
+            self.socket.close()
+            self.socket = None
+            try:
+                os.remove(self.ruta)
+            except OSError:
+                pass
+
+    def metricas(self) -> dict:
+        return {**super().metricas(), "pares": len(self._pares), "ruta": self.ruta}
+
+
+BACKPLANES = {"memoria": BackplaneMemoria, "postgres": BackplanePostgres, "unix": BackplaneUnix}
+
+
+def crear_backplane(nombre: str = WS_BACKPLANE) -> Backplane:
+    try:
+        return BACKPLANES[nombre]()
+    except KeyError:
+        raise ValueError(f"WS_BACKPLANE inválido: {nombre} (opciones: {', '.join(BACKPLANES)})")
@@ -0,0 +1,236 @@
+"""
+Bus de eventos en proceso para sacar generar_evento del camino del request.
+
+Los servicios publican un EventoPendiente (registro compacto) y responden de inmediato.
+Un pool de workers consume la cola en lotes y hace el fan-out de notificaciones con
+inserciones masivas (service.procesar_lote_eventos), cada lote en su propia sesión.
+
+- La cola es acotada: si está llena, publicar() espera un momento y, si sigue llena,
+  procesa el evento en el hilo del llamador (backpressure sin perder eventos).
+- Si un lote falla se reintenta evento por evento, para que uno defectuoso no arrastre a
+  los demás. Un evento que falla (también el procesado en línea por backpressure) pasa a
+  una lista de diferidos fuera de la cola acotada y se reintenta con backoff exponencial
+  (EVENTOS_BACKOFF_BASE * 2^n, hasta EVENTOS_BACKOFF_MAX); después de EVENTOS_MAX_INTENTOS
+  se descarta con un error en el log.
+- metricas() expone profundidad de cola, esperas y contadores.
+- En modo prueba no se levantan workers: los eventos quedan en la cola y drenar()
+  los procesa de forma síncrona. Al apagar, drenar() reintenta también los diferidos
+  aunque no hayan vencido.
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from app.core.config import (
+    EVENTOS_ASINCRONOS,
+    EVENTOS_COLA_MAX,
+    EVENTOS_WORKERS,
+    EVENTOS_TAM_LOTE,
+    EVENTOS_ESPERA_MAX,
+    EVENTOS_MAX_INTENTOS,
+    EVENTOS_BACKOFF_BASE,
+    EVENTOS_BACKOFF_MAX,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EventoPendiente(NamedTuple):
+    tipo_evento: str
+    mensaje: str
+    id_microempresa: int
+    referencia_id: Optional[int]
+    fecha: datetime
+    intentos: int = 0
+
+
+class BusEventos:
+    def __init__(self, max_cola: int = 1000, workers: int = 2, tam_lote: int = 50, espera_max: float = 0.5,
+                 max_intentos: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.cola = queue.Queue(maxsize=max_cola)
+        self.max_cola = max_cola
+        self.num_workers = workers
+        self.tam_lote = tam_lote
+        self.espera_max = espera_max
+        self.max_intentos = max_intentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._diferidos = []  # heap de (vence, orden, evento)
+        self._orden = itertools.count()
+        self.modo_prueba = False
+        self._hilos = []
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._metricas = {
+            "encolados": 0,
+            "procesados": 0,
+            "fallidos": 0,
+            "reintentos": 0,
+            "descartados": 0,
+            "lotes": 0,
+            "notificaciones_creadas": 0,
+            "procesados_en_linea": 0,
+            "esperas_cola_llena": 0,
+            "profundidad_max": 0,
+            "espera_total_s": 0.0,
+        }
+
+    @property
+    def activo(self) -> bool:
+        """True si los eventos deben encolarse en vez de procesarse en el request."""
+        return self.modo_prueba or any(h.is_alive() for h in self._hilos)
+
+    # ------------------- CICLO DE VIDA -------------------
+    def iniciar(self):
+        if self.modo_prueba or self._hilos:
+            return
+        self._detener.clear()
+        for i in range(self.num_workers):
+            hilo = threading.Thread(target=self._worker, name=f"bus-eventos-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self, timeout: float = 5.0):
+        """Detiene los workers después de vaciar la cola (o al vencer el timeout)."""
+        self._detener.set()
+        for hilo in self._hilos:
+            hilo.join(timeout)
+        self._hilos = []
+        # Lo que haya quedado se procesa en línea para no perder eventos al apagar
+        self.drenar(incluir_diferidos=True)
+
+    def activar_modo_prueba(self):
+        """Sin workers: publicar() solo encola y drenar() procesa de forma síncrona."""
+        self.detener()
+        self.modo_prueba = True
+
+    # ------------------- PUBLICACIÓN -------------------
+    def publicar(self, evento: EventoPendiente):
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            self._sumar("esperas_cola_llena")
+            try:
+                self.cola.put(evento, timeout=self.espera_max)
+            except queue.Full:
+                # Backpressure: la cola sigue llena, el request paga el costo del fan-out
+                self._sumar("procesados_en_linea")
+                self._procesar([evento])
+                return
+        self._sumar("encolados")
+        with self._lock:
+            self._metricas["profundidad_max"] = max(self._metricas["profundidad_max"], self.cola.qsize())
+
+    def drenar(self, db=None, incluir_diferidos: bool = False):
+        """Procesa síncronamente la cola y los diferidos vencidos (o todos) (modo prueba / apagado)."""
+        total = 0
+        while True:
+            lote = self._tomar_lote(bloquear=False, incluir_diferidos=incluir_diferidos)
+            if not lote:
+                return total
+            total += len(lote)
+            self._procesar(lote, db=db)
+
+    # ------------------- WORKERS -------------------
+    def _tomar_lote(self, bloquear: bool = True, incluir_diferidos: bool = False):
+        lote = self._vencidos(incluir_diferidos)
+        if not lote:
+            try:
+                lote.append(self.cola.get(timeout=0.5) if bloquear else self.cola.get_nowait())
+            except queue.Empty:
+                return lote
+        while len(lote) < self.tam_lote:
+            try:
+                lote.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _worker(self):
+        while not (self._detener.is_set() and self.cola.empty()):
+            lote = self._tomar_lote()
+            if lote:
+                self._procesar(lote)
+
+    def _procesar(self, lote, db=None):
+        from app.database.session import SessionLocal
+        from . import service
+        ahora = datetime.now()
+        propia = db is None
+        if propia:
+            db = SessionLocal()
+        try:
+            creadas = service.procesar_lote_eventos(db, lote)
+            with self._lock:
+                self._metricas["procesados"] += len(lote)
+                self._metricas["lotes"] += 1
+                self._metricas["notificaciones_creadas"] += creadas
+                self._metricas["espera_total_s"] += sum((ahora - ev.fecha).total_seconds() for ev in lote)
+        except Exception:
+            logger.exception("[Eventos] Error procesando lote de %d eventos", len(lote))
+            db.rollback()
+            if len(lote) > 1:
+                # Un evento defectuoso no tumba al resto: se reintentan uno por uno
+                for evento in lote:
+                    self._procesar([evento], db=db)
+            else:
+                self._diferir(lote[0])
+        finally:
+            if propia:
+                db.close()
+
+    # ------------------- REINTENTOS -------------------
+    def _diferir(self, evento: EventoPendiente):
+        """Guarda el evento fallido para reintentarlo con backoff; al agotar los intentos lo descarta."""
+        self._sumar("fallidos")
+        intentos = evento.intentos + 1
+        if intentos >= self.max_intentos:
+            self._sumar("descartados")
+            logger.error("[Eventos] Evento descartado tras %d intentos: %s", intentos, evento)
+            return
+        espera = min(self.backoff_base * 2 ** (intentos - 1), self.backoff_max)
+        with self._lock:
+            heapq.heappush(self._diferidos, (time.monotonic() + espera, next(self._orden), evento._replace(intentos=intentos)))
+            self._metricas["reintentos"] += 1
+
+    def _vencidos(self, todos: bool = False):
+        """Saca de los diferidos los que ya vencieron (o todos), hasta tam_lote."""
+        ahora = time.monotonic()
+        lote = []
+        with self._lock:
+            while self._diferidos and len(lote) < self.tam_lote and (todos or self._diferidos[0][0] <= ahora):
+                lote.append(heapq.heappop(self._diferidos)[2])
+        return lote
+
+    # ------------------- MÉTRICAS -------------------
+    def _sumar(self, clave: str, cantidad: int = 1):
+        with self._lock:
+            self._metricas[clave] += cantidad
+
+    def metricas(self) -> dict:
+        with self._lock:
+            datos = dict(self._metricas)
+        espera_total = datos.pop("espera_total_s")
+        datos["espera_media_ms"] = round(espera_total * 1000 / datos["procesados"], 2) if datos["procesados"] else 0.0
+        datos["profundidad"] = self.cola.qsize()
+        datos["diferidos"] = len(self._diferidos)
+        datos["capacidad"] = self.max_cola
+        datos["workers_vivos"] = sum(1 for h in self._hilos if h.is_alive())
+        datos["modo_prueba"] = self.modo_prueba
+        return datos
+
+
+bus = BusEventos(
+    max_cola=EVENTOS_COLA_MAX,
+    workers=EVENTOS_WORKERS if EVENTOS_ASINCRONOS else 0,
+    tam_lote=EVENTOS_TAM_LOTE,
+    espera_max=EVENTOS_ESPERA_MAX,
+    max_intentos=EVENTOS_MAX_INTENTOS,
+    backoff_base=EVENTOS_BACKOFF_BASE,
+    backoff_max=EVENTOS_BACKOFF_MAX,
+)
@@ -0,0 +1,197 @@
+"""
+Contador de notificaciones no leídas por usuario (badge del frontend).
+
+- La tabla notificacion_contador (id_usuario, no_leidas) se actualiza en la misma transacción
+  que crea, marca como leída o borra notificaciones: sumar_no_leidas aplica un UPDATE por
+  delta. Un usuario sin fila se inicializa contando sus notificaciones, con el cambio ya en flush.
+- Al confirmar, el total nuevo se guarda en la cache en memoria y se envía por el WebSocket
+  como {"tipo": "no_leidas", "total": N}.
+- obtener_no_leidas responde desde la cache; si no está, lee la fila por PK.
+- reconciliar() corrige en una sentencia las filas desviadas (borrados en cascada, escrituras
+  que no pasan por el service). ReconciliadorContadores la ejecuta en un hilo cada
+  CONTADOR_RECONCILIAR_INTERVALO segundos.
+
+La cache es por proceso: con varios workers, la de los demás puede atrasarse hasta
+CONTADOR_CACHE_TTL segundos. La trama del WebSocket siempre lleva el total de la base.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, func, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.cache import CacheTTL
+from app.core.config import CONTADOR_CACHE_MAX, CONTADOR_CACHE_TTL, CONTADOR_RECONCILIAR_INTERVALO
+from app.database.session import al_confirmar
+from . import models
+from .stream import trama_no_leidas
+
+Contador = models.ContadorNoLeidas
+Notificacion = models.Notificacion
+
+# id_usuario -> no leídas
+cache_no_leidas = CacheTTL(max_items=CONTADOR_CACHE_MAX, ttl=CONTADOR_CACHE_TTL)
+
+
+def _contar(db: Session, ids_usuario) -> dict:
+    return dict(db.execute(
+        select(Notificacion.id_usuario, func.count())
+        .where(Notificacion.id_usuario.in_(list(ids_usuario)), Notificacion.leido == False)
+        .group_by(Notificacion.id_usuario)
+    ).all())
+
+
+def _inicializar(db: Session, ids_usuario, ahora: datetime) -> dict:
+    conteos = _contar(db, ids_usuario)
+    totales = {id_usuario: conteos.get(id_usuario, 0) for id_usuario in ids_usuario}
+    try:
+        with db.begin_nested():
+            db.execute(insert(Contador), [
+                {"id_usuario": id_usuario, "no_leidas": total, "fecha_actualizacion": ahora}
+                for id_usuario, total in totales.items()
+            ])
+    except IntegrityError:
+        # Otra transacción creó la fila al mismo tiempo; la reconciliación ajusta el valor
+        return {}
+    return totales
+
+
+def sumar_no_leidas(db: Session, deltas: dict):
+    """
+    Aplica {id_usuario: delta} a notificacion_contador dentro de la transacción de `db`. Los
+    cambios en notificacion ya deben estar en flush. No hace commit: la cache y el WebSocket se
+    actualizan cuando el llamador confirma.
+    """
+    por_delta = defaultdict(list)
+    for id_usuario, delta in deltas.items():
+        if delta:
+            por_delta[delta].append(id_usuario)
+    if not por_delta:
+        return
+    ahora = datetime.now()
+    totales = {}
+    for delta, ids_usuario in por_delta.items():
+        totales.update(db.execute(
+            update(Contador)
+            .where(Contador.id_usuario.in_(ids_usuario))
+            .values(no_leidas=Contador.no_leidas + delta, fecha_actualizacion=ahora)
+            .returning(Contador.id_usuario, Contador.no_leidas)
+            .execution_options(synchronize_session=False)
+        ).all())
+    faltantes = [id_usuario for ids_usuario in por_delta.values() for id_usuario in ids_usuario if id_usuario not in totales]
+    if faltantes:
+        totales.update(_inicializar(db, faltantes, ahora))
+    al_confirmar(db, lambda _: _publicar(totales))
+
+
+def _publicar(totales: dict):
+    from .websocket import hub
+    for id_usuario, total in totales.items():
+        cache_no_leidas.invalidar(id_usuario)
+        cache_no_leidas.guardar(id_usuario, total)
+        hub.publicar(id_usuario, trama_no_leidas(total))
+
+
+def obtener_no_leidas(db: Session, id_usuario: int) -> int:
+    total = cache_no_leidas.obtener(id_usuario)
+    if total is not None:
+        return total
+    version = cache_no_leidas.version(id_usuario)
+    total = db.scalar(select(Contador.no_leidas).where(Contador.id_usuario == id_usuario))
+    if total is None:
+        # Usuario sin fila todavía: se cuenta (la primera escritura o la reconciliación la crean)
+        total = _contar(db, [id_usuario]).get(id_usuario, 0)
+    cache_no_leidas.guardar(id_usuario, total, version)
+    return total
+
+
+def reconciliar(db: Session) -> int:
+    """Recalcula los contadores desviados y crea los que faltan. Confirma y devuelve cuántos corrigió."""
+    ahora = datetime.now()
+    conteo = (
+        select(func.count())
+        .where(Notificacion.id_usuario == Contador.id_usuario, Notificacion.leido == False)
+        .scalar_subquery()
+    )
+    totales = dict(db.execute(
+        update(Contador)
+        .where(Contador.no_leidas != conteo)
+        .values(no_leidas=conteo, fecha_actualizacion=ahora)
+        .returning(Contador.id_usuario, Contador.no_leidas)
+        .execution_options(synchronize_session=False)
+    ).all())
+    faltantes = db.execute(
+        select(Notificacion.id_usuario, func.count())
+        .where(Notificacion.leido == False, ~exists().where(Contador.id_usuario == Notificacion.id_usuario))
+        .group_by(Notificacion.id_usuario)
+    ).all()
+    if faltantes:
+        db.execute(insert(Contador), [
+            {"id_usuario": id_usuario, "no_leidas": total, "fecha_actualizacion": ahora}
+            for id_usuario, total in faltantes
+        ])
+        totales.update(faltantes)
+    db.commit()
+    _publicar(totales)
+    return len(totales)
+
+
+class ReconciliadorContadores:
+    def __init__(self, intervalo: float = CONTADOR_RECONCILIAR_INTERVALO):
+        self.intervalo = intervalo
+        self._hilo = None
+        self._detener = threading.Event()
+        self.ejecuciones = 0
+        self.corregidos = 0
+        self.ultima_ejecucion = None
+
+    def iniciar(self):
+        if self.intervalo <= 0 or self._hilo is not None:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._worker, name="contador-no-leidas", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 10.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def ejecutar(self) -> int:
+        from app.database.session import SessionLocal
+        db = SessionLocal()
+        try:
+            corregidos = reconciliar(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.ejecuciones += 1
+        self.corregidos += corregidos
+        self.ultima_ejecucion = datetime.now()
+        return corregidos
+
+    def _worker(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                corregidos = self.ejecutar()
+                if corregidos:
+                    print(f"[Contador] Reconciliación: {corregidos} contadores corregidos")
+            except Exception as e:
+                print(f"[Contador] Error en la reconciliación: {e}")
+
+    def metricas(self) -> dict:
+        return {
+            "cache": cache_no_leidas.metricas(),
+            "reconciliaciones": self.ejecuciones,
+            "corregidos": self.corregidos,
+            "ultima_reconciliacion": self.ultima_ejecucion,
+            "intervalo": self.intervalo,
+        }
+
+
+reconciliador = ReconciliadorContadores()
@@ -0,0 +1,394 @@
+"""
+Cola de correo saliente sobre la tabla notificacion_email_log.
+
+encolar_correo guarda el correo como PENDIENTE (en la transacción del llamador) y el
+request responde sin esperar al servidor SMTP. Un worker lo envía después:
+
+- Toma lotes de correos vencidos (proximo_intento <= ahora) y los marca ENVIANDO con un
+  arrendamiento (CORREO_ARRENDAMIENTO) que se renueva durante el lote antes de que le quede
+  menos de lo que puede tardar un envío, así otro proceso no los reenvía aunque el lote dure
+  más que el arrendamiento. Si el proceso muere a mitad del envío, los correos vuelven a
+  estar disponibles al vencer. En PostgreSQL usa FOR UPDATE SKIP LOCKED, así que varios
+  procesos pueden compartir la cola.
+- Envía por una sola sesión SMTP autenticada, reutilizada entre lotes, que se cierra tras
+  CORREO_SMTP_INACTIVIDAD segundos sin uso.
+- Un error temporal reprograma el correo con backoff exponencial (CORREO_BACKOFF_BASE * 2^n,
+  hasta CORREO_BACKOFF_MAX); después de CORREO_MAX_INTENTOS queda FALLIDO. Un rechazo
+  permanente (5xx del destinatario o del contenido) lo deja FALLIDO de inmediato.
+- Si se cae la conexión SMTP, solo el correo que falló cuenta el intento; el resto del lote
+  se reprograma sin intentarlo y sin contar intento.
+- Al quedar ENVIADO o FALLIDO se borra el cuerpo (puede traer tokens, p. ej. recuperación de
+  contraseña); el registro conserva destino, asunto, estado y error.
+- CORREO_LIMITE_DOMINIO limita los envíos por minuto a cada dominio destino; el excedente
+  se posterga sin contar como intento.
+- Sin worker (CORREO_ASINCRONO=false) la cola se procesa en línea al confirmar; en modo
+  prueba no se envía nada hasta llamar a drenar().
+"""
+import random
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    EMAIL_HOST,
+    EMAIL_PORT,
+    EMAIL_HOST_USER,
+    EMAIL_HOST_PASSWORD,
+    EMAIL_FROM,
+    EMAIL_STARTTLS,
+    EMAIL_TIMEOUT,
+    CORREO_ASINCRONO,
+    CORREO_TAM_LOTE,
+    CORREO_MAX_INTENTOS,
+    CORREO_BACKOFF_BASE,
+    CORREO_BACKOFF_MAX,
+    CORREO_LIMITE_DOMINIO,
+    CORREO_SMTP_INACTIVIDAD,
+    CORREO_ARRENDAMIENTO,
+    CORREO_INTERVALO,
+)
+from .models import NotificacionEmailLog
+
+
+# ------------------- ENCOLAR -------------------
+
+def encolar_correo(db: Session, destino: str, asunto: str, cuerpo: str, id_notificacion: int = None) -> NotificacionEmailLog:
+    """Agrega el correo a la cola. No hace commit: se envía cuando el llamador confirma."""
+    from app.database.session import al_confirmar
+    ahora = datetime.now()
+    correo = NotificacionEmailLog(
+        id_notificacion=id_notificacion,
+        email_destino=destino,
+        asunto=asunto[:200],
+        cuerpo=cuerpo,
+        estado="PENDIENTE",
+        intentos=0,
+        proximo_intento=ahora,
+        fecha_creacion=ahora,
+    )
+    db.add(correo)
+    db.flush()
+    cola_correo.sumar("encolados")
+    al_confirmar(db, cola_correo.despertar)
+    return correo
+
+
+def enviar_correo(destino: str, asunto: str, cuerpo: str, id_notificacion: int = None):
+    """encolar_correo con su propia sesión y commit (para quien no tiene una sesión a mano)."""
+    from app.database.session import SessionLocal
+    db = SessionLocal()
+    try:
+        encolar_correo(db, destino, asunto, cuerpo, id_notificacion)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ------------------- SMTP -------------------
+
+class ConexionSMTP:
+    """Sesión SMTP autenticada que se reutiliza entre envíos; se reabre si el servidor la cerró."""
+    def __init__(self, host: str = EMAIL_HOST, port: int = EMAIL_PORT, usuario: str = EMAIL_HOST_USER,
+                 clave: str = EMAIL_HOST_PASSWORD, starttls: bool = EMAIL_STARTTLS, timeout: float = EMAIL_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.clave = clave
+        self.starttls = starttls
+        self.timeout = timeout
+        self.conexiones = 0
+        self._smtp = None
+        self._ultimo_uso = 0.0
+
+    def _abrir(self):
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls(context=ssl.create_default_context())
+        try:
+            if self.usuario and self.clave:
+                smtp.login(self.usuario, self.clave)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.conexiones += 1
+
+    def enviar(self, remitente: str, destino: str, mensaje: str):
+        if self._smtp is None:
+            self._abrir()
+        try:
+            self._smtp.sendmail(remitente, [destino], mensaje)
+        except smtplib.SMTPServerDisconnected:
+            # La sesión reutilizada se cortó (timeout del servidor): se reabre una vez
+            self.cerrar()
+            self._abrir()
+            self._smtp.sendmail(remitente, [destino], mensaje)
+        self._ultimo_uso = time.monotonic()
+
+    def cerrar_si_inactiva(self, segundos: float):
+        if self._smtp is not None and time.monotonic() - self._ultimo_uso > segundos:
+            self.cerrar()
+
+    def cerrar(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+
+class LimiteDominio:
+    """Ventana deslizante de 60 s por dominio destino."""
+    def __init__(self, por_minuto: int):
+        self.por_minuto = por_minuto
+        self._envios = {}
+
+    def reservar(self, dominio: str) -> float:
+        """0 si se puede enviar ahora (y lo registra); si no, segundos hasta que haya cupo."""
+        if not self.por_minuto:
+            return 0.0
+        ahora = time.monotonic()
+        envios = self._envios.setdefault(dominio, deque())
+        while envios and ahora - envios[0] >= 60:
+            envios.popleft()
+        if len(envios) < self.por_minuto:
+            envios.append(ahora)
+            return 0.0
+        return 60 - (ahora - envios[0])
+
+
+def _es_error_conexion(error: Exception) -> bool:
+    """Error de la conexión o de la sesión (no del correo): el resto del lote se reprograma sin intentarlo."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError)):
+        return True
+    # SMTPException hereda de OSError: las respuestas a un correo puntual no cuentan
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _es_permanente(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(codigo >= 500 for codigo, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPDataError) and error.smtp_code >= 500
+
+
+def _backoff(intentos: int) -> float:
+    return min(CORREO_BACKOFF_BASE * 2 ** (intentos - 1), CORREO_BACKOFF_MAX) * random.uniform(1.0, 1.2)
+
+
+def _mensaje(destino: str, asunto: str, cuerpo: str) -> str:
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL_FROM
+    msg["To"] = destino
+    msg["Subject"] = asunto
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid()
+    msg.attach(MIMEText(cuerpo or "", "html"))
+    return msg.as_string()
+
+
+# ------------------- WORKER -------------------
+
+class ColaCorreo:
+    def __init__(self, asincrona: bool = True, tam_lote: int = 50, intervalo: float = 5.0):
+        self.asincrona = asincrona
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.modo_prueba = False
+        self.smtp = ConexionSMTP()
+        self.limite = LimiteDominio(CORREO_LIMITE_DOMINIO)
+        self._hilo = None
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+        self._lock_envio = threading.Lock()
+        self._lock = threading.Lock()
+        self._metricas = {
+            "encolados": 0,
+            "enviados": 0,
+            "reintentos": 0,
+            "fallidos": 0,
+            "postergados_por_limite": 0,
+            "reprogramados_por_caida": 0,
+            "lotes": 0,
+        }
+
+    @property
+    def activa(self) -> bool:
+        return self._hilo is not None and self._hilo.is_alive()
+
+    # ------------------- CICLO DE VIDA -------------------
+    def iniciar(self):
+        if not self.asincrona or self.modo_prueba or self.activa:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._worker, name="cola-correo", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 10.0):
+        """Detiene el worker; lo pendiente queda en la tabla para el próximo arranque."""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+        with self._lock_envio:
+            self.smtp.cerrar()
+
+    def activar_modo_prueba(self):
+        """Sin worker ni envío en línea: los correos quedan PENDIENTE hasta llamar a drenar()."""
+        self.detener()
+        self.modo_prueba = True
+
+    def despertar(self, db: Session = None):
+        """Aviso de correos nuevos (después del commit que los encoló)."""
+        if self.activa:
+            self._despertar.set()
+        elif not self.asincrona and not self.modo_prueba:
+            self.drenar(db)
+
+    def drenar(self, db: Session = None) -> int:
+        """Procesa en el hilo actual todos los correos vencidos. Devuelve cuántos procesó."""
+        total = 0
+        while True:
+            procesados = self.procesar_lote(db)
+            if not procesados:
+                return total
+            total += procesados
+
+    def _worker(self):
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                procesados = self.procesar_lote()
+            except Exception as e:
+                print(f"[Correo] Error procesando la cola: {e}")
+                procesados = 0
+            if not procesados:
+                with self._lock_envio:
+                    self.smtp.cerrar_si_inactiva(CORREO_SMTP_INACTIVIDAD)
+                self._despertar.wait(self.intervalo)
+
+    # ------------------- ENVÍO -------------------
+    def procesar_lote(self, db: Session = None) -> int:
+        from app.database.session import SessionLocal
+        propia = db is None
+        if propia:
+            db = SessionLocal()
+        try:
+            ahora = datetime.now()
+            L = NotificacionEmailLog
+            filas = db.execute(
+                select(L.id_log, L.email_destino, L.asunto, L.cuerpo, L.intentos)
+                .where(L.estado.in_(("PENDIENTE", "ENVIANDO")), L.proximo_intento <= ahora)
+                .order_by(L.proximo_intento, L.id_log)
+                .limit(self.tam_lote)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not filas:
+                db.rollback()
+                return 0
+            ids = [f.id_log for f in filas]
+            vence = self._arrendar(db, ids)
+            # Lo más que puede tardar un envío: conexión, envío, reconexión y reenvío
+            margen = 4 * self.smtp.timeout
+
+            def renovar():
+                nonlocal vence
+                if time.monotonic() > vence - margen:
+                    vence = self._arrendar(db, ids)
+
+            with self._lock_envio:
+                resultados = self._enviar_lote(filas, renovar)
+            db.execute(update(L), resultados)
+            db.commit()
+            self.sumar("lotes")
+            return len(filas)
+        finally:
+            if propia:
+                db.close()
+
+    def _arrendar(self, db: Session, ids) -> float:
+        """Marca los correos ENVIANDO por CORREO_ARRENDAMIENTO: si este proceso cae, otro los retoma al vencer."""
+        db.execute(
+            update(NotificacionEmailLog)
+            .where(NotificacionEmailLog.id_log.in_(ids))
+            .values(estado="ENVIANDO", proximo_intento=datetime.now() + timedelta(seconds=CORREO_ARRENDAMIENTO))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return time.monotonic() + CORREO_ARRENDAMIENTO
+
+    def _enviar_lote(self, filas, renovar=None):
+        resultados = []
+        caida = None  # error de conexión: el resto del lote se reprograma sin intentarlo
+        for fila in filas:
+            resultado = {"id_log": fila.id_log, "estado": "PENDIENTE", "fecha_envio": None,
+                         "intentos": fila.intentos, "proximo_intento": None, "error": None}
+            if caida:
+                # No se intentó enviar: se reprograma sin contar intento
+                resultado.update(proximo_intento=datetime.now() + timedelta(seconds=_backoff(1)), error=str(caida)[:500])
+                self.sumar("reprogramados_por_caida")
+                resultados.append(resultado)
+                continue
+            dominio = (fila.email_destino or "").rpartition("@")[2].lower()
+            espera = self.limite.reservar(dominio)
+            if espera:
+                resultado["proximo_intento"] = datetime.now() + timedelta(seconds=espera)
+                self.sumar("postergados_por_limite")
+                resultados.append(resultado)
+                continue
+            if renovar is not None:
+                renovar()
+            try:
+                self.smtp.enviar(EMAIL_FROM, fila.email_destino, _mensaje(fila.email_destino, fila.asunto, fila.cuerpo))
+                resultado.update(estado="ENVIADO", fecha_envio=datetime.now(), intentos=fila.intentos + 1, cuerpo=None)
+                self.sumar("enviados")
+            except Exception as e:
+                if _es_error_conexion(e):
+                    caida = e
+                    self.smtp.cerrar()
+                intentos = fila.intentos + 1
+                resultado.update(intentos=intentos, error=str(e)[:500])
+                if _es_permanente(e) or intentos >= CORREO_MAX_INTENTOS:
+                    resultado.update(estado="FALLIDO", cuerpo=None)
+                    self.sumar("fallidos")
+                else:
+                    resultado["proximo_intento"] = datetime.now() + timedelta(seconds=_backoff(intentos))
+                    self.sumar("reintentos")
+            resultados.append(resultado)
+        if caida:
+            print(f"[Correo] Servidor SMTP no disponible, lote reprogramado: {caida}")
+        return resultados
+
+    # ------------------- MÉTRICAS -------------------
+    def sumar(self, clave: str, cantidad: int = 1):
+        with self._lock:
+            self._metricas[clave] += cantidad
+
+    def metricas(self, db: Session = None) -> dict:
+        with self._lock:
+            datos = dict(self._metricas)
+        datos["conexiones_smtp"] = self.smtp.conexiones
+        datos["worker_vivo"] = self.activa
+        datos["modo_prueba"] = self.modo_prueba
+        if db is not None:
+            datos["por_estado"] = dict(db.execute(
+                select(NotificacionEmailLog.estado, func.count()).group_by(NotificacionEmailLog.estado)
+            ).all())
+        return datos
+
+
+cola_correo = ColaCorreo(asincrona=CORREO_ASINCRONO, tam_lote=CORREO_TAM_LOTE, intervalo=CORREO_INTERVALO)
@@ -1,6 +1,6 @@
 # models.py para notificaciones
 
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, TIMESTAMP, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
@@ -9,6 +9,11 @@ from app.database.base import Base
 # --- MODELO EXTENDIDO DE NOTIFICACION ---
 class Notificacion(Base):
     __tablename__ = "notificacion"
+    __table_args__ = (
+        Index('ix_notificacion_usuario_fecha_id', 'id_usuario', 'fecha_creacion', 'id_notificacion'),
+        Index('ix_notificacion_microempresa_fecha_id', 'id_microempresa', 'fecha_creacion', 'id_notificacion'),
+        Index('ix_notificacion_usuario_id', 'id_usuario', 'id_notificacion'),
+    )
     id_notificacion = Column(Integer, primary_key=True, index=True)
     id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa"), nullable=False)
     id_usuario = Column(Integer, ForeignKey("usuario.id_usuario"), nullable=False)
@@ -20,6 +25,14 @@ class Notificacion(Base):
     fecha_creacion = Column(TIMESTAMP, nullable=False)
 
 
+# --- Contador de no leídas por usuario (app/notificaciones/contador.py) ---
+class ContadorNoLeidas(Base):
+    __tablename__ = "notificacion_contador"
+    id_usuario = Column(Integer, ForeignKey("usuario.id_usuario", ondelete="CASCADE"), primary_key=True)
+    no_leidas = Column(Integer, nullable=False, default=0)
+    fecha_actualizacion = Column(TIMESTAMP, nullable=False)
+
+
 # --- NUEVO: PreferenciaNotificacion ---
 class PreferenciaNotificacion(Base):
     __tablename__ = "preferencia_notificacion"
@@ -38,6 +51,9 @@ class PreferenciaNotificacion(Base):
 # --- NUEVO: EventoSistema ---
 class EventoSistema(Base):
     __tablename__ = "evento_sistema"
+    __table_args__ = (
+        Index('ix_evento_sistema_microempresa_fecha_id', 'id_microempresa', 'fecha_evento', 'id_evento'),
+    )
     id_evento = Column(Integer, primary_key=True, index=True)
     id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa"), nullable=False)
     tipo_evento = Column(String(50), nullable=False)
@@ -62,12 +78,22 @@ class NotificacionPreferencia(Base):
 
 
 # --- NUEVO: Modelo para notificacion_email_log ---
+# También es la cola de correo saliente (ver notificaciones.correo)
 class NotificacionEmailLog(Base):
     __tablename__ = "notificacion_email_log"
+    __table_args__ = (
+        Index('ix_notificacion_email_log_estado_proximo', 'estado', 'proximo_intento'),
+    )
     id_log = Column(Integer, primary_key=True, index=True)
-    id_notificacion = Column(Integer, ForeignKey("notificacion.id_notificacion"), nullable=False)
+    id_notificacion = Column(Integer, ForeignKey("notificacion.id_notificacion"), nullable=True)
     email_destino = Column(String(150))
-    estado = Column(String(20))
+    estado = Column(String(20))  # PENDIENTE, ENVIANDO, ENVIADO, FALLIDO
     fecha_envio = Column(TIMESTAMP)
+    asunto = Column(String(200))
+    cuerpo = Column(Text)
+    intentos = Column(Integer, default=0, nullable=False)
+    proximo_intento = Column(TIMESTAMP)
+    error = Column(Text)
+    fecha_creacion = Column(TIMESTAMP)
 
     notificacion = relationship("Notificacion", backref="email_logs")
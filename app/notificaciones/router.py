@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database.session import get_db
 from . import schemas, service
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
+from app.core.dependencies import solo_superadmin
 
 router = APIRouter(prefix="/notificaciones", tags=["Notificaciones"])
 
@@ -12,10 +16,10 @@ def crear_notificacion(notificacion: schemas.NotificacionCreate, db: Session = D
     return service.crear_notificacion(db, notificacion)
 
 @router.get("/", response_model=list[schemas.NotificacionResponse])
-def listar_notificaciones(id_usuario: int = None, db: Session = Depends(get_db)):
+def listar_notificaciones(response: Response, id_usuario: int = None, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     if id_usuario:
-        return service.listar_por_usuario(db, id_usuario)
-    return service.listar_notificaciones(db)
+        return responder_pagina(response, service.listar_por_usuario(db, id_usuario, pagina.cursor, pagina.limit))
+    return responder_pagina(response, service.listar_notificaciones(db, pagina.cursor, pagina.limit))
 
 @router.patch("/{id}/leer", response_model=schemas.NotificacionResponse)
 def marcar_leida(id: int, db: Session = Depends(get_db)):
@@ -26,11 +30,8 @@ def marcar_leida(id: int, db: Session = Depends(get_db)):
 
 @router.delete("/{id}")
 def eliminar_notificacion(id: int, db: Session = Depends(get_db)):
-    notif = db.query(service.models.Notificacion).filter_by(id_notificacion=id).first()
-    if not notif:
+    if not service.eliminar_notificacion(db, id):
         raise HTTPException(status_code=404, detail="Notificación no encontrada")
-    db.delete(notif)
-    db.commit()
     return {"ok": True}
 
 # ------------------- PREFERENCIAS -------------------
@@ -51,8 +52,72 @@ def cambiar_estado_preferencia(id: int, estado: bool, db: Session = Depends(get_
 
 # ------------------- EVENTOS -------------------
 @router.get("/eventos", response_model=list[schemas.EventoSistemaResponse])
-def listar_eventos(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_eventos_microempresa(db, id_microempresa)
+def listar_eventos(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_eventos_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
+
+@router.get("/eventos/metricas")
+def metricas_bus_eventos(user=Depends(solo_superadmin)):
+    """Profundidad de cola, esperas y contadores del bus de eventos (backpressure)."""
+    from .bus import bus
+    return bus.metricas()
+
+@router.get("/correo/metricas")
+def metricas_cola_correo(db: Session = Depends(get_db), user=Depends(solo_superadmin)):
+    """Enviados, reintentos, fallidos, conexiones SMTP abiertas y correos por estado en la cola."""
+    from .correo import cola_correo
+    return cola_correo.metricas(db)
+
+@router.get("/ws/metricas")
+def metricas_websocket(user=Depends(solo_superadmin)):
+    """Conexiones y usuarios conectados, profundidad de las colas de salida y clientes lentos desconectados."""
+    from .websocket import hub
+    return hub.metricas()
+
+@router.get("/contador/metricas")
+def metricas_contador_no_leidas(user=Depends(solo_superadmin)):
+    """Aciertos de la cache de contadores y resultado de las reconciliaciones."""
+    from .contador import reconciliador
+    return reconciliador.metricas()
+
+@router.get("/stream")
+async def stream_notificaciones(request: Request):
+    """
+    Alternativa SSE al WebSocket (text/event-stream). Token en `Authorization: Bearer` o en
+    ?token= (EventSource no envía cabeceras); reposición con Last-Event-ID o ?last_event_id=.
+    """
+    from .stream import autenticar, ultimo_id_recibido, reponer, CanalSSE, formato_sse
+    from .websocket import hub
+    id_usuario = await autenticar(request)
+    desde_id = ultimo_id_recibido(request)
+    canal = CanalSSE()
+    conexion = await hub.conectar(id_usuario, canal, pausada=desde_id is not None)
+
+    async def vigilar_desconexion():
+        # Sin mensajes no hay envíos que fallen: el cierre del cliente se detecta leyendo
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        await canal.close()
+
+    async def eventos():
+        vigia = asyncio.ensure_future(vigilar_desconexion())
+        try:
+            if desde_id is not None:
+                id_repuesto = desde_id
+                async for id_notificacion, trama in reponer(id_usuario, desde_id):
+                    yield formato_sse(trama)
+                    if id_notificacion is not None:
+                        id_repuesto = id_notificacion
+                hub.reanudar(conexion, id_repuesto)
+            while True:
+                trama = await canal.cola.get()
+                if trama is None:
+                    return  # El hub cerró la conexión (cliente lento)
+                yield formato_sse(trama)
+        finally:
+            vigia.cancel()
+            hub.desconectar(conexion)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.put("/{id_notificacion}", response_model=schemas.NotificacionResponse)
 def actualizar_notificacion(id_notificacion: int, notificacion: schemas.NotificacionUpdate, db: Session = Depends(get_db)):
@@ -69,20 +134,26 @@ def marcar_leida(id_notificacion: int, db: Session = Depends(get_db)):
     return result
 
 @router.get("/", response_model=list[schemas.NotificacionResponse])
-def listar_notificaciones(db: Session = Depends(get_db)):
-    return service.listar_notificaciones(db)
+def listar_notificaciones(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_notificaciones(db, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.NotificacionResponse])
-def listar_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_por_microempresa(db, id_microempresa)
+def listar_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/usuario/{id_usuario}", response_model=list[schemas.NotificacionResponse])
-def listar_por_usuario(id_usuario: int, db: Session = Depends(get_db)):
-    return service.listar_por_usuario(db, id_usuario)
+def listar_por_usuario(id_usuario: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_por_usuario(db, id_usuario, pagina.cursor, pagina.limit))
 
 @router.get("/usuario/{id_usuario}/no-leidas", response_model=list[schemas.NotificacionResponse])
-def listar_no_leidas_por_usuario(id_usuario: int, db: Session = Depends(get_db)):
-    return service.listar_no_leidas_por_usuario(db, id_usuario)
+def listar_no_leidas_por_usuario(id_usuario: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_no_leidas_por_usuario(db, id_usuario, pagina.cursor, pagina.limit))
+
+@router.get("/usuario/{id_usuario}/no-leidas/count")
+def contar_no_leidas_por_usuario(id_usuario: int, db: Session = Depends(get_db)):
+    """Total de no leídas desde el contador en memoria (para el badge), sin cargar las filas."""
+    from .contador import obtener_no_leidas
+    return {"id_usuario": id_usuario, "no_leidas": obtener_no_leidas(db, id_usuario)}
 
 @router.get("/{id_notificacion}", response_model=schemas.NotificacionResponse)
 def obtener_notificacion(id_notificacion: int, db: Session = Depends(get_db)):
@@ -92,8 +163,8 @@ def obtener_notificacion(id_notificacion: int, db: Session = Depends(get_db)):
     return notificacion
 
 @router.get("/microempresas/{id_microempresa}/notificaciones", response_model=list[schemas.NotificacionResponse])
-def listar_notificaciones_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_notificaciones_microempresa(db, id_microempresa)
+def listar_notificaciones_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_notificaciones_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.patch("/notificaciones/{id_notificacion}/leida", response_model=schemas.NotificacionResponse)
 def marcar_notificacion_leida(id_notificacion: int, db: Session = Depends(get_db)):
@@ -92,10 +92,14 @@ class NotificacionPreferenciaResponse(NotificacionPreferenciaBase):
 
 # --- NUEVO: Schemas para notificacion_email_log ---
 class NotificacionEmailLogBase(BaseModel):
-    id_notificacion: int
+    id_notificacion: Optional[int] = None
     email_destino: Optional[str] = None
     estado: Optional[str] = None
     fecha_envio: Optional[datetime] = None
+    asunto: Optional[str] = None
+    intentos: Optional[int] = 0
+    proximo_intento: Optional[datetime] = None
+    error: Optional[str] = None
 
 class NotificacionEmailLogCreate(NotificacionEmailLogBase):
     pass
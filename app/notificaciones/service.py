@@ -1,4 +1,11 @@
-from app.core.email_utils import enviar_email
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import insert, select, union, and_
+from . import models, schemas
+from .websocket import hub
+from .stream import trama_notificacion
+from .contador import sumar_no_leidas
+from datetime import datetime, timedelta
+from app.core.paginacion import paginar
 from app.users.models import Usuario
 from app.microempresas.models import Microempresa
 from sqlalchemy.exc import SQLAlchemyError
@@ -11,7 +18,13 @@ def generar_evento(tipo_evento: str, mensaje: str, id_microempresa: int, referen
     - Crea notificaciones internas y por email según preferencias
     - Envía email usando Gmail SMTP si corresponde
     - Usa transacción DB
+    Si el bus de eventos está activo, solo se encola el evento y el fan-out lo hace un worker
+    fuera del request (ver notificaciones.bus).
     """
+    from .bus import bus, EventoPendiente
+    if bus.activo:
+        bus.publicar(EventoPendiente(tipo_evento, mensaje, id_microempresa, referencia_id, datetime.now()))
+        return None
     if db is None:
         raise Exception("Se requiere una sesión de base de datos (db)")
     # Validar microempresa
@@ -19,7 +32,6 @@ def generar_evento(tipo_evento: str, mensaje: str, id_microempresa: int, referen
     if not micro:
         raise Exception("Microempresa no encontrada")
     # Validar duplicidad de evento (ejemplo: no registrar dos veces el mismo evento para la misma referencia en 1 minuto)
-    from datetime import datetime, timedelta
     hace_un_minuto = datetime.now() - timedelta(minutes=1)
     evento_existente = db.query(models.EventoSistema).filter_by(
         id_microempresa=id_microempresa,
@@ -39,25 +51,18 @@ def generar_evento(tipo_evento: str, mensaje: str, id_microempresa: int, referen
     try:
         db.add(evento)
         db.flush()  # Obtener id_evento
-        # Buscar usuarios de la microempresa (admins y vendedores)
-        from app.users.models import AdminMicroempresa, Vendedor
-        admin_ids = db.query(AdminMicroempresa.id_usuario).filter_by(id_microempresa=id_microempresa).all()
-        vendedor_ids = db.query(Vendedor.id_usuario).filter_by(id_microempresa=id_microempresa).all()
-        ids = [id for (id,) in admin_ids + vendedor_ids]
-        usuarios = db.query(Usuario).filter(Usuario.id_usuario.in_(ids)).all()
-        for usuario in usuarios:
-            if not usuario:
-                continue
-            # ARREGLO PARCIAL: Siempre crear notificación IN_APP para todos los usuarios
-            crear_notificacion_usuario(
-                db=db,
-                id_microempresa=id_microempresa,
-                id_usuario=usuario.id_usuario,
-                tipo_evento=tipo_evento,
-                canal="IN_APP",
-                mensaje=mensaje
-            )
+        # Fan-out masivo: destinatarios, deduplicación e inserción en 2 sentencias
+        creadas = crear_notificaciones_masivas(
+            db=db,
+            id_microempresa=id_microempresa,
+            tipo_evento=tipo_evento,
+            canal="IN_APP",
+            mensaje=mensaje
+        )
+        fecha = evento.fecha_evento
         db.commit()
+        for id_notificacion, id_usuario in creadas:
+            _notificar_websocket(id_usuario, id_notificacion, tipo_evento, mensaje, fecha)
         return evento
     except SQLAlchemyError as e:
         db.rollback()
@@ -90,49 +95,148 @@ def crear_notificacion_usuario(db: Session, id_microempresa: int, id_usuario: in
     )
     db.add(notif)
     db.flush()
-    # WebSocket: notificar en tiempo real si es IN_APP
+    sumar_no_leidas(db, {id_usuario: 1})
+    # WebSocket: notificar en tiempo real si es IN_APP, cuando el id ya esté confirmado
     if canal == "IN_APP":
-        try:
-            from .websocket import notificar_usuario
-            import asyncio
-            loop = None
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                pass
-            if loop and loop.is_running():
-                loop.create_task(notificar_usuario(id_usuario, mensaje))
-            else:
-                asyncio.run(notificar_usuario(id_usuario, mensaje))
-        except Exception as e:
-            print(f"[WebSocket] Error al notificar usuario {id_usuario}: {e}")
+        from app.database.session import al_confirmar
+        id_notificacion, fecha = notif.id_notificacion, notif.fecha_creacion
+        al_confirmar(db, lambda _: _notificar_websocket(id_usuario, id_notificacion, tipo_evento, mensaje, fecha))
     return notif
 
 
+def crear_notificaciones_masivas(db: Session, id_microempresa: int, tipo_evento: str, canal: str, mensaje: str, ids_usuario=None):
+    """
+    Crea la misma notificación para muchos usuarios con un costo constante en sentencias:
+    1. Un SELECT calcula los destinatarios (admins y vendedores de la microempresa, o ids_usuario)
+       y descarta con un anti-join a quienes ya tienen una notificación igual reciente.
+    2. Un INSERT multi-fila crea todas las notificaciones y devuelve sus ids.
+    No hace commit. Devuelve [(id_notificacion, id_usuario), ...] para el push por WebSocket.
+    """
+    from app.users.models import AdminMicroempresa, Vendedor
+    hace_un_minuto = datetime.now() - timedelta(minutes=1)
+    if ids_usuario is None:
+        destinatarios = union(
+            select(AdminMicroempresa.id_usuario.label("id_usuario")).where(AdminMicroempresa.id_microempresa == id_microempresa),
+            select(Vendedor.id_usuario.label("id_usuario")).where(Vendedor.id_microempresa == id_microempresa)
+        ).subquery()
+    else:
+        destinatarios = select(Usuario.id_usuario.label("id_usuario")).where(Usuario.id_usuario.in_(list(ids_usuario))).subquery()
+    reciente = aliased(models.Notificacion)
+    pendientes = db.execute(
+        select(destinatarios.c.id_usuario)
+        .join(Usuario, Usuario.id_usuario == destinatarios.c.id_usuario)
+        .outerjoin(reciente, and_(
+            reciente.id_usuario == destinatarios.c.id_usuario,
+            reciente.id_microempresa == id_microempresa,
+            reciente.tipo_evento == tipo_evento,
+            reciente.canal == canal,
+            reciente.fecha_creacion > hace_un_minuto
+        ))
+        .where(reciente.id_notificacion.is_(None))
+        .distinct()
+        .order_by(destinatarios.c.id_usuario)
+    ).scalars().all()
+    if not pendientes:
+        return []
+    ahora = datetime.now()
+    filas = [{
+        "id_microempresa": id_microempresa,
+        "id_usuario": id_usuario,
+        "tipo_evento": tipo_evento,
+        "canal": canal,
+        "mensaje": mensaje,
+        "leido": False,
+        "enviado": (canal == "EMAIL"),
+        "fecha_creacion": ahora
+    } for id_usuario in pendientes]
+    resultado = db.execute(
+        insert(models.Notificacion)
+        .values(filas)
+        .returning(models.Notificacion.id_notificacion, models.Notificacion.id_usuario)
+    )
+    creadas = [tuple(fila) for fila in resultado.all()]
+    sumar_no_leidas(db, {id_usuario: 1 for _, id_usuario in creadas})
+    return creadas
+
+
+def _notificar_websocket(id_usuario: int, id_notificacion: int, tipo_evento: str, mensaje: str, fecha: datetime = None):
+    """Publica la trama de la notificación al usuario (en cualquier worker); desde otro hilo pasa al loop con run_coroutine_threadsafe."""
+    try:
+        hub.publicar(id_usuario, trama_notificacion(id_notificacion, tipo_evento, mensaje, fecha), id_notificacion)
+    except Exception as e:
+        print(f"[WebSocket] Error al notificar usuario {id_usuario}: {e}")
+
+
+def procesar_lote_eventos(db: Session, eventos):
+    """
+    Procesa un lote de eventos encolados por el bus (notificaciones.bus):
+    - Una consulta para validar microempresas y otra para descartar eventos duplicados recientes
+    - Inserción masiva de los eventos del lote
+    - Fan-out de cada evento con crear_notificaciones_masivas (costo constante por evento)
+    - Un solo commit para todo el lote
+    Devuelve la cantidad de notificaciones creadas.
+    """
+    if not eventos:
+        return 0
+    hace_un_minuto = datetime.now() - timedelta(minutes=1)
+    ids_micro = {ev.id_microempresa for ev in eventos}
+    micro_validas = {
+        id_micro for (id_micro,) in
+        db.query(Microempresa.id_microempresa).filter(Microempresa.id_microempresa.in_(ids_micro)).all()
+    }
+    recientes = set(
+        db.query(models.EventoSistema.id_microempresa, models.EventoSistema.tipo_evento, models.EventoSistema.referencia_id)
+        .filter(
+            models.EventoSistema.id_microempresa.in_(micro_validas),
+            models.EventoSistema.fecha_evento > hace_un_minuto
+        ).all()
+    )
+    nuevos = []
+    for ev in eventos:
+        clave = (ev.id_microempresa, ev.tipo_evento, ev.referencia_id)
+        if ev.id_microempresa not in micro_validas or clave in recientes:
+            continue  # Microempresa inexistente o evento duplicado reciente
+        recientes.add(clave)
+        nuevos.append(ev)
+    if not nuevos:
+        return 0
+    creadas = []
+    try:
+        db.execute(insert(models.EventoSistema), [{
+            "id_microempresa": ev.id_microempresa,
+            "tipo_evento": ev.tipo_evento,
+            "referencia_id": ev.referencia_id,
+            "descripcion": ev.mensaje,
+            "fecha_evento": ev.fecha
+        } for ev in nuevos])
+        for ev in nuevos:
+            for id_notificacion, id_usuario in crear_notificaciones_masivas(
+                db=db,
+                id_microempresa=ev.id_microempresa,
+                tipo_evento=ev.tipo_evento,
+                canal="IN_APP",
+                mensaje=ev.mensaje
+            ):
+                creadas.append((id_usuario, id_notificacion, ev.tipo_evento, ev.mensaje, ev.fecha))
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    for notificacion in creadas:
+        _notificar_websocket(*notificacion)
+    return len(creadas)
+
+
 def enviar_email_notificacion(db: Session, usuario, asunto: str, mensaje: str, id_evento: int):
     """
-    Envía un correo de notificación y registra el log.
+    Encola un correo de notificación (la fila de notificacion_email_log es el log y la cola).
+    Se envía cuando el llamador confirma la transacción.
     """
     if not usuario.email:
         return False
-    exito = enviar_email(usuario.email, asunto, mensaje)
-    # Registrar log
-    from .models import NotificacionEmailLog
-    from datetime import datetime
-    log = NotificacionEmailLog(
-        id_notificacion=None,  # Puede asociarse si se requiere
-        email_destino=usuario.email,
-        estado="ENVIADO" if exito else "FALLIDO",
-        fecha_envio=datetime.now()
-    )
-    db.add(log)
-    db.flush()
-    return exito
-from sqlalchemy.orm import Session
-from . import models, schemas
-from .websocket import notificar_usuario
-import asyncio
-from datetime import datetime
+    from .correo import encolar_correo
+    encolar_correo(db, usuario.email, asunto, mensaje)
+    return True
 
 def crear_notificacion(db: Session, notificacion: schemas.NotificacionCreate):
     import sys
@@ -143,27 +247,18 @@ def crear_notificacion(db: Session, notificacion: schemas.NotificacionCreate):
     db_notificacion = models.Notificacion(**notificacion_data)
     db_notificacion.fecha_creacion = datetime.now()
     db.add(db_notificacion)
+    db.flush()
+    if not db_notificacion.leido:
+        sumar_no_leidas(db, {db_notificacion.id_usuario: 1})
     db.commit()
     db.refresh(db_notificacion)
     print(f"[Notificaciones] Notificación creada con id {db_notificacion.id_notificacion}")
     # Enviar notificación por WebSocket si el usuario está conectado
     try:
-        mensaje = f"Nueva notificación: {db_notificacion.mensaje}"
-        print(f"[Notificaciones] Intentando enviar mensaje por WebSocket a usuario {db_notificacion.id_usuario}")
-        try:
-            import asyncio
-            loop = None
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                # No hay loop corriendo
-                pass
-            if loop and loop.is_running():
-                loop.create_task(notificar_usuario(db_notificacion.id_usuario, mensaje))
-            else:
-                asyncio.run(notificar_usuario(db_notificacion.id_usuario, mensaje))
-        except Exception as e:
-            print(f"[Notificaciones] Error al intentar enviar notificación por WebSocket: {e}", file=sys.stderr)
+        _notificar_websocket(
+            db_notificacion.id_usuario, db_notificacion.id_notificacion, db_notificacion.tipo_evento,
+            db_notificacion.mensaje, db_notificacion.fecha_creacion
+        )
     except Exception as e:
         print(f"[Notificaciones] Error general en notificación: {e}", file=sys.stderr)
     return db_notificacion
@@ -219,8 +314,9 @@ def registrar_evento(db: Session, evento: schemas.EventoSistemaCreate):
     db.refresh(db_evento)
     return db_evento
 
-def listar_eventos_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.EventoSistema).filter_by(id_microempresa=id_microempresa).order_by(models.EventoSistema.fecha_evento.desc()).all()
+def listar_eventos_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.EventoSistema).filter_by(id_microempresa=id_microempresa)
+    return paginar(consulta, models.EventoSistema.id_evento, models.EventoSistema.fecha_evento, cursor, limit)
 
 # ------------------- LOGICA DE NOTIFICACION AUTOMATICA -------------------
 def generar_notificaciones_por_evento(db: Session, id_microempresa: int, tipo_evento: str, referencia_id: int, descripcion: str):
@@ -254,6 +350,11 @@ def generar_notificaciones_por_evento(db: Session, id_microempresa: int, tipo_ev
             )
             db.add(notif)
             notificaciones_creadas.append(notif)
+    db.flush()
+    deltas = {}
+    for notif in notificaciones_creadas:
+        deltas[notif.id_usuario] = deltas.get(notif.id_usuario, 0) + 1
+    sumar_no_leidas(db, deltas)
     db.commit()
     return notificaciones_creadas
 
@@ -261,42 +362,69 @@ def actualizar_notificacion(db: Session, id_notificacion: int, notificacion: sch
     db_notificacion = db.query(models.Notificacion).filter(models.Notificacion.id_notificacion == id_notificacion).first()
     if not db_notificacion:
         return None
+    leido_antes = db_notificacion.leido
     for key, value in notificacion.dict(exclude_unset=True).items():
         setattr(db_notificacion, key, value)
+    if db_notificacion.leido != leido_antes:
+        db.flush()
+        sumar_no_leidas(db, {db_notificacion.id_usuario: -1 if db_notificacion.leido else 1})
     db.commit()
     db.refresh(db_notificacion)
     return db_notificacion
 
 def marcar_leida(db: Session, id_notificacion: int):
     db_notificacion = db.query(models.Notificacion).filter(models.Notificacion.id_notificacion == id_notificacion).first()
-    if db_notificacion:
+    if db_notificacion and not db_notificacion.leido:
         db_notificacion.leido = True
+        db.flush()
+        sumar_no_leidas(db, {db_notificacion.id_usuario: -1})
         db.commit()
     return db_notificacion
 
-def listar_notificaciones(db: Session):
-    return db.query(models.Notificacion).all()
+def eliminar_notificacion(db: Session, id_notificacion: int) -> bool:
+    db_notificacion = db.query(models.Notificacion).filter(models.Notificacion.id_notificacion == id_notificacion).first()
+    if not db_notificacion:
+        return False
+    db.delete(db_notificacion)
+    db.flush()
+    if not db_notificacion.leido:
+        sumar_no_leidas(db, {db_notificacion.id_usuario: -1})
+    db.commit()
+    return True
+
+def _paginar_notificaciones(consulta, cursor: str = None, limit: int = None):
+    return paginar(consulta, models.Notificacion.id_notificacion, models.Notificacion.fecha_creacion, cursor, limit)
 
-def listar_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Notificacion).filter(models.Notificacion.id_microempresa == id_microempresa).all()
+def listar_notificaciones(db: Session, cursor: str = None, limit: int = None):
+    return _paginar_notificaciones(db.query(models.Notificacion), cursor, limit)
 
-def listar_por_usuario(db: Session, id_usuario: int):
-    return db.query(models.Notificacion).filter(models.Notificacion.id_usuario == id_usuario).all()
+def listar_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Notificacion).filter(models.Notificacion.id_microempresa == id_microempresa)
+    return _paginar_notificaciones(consulta, cursor, limit)
 
-def listar_no_leidas_por_usuario(db: Session, id_usuario: int):
-    return db.query(models.Notificacion).filter(models.Notificacion.id_usuario == id_usuario, models.Notificacion.leido == False).all()
+def listar_por_usuario(db: Session, id_usuario: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Notificacion).filter(models.Notificacion.id_usuario == id_usuario)
+    return _paginar_notificaciones(consulta, cursor, limit)
 
-def listar_notificaciones_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Notificacion).filter(
+def listar_no_leidas_por_usuario(db: Session, id_usuario: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Notificacion).filter(models.Notificacion.id_usuario == id_usuario, models.Notificacion.leido == False)
+    return _paginar_notificaciones(consulta, cursor, limit)
+
+def listar_notificaciones_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Notificacion).filter(
         models.Notificacion.id_microempresa == id_microempresa
-    ).order_by(models.Notificacion.fecha_creacion.desc()).all()
+    )
+    return _paginar_notificaciones(consulta, cursor, limit)
 
 def marcar_notificacion_leida(db: Session, id_notificacion: int):
     notificacion = db.query(models.Notificacion).filter(models.Notificacion.id_notificacion == id_notificacion).first()
     if not notificacion:
         from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Notificación no encontrada")
-    notificacion.leido = True
+    if not notificacion.leido:
+        notificacion.leido = True
+        db.flush()
+        sumar_no_leidas(db, {notificacion.id_usuario: -1})
     db.commit()
     db.refresh(notificacion)
     return notificacion
\ No newline at end of file
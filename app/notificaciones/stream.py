@@ -0,0 +1,162 @@
+"""
+Protocolo del stream de notificaciones, compartido por el WebSocket y el endpoint SSE.
+
+Tramas (JSON):
+- {"tipo": "notificacion", "id_notificacion": 41, "tipo_evento": "...", "mensaje": "...",
+   "fecha_creacion": "...", "leido": false}
+- {"tipo": "sincronizado", "ultimo_id": 41, "completo": true}: fin de la reposición
+- {"tipo": "no_leidas", "total": 3}: cambió el contador de no leídas (app/notificaciones/contador.py)
+- {"tipo": "ping"}: latido del hub
+
+Al conectar se exige el JWT (query `token` o cabecera `Authorization: Bearer`). Con
+`last_event_id` (o la cabecera Last-Event-ID de SSE) se reponen las notificaciones del usuario
+con id mayor, por páginas de WS_REPOSICION_PAGINA sobre el índice (id_usuario, id_notificacion)
+y hasta WS_REPOSICION_MAX; si quedan más, la trama "sincronizado" lleva completo=false y el
+cliente completa con el listado paginado.
+
+Durante la reposición la conexión ya está registrada en el hub pero en pausa: lo que llega en
+vivo se acumula y, al reanudar, se descartan las notificaciones que ya salieron en la reposición.
+"""
+import asyncio
+import json
+from datetime import datetime
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy import select
+from starlette.requests import HTTPConnection
+
+from app.core.config import WS_REPOSICION_PAGINA, WS_REPOSICION_MAX
+from . import models
+
+
+def trama_notificacion(id_notificacion: int, tipo_evento: str, mensaje: str, fecha_creacion: datetime = None, leido: bool = False) -> str:
+    return json.dumps({
+        "tipo": "notificacion",
+        "id_notificacion": id_notificacion,
+        "tipo_evento": tipo_evento,
+        "mensaje": mensaje,
+        "fecha_creacion": fecha_creacion.isoformat() if fecha_creacion else None,
+        "leido": leido,
+    }, ensure_ascii=False)
+
+
+def trama_no_leidas(total: int) -> str:
+    return json.dumps({"tipo": "no_leidas", "total": total})
+
+
+def _trama_sincronizado(ultimo_id: int, completo: bool) -> str:
+    return json.dumps({"tipo": "sincronizado", "ultimo_id": ultimo_id, "completo": completo})
+
+
+# ------------------- CONEXIÓN -------------------
+
+def _token(conexion: HTTPConnection):
+    token = conexion.query_params.get("token")
+    if token:
+        return token
+    esquema, _, valor = conexion.headers.get("authorization", "").partition(" ")
+    return valor.strip() if esquema.lower() == "bearer" and valor.strip() else None
+
+
+def _validar_token(token: str) -> int:
+    from app.core.dependencies import principal_desde_token
+    from app.database.session import SessionLocal
+    db = SessionLocal()
+    try:
+        return principal_desde_token(token, db).id_usuario
+    finally:
+        db.close()
+
+
+async def autenticar(conexion: HTTPConnection) -> int:
+    """id_usuario del JWT de la conexión; 401 si falta o no es válido."""
+    token = _token(conexion)
+    if not token:
+        raise HTTPException(status_code=401, detail="Falta el token")
+    # Puede consultar la base (usuario fuera de la cache): se hace en un hilo
+    return await anyio.to_thread.run_sync(_validar_token, token)
+
+
+def ultimo_id_recibido(conexion: HTTPConnection):
+    """last_event_id (query) o Last-Event-ID (cabecera que reenvía EventSource al reconectar)."""
+    valor = conexion.query_params.get("last_event_id") or conexion.headers.get("last-event-id")
+    try:
+        return int(valor) if valor not in (None, "") else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="last_event_id inválido")
+
+
+# ------------------- REPOSICIÓN -------------------
+
+def _pagina_reposicion(id_usuario: int, desde_id: int, limite: int):
+    from app.database.session import SessionLocal
+    db = SessionLocal()
+    try:
+        filas = db.execute(
+            select(
+                models.Notificacion.id_notificacion, models.Notificacion.tipo_evento, models.Notificacion.mensaje,
+                models.Notificacion.fecha_creacion, models.Notificacion.leido,
+            )
+            .where(models.Notificacion.id_usuario == id_usuario, models.Notificacion.id_notificacion > desde_id)
+            .order_by(models.Notificacion.id_notificacion)
+            .limit(limite)
+        ).all()
+    finally:
+        db.close()
+    return [(fila.id_notificacion, trama_notificacion(*fila)) for fila in filas]
+
+
+async def reponer(id_usuario: int, desde_id: int):
+    """
+    Genera (id_notificacion, trama) de las notificaciones posteriores a `desde_id` y al final
+    (None, trama "sincronizado"). Cada página se consulta en un hilo.
+    """
+    ultimo_id, enviadas, completo = desde_id, 0, True
+    while True:
+        limite = min(WS_REPOSICION_PAGINA, WS_REPOSICION_MAX - enviadas)
+        if limite <= 0:
+            completo = False
+            break
+        pagina = await anyio.to_thread.run_sync(_pagina_reposicion, id_usuario, ultimo_id, limite)
+        for id_notificacion, trama in pagina:
+            yield id_notificacion, trama
+        enviadas += len(pagina)
+        if pagina:
+            ultimo_id = pagina[-1][0]
+        if len(pagina) < limite:
+            # Si justo se alcanzó el máximo con la última página, puede que no queden más
+            break
+    if not completo:
+        completo = not await anyio.to_thread.run_sync(_pagina_reposicion, id_usuario, ultimo_id, 1)
+    yield None, _trama_sincronizado(ultimo_id, completo)
+
+
+# ------------------- SSE -------------------
+
+class CanalSSE:
+    """Adapta una respuesta SSE a la interfaz que usa el hub (accept / send_text / close)."""
+
+    def __init__(self):
+        # Tamaño 1: si el cliente no lee, el escritor del hub se bloquea y la cola del hub se llena
+        self.cola = asyncio.Queue(maxsize=1)
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, texto: str):
+        await self.cola.put(texto)
+
+    async def close(self, code: int = 1000):
+        while not self.cola.empty():
+            self.cola.get_nowait()
+        self.cola.put_nowait(None)
+
+
+def formato_sse(texto: str) -> str:
+    trama = json.loads(texto)
+    if trama.get("tipo") == "ping":
+        return ": ping\n\n"
+    if trama.get("tipo") == "notificacion":
+        return f"id: {trama['id_notificacion']}\nevent: notificacion\ndata: {texto}\n\n"
+    return f"event: {trama.get('tipo', 'mensaje')}\ndata: {texto}\n\n"
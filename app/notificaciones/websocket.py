@@ -1,61 +1,274 @@
-from fastapi import WebSocket, WebSocketDisconnect, APIRouter
-from typing import Dict, List
+"""
+Hub de WebSocket para las notificaciones en tiempo real.
+
+- Cada conexión tiene una cola de salida acotada (WS_COLA_MAX mensajes). Su tarea escritora
+  se crea solo mientras hay mensajes pendientes, así que una conexión inactiva no suma
+  tareas a la que ya lee del socket.
+- publicar() y broadcast() solo encolan: el fan-out no espera a ningún cliente. Un cliente
+  lento que llena su cola se desconecta (código 1013) en vez de frenar a los demás.
+- Un único latido cada WS_HEARTBEAT_INTERVALO segundos encola un ping en cada conexión
+  inactiva; si el envío falla, la conexión se elimina. Con WS_HEARTBEAT_TIMEOUT > 0 también
+  se cierran las conexiones que no enviaron nada en ese tiempo (clientes que responden el ping).
+- publicar() pasa por el backplane (app/notificaciones/backplane.py), que reparte el mensaje
+  a todos los workers; cada uno lo entrega a sus conexiones locales con _entregar().
+- publicar() se puede llamar desde código síncrono en otro hilo (requests síncronos, workers
+  del bus de eventos): se pasa al loop del hub con run_coroutine_threadsafe.
+- conectar(pausada=True) registra la conexión sin escribir mientras se reponen las
+  notificaciones perdidas; reanudar() descarta lo que ya salió en la reposición (protocolo
+  y autenticación en app/notificaciones/stream.py).
+- metricas() expone conexiones, usuarios, profundidad de colas y contadores.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Set
+
+from fastapi import WebSocket, WebSocketDisconnect, APIRouter, HTTPException
+
+from app.core.config import WS_COLA_MAX, WS_HEARTBEAT_INTERVALO, WS_HEARTBEAT_TIMEOUT
+from .backplane import Backplane, crear_backplane
+from .stream import autenticar, ultimo_id_recibido, reponer
 
 router = APIRouter()
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+PING = '{"tipo": "ping"}'
+
+
+class Conexion:
+    __slots__ = ("websocket", "id_usuario", "cola", "escritor", "ultima_actividad", "cerrada", "pausada", "id_repuesto")
+
+    def __init__(self, websocket: WebSocket, id_usuario: int, pausada: bool = False):
+        self.websocket = websocket
+        self.id_usuario = id_usuario
+        self.cola = deque()  # (id_notificacion o None, texto)
+        self.escritor = None
+        self.ultima_actividad = time.monotonic()
+        self.cerrada = False
+        self.pausada = pausada
+        self.id_repuesto = 0  # última notificación enviada por la reposición
+
+
+class HubNotificaciones:
+    def __init__(self, cola_max: int = 100, intervalo_latido: float = 30.0, timeout_latido: float = 0.0, backplane: Backplane = None):
+        self.backplane = backplane or crear_backplane("memoria")
+        self.cola_max = cola_max
+        self.intervalo_latido = intervalo_latido
+        self.timeout_latido = timeout_latido
+        self.conexiones: Dict[int, Set[Conexion]] = {}
+        self.loop = None
+        self._iniciado = False
+        self._latido = None
+        self._metricas = {
+            "conexiones_abiertas": 0,
+            "conexiones_cerradas": 0,
+            "mensajes_encolados": 0,
+            "mensajes_enviados": 0,
+            "errores_envio": 0,
+            "descartados_por_cola_llena": 0,
+            "cerradas_por_latido": 0,
+            "pings": 0,
+        }
+
+    # ------------------- CICLO DE VIDA -------------------
+    async def iniciar(self):
+        """Fija el loop del hub y arranca el backplane (startup de la app)."""
+        if self._iniciado and not self.loop.is_closed():
+            return
+        self._iniciado = True
+        self.loop = asyncio.get_running_loop()
+        await self.backplane.iniciar(self._entregar)
 
-    async def connect(self, id_usuario: int, websocket: WebSocket):
-        print(f"[WebSocket] Conexión entrante para usuario {id_usuario}")
+    async def detener(self):
+        if self._latido is not None:
+            self._latido.cancel()
+        await self.backplane.detener()
+        self._iniciado = False
+
+    # ------------------- CONEXIONES -------------------
+    async def conectar(self, id_usuario: int, websocket: WebSocket, pausada: bool = False) -> Conexion:
         await websocket.accept()
-        if id_usuario not in self.active_connections:
-            self.active_connections[id_usuario] = []
-        self.active_connections[id_usuario].append(websocket)
-        print(f"[WebSocket] Usuario {id_usuario} conectado. Total conexiones: {len(self.active_connections[id_usuario])}")
-
-    def disconnect(self, id_usuario: int, websocket: WebSocket):
-        print(f"[WebSocket] Desconectando usuario {id_usuario}")
-        if id_usuario in self.active_connections:
-            self.active_connections[id_usuario].remove(websocket)
-            if not self.active_connections[id_usuario]:
-                del self.active_connections[id_usuario]
-        print(f"[WebSocket] Usuario {id_usuario} desconectado. Conexiones restantes: {len(self.active_connections.get(id_usuario, []))}")
-
-    async def send_personal_message(self, message: str, id_usuario: int):
-        print(f"[WebSocket] Intentando enviar mensaje a usuario {id_usuario}. Conexiones activas: {list(self.active_connections.keys())}")
-        if id_usuario in self.active_connections:
-            for idx, connection in enumerate(self.active_connections[id_usuario]):
-                print(f"[WebSocket] Enviando mensaje a conexión #{idx+1} de usuario {id_usuario}: {message}")
-                try:
-                    await connection.send_text(message)
-                    print(f"[WebSocket] Mensaje enviado correctamente a conexión #{idx+1} de usuario {id_usuario}")
-                except Exception as e:
-                    print(f"[WebSocket] Error enviando mensaje a conexión #{idx+1} de usuario {id_usuario}: {e}")
+        await self.iniciar()
+        conexion = Conexion(websocket, id_usuario, pausada)
+        self.conexiones.setdefault(id_usuario, set()).add(conexion)
+        self._metricas["conexiones_abiertas"] += 1
+        if self._latido is None and self.intervalo_latido > 0:
+            self._latido = self.loop.create_task(self._latir())
+        return conexion
+
+    def desconectar(self, conexion: Conexion):
+        if conexion.cerrada:
+            return
+        conexion.cerrada = True
+        conexion.cola.clear()
+        conjunto = self.conexiones.get(conexion.id_usuario)
+        if conjunto is not None:
+            conjunto.discard(conexion)
+            if not conjunto:
+                del self.conexiones[conexion.id_usuario]
+        if conexion.escritor is not None and conexion.escritor is not asyncio.current_task():
+            conexion.escritor.cancel()
+        self._metricas["conexiones_cerradas"] += 1
+
+    def reanudar(self, conexion: Conexion, id_repuesto: int = 0):
+        """Fin de la reposición: envía lo acumulado, salvo las notificaciones con id <= id_repuesto."""
+        conexion.id_repuesto = id_repuesto
+        conexion.pausada = False
+        if conexion.cola and conexion.escritor is None and not conexion.cerrada:
+            conexion.escritor = self.loop.create_task(self._escribir(conexion))
+
+    def _cerrar(self, conexion: Conexion, codigo: int):
+        self.desconectar(conexion)
+
+        async def cerrar():
+            try:
+                await conexion.websocket.close(code=codigo)
+            except Exception:
+                pass
+
+        self.loop.create_task(cerrar())
+
+    # ------------------- PUBLICACIÓN -------------------
+    def _en_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def publicar(self, id_usuario, mensaje: str, id_notificacion: int = None):
+        """
+        Publica `mensaje` para todas las conexiones del usuario en todos los workers
+        (id_usuario None = todos). Se puede llamar desde cualquier hilo; devuelve la tarea o el
+        concurrent.futures.Future del envío, o None si el hub no se inició en este proceso.
+        """
+        if self.loop is None or self.loop.is_closed():
+            return None
+        envio = self.backplane.publicar(id_usuario, mensaje, id_notificacion)
+        if self._en_loop():
+            return self.loop.create_task(envio)
+        return asyncio.run_coroutine_threadsafe(envio, self.loop)
+
+    def broadcast(self, mensaje: str):
+        return self.publicar(None, mensaje)
+
+    def _entregar(self, id_usuario, mensaje: str, id_notificacion: int = None):
+        """Encola el mensaje en las conexiones de este proceso (lo llama el backplane, en el loop)."""
+        if id_usuario is None:
+            destinos = [conexion for conjunto in self.conexiones.values() for conexion in conjunto]
         else:
-            print(f"[WebSocket] No hay conexiones activas para usuario {id_usuario}")
+            destinos = list(self.conexiones.get(id_usuario, ()))
+        for conexion in destinos:
+            self._encolar(conexion, mensaje, id_notificacion)
 
-    async def broadcast(self, message: str):
-        for connections in self.active_connections.values():
-            for connection in connections:
-                await connection.send_text(message)
+    def _encolar(self, conexion: Conexion, mensaje: str, id_notificacion: int = None):
+        if conexion.cerrada:
+            return
+        if len(conexion.cola) >= self.cola_max:
+            # Cliente lento: se desconecta para no acumular memoria ni demorar a los demás
+            self._metricas["descartados_por_cola_llena"] += 1
+            self._cerrar(conexion, 1013)
+            return
+        conexion.cola.append((id_notificacion, mensaje))
+        self._metricas["mensajes_encolados"] += 1
+        if conexion.escritor is None and not conexion.pausada:
+            conexion.escritor = self.loop.create_task(self._escribir(conexion))
 
-manager = ConnectionManager()
+    async def _escribir(self, conexion: Conexion):
+        try:
+            while conexion.cola and not conexion.cerrada:
+                id_notificacion, mensaje = conexion.cola.popleft()
+                if id_notificacion is not None and id_notificacion <= conexion.id_repuesto:
+                    continue  # Ya salió en la reposición
+                await conexion.websocket.send_text(mensaje)
+                self._metricas["mensajes_enviados"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self._metricas["errores_envio"] += 1
+            self.desconectar(conexion)
+        finally:
+            conexion.escritor = None
 
-@router.websocket("/ws/notificaciones/{id_usuario}")
-async def websocket_endpoint(websocket: WebSocket, id_usuario: int):
-    print(f"[WebSocket] Endpoint iniciado para usuario {id_usuario}")
-    await manager.connect(id_usuario, websocket)
+    # ------------------- LATIDO -------------------
+    async def _latir(self):
+        try:
+            while self.conexiones:
+                await asyncio.sleep(self.intervalo_latido)
+                ahora = time.monotonic()
+                for conjunto in list(self.conexiones.values()):
+                    for conexion in list(conjunto):
+                        if self.timeout_latido and ahora - conexion.ultima_actividad > self.timeout_latido:
+                            self._metricas["cerradas_por_latido"] += 1
+                            self._cerrar(conexion, 1001)
+                        elif not conexion.cola and not conexion.pausada:
+                            self._metricas["pings"] += 1
+                            self._encolar(conexion, PING)
+        finally:
+            self._latido = None
+
+    # ------------------- MÉTRICAS -------------------
+    def metricas(self) -> dict:
+        profundidades = [len(c.cola) for conjunto in self.conexiones.values() for c in conjunto]
+        datos = dict(self._metricas)
+        datos.update(
+            conexiones=len(profundidades),
+            usuarios=len(self.conexiones),
+            cola_total=sum(profundidades),
+            cola_max=max(profundidades, default=0),
+            capacidad_cola=self.cola_max,
+            escritores_activos=sum(1 for conjunto in self.conexiones.values() for c in conjunto if c.escritor is not None),
+            **self.backplane.metricas(),
+        )
+        return datos
+
+
+hub = HubNotificaciones(
+    cola_max=WS_COLA_MAX,
+    intervalo_latido=WS_HEARTBEAT_INTERVALO,
+    timeout_latido=WS_HEARTBEAT_TIMEOUT,
+    backplane=crear_backplane(),
+)
+
+
+async def _atender(websocket: WebSocket, id_usuario_ruta: int = None):
     try:
+        id_usuario = await autenticar(websocket)
+        desde_id = ultimo_id_recibido(websocket)
+    except HTTPException:
+        await websocket.close(code=1008)  # Antes de aceptar: el handshake responde 403
+        return
+    if id_usuario_ruta is not None and id_usuario_ruta != id_usuario:
+        await websocket.close(code=1008)
+        return
+    conexion = await hub.conectar(id_usuario, websocket, pausada=desde_id is not None)
+    try:
+        if desde_id is not None:
+            id_repuesto = desde_id
+            async for id_notificacion, trama in reponer(id_usuario, desde_id):
+                await websocket.send_text(trama)
+                if id_notificacion is not None:
+                    id_repuesto = id_notificacion
+            hub.reanudar(conexion, id_repuesto)
         while True:
-            data = await websocket.receive_text()  # Mantener la conexión activa
-            print(f"[WebSocket] Mensaje recibido desde el cliente usuario {id_usuario}: {data}")
-    except WebSocketDisconnect:
-        print(f"[WebSocket] Desconexión detectada para usuario {id_usuario}")
-        manager.disconnect(id_usuario, websocket)
+            await websocket.receive_text()  # Mantener la conexión activa (el cliente puede responder el ping)
+            conexion.ultima_actividad = time.monotonic()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        hub.desconectar(conexion)
+
+
+@router.websocket("/ws/notificaciones")
+async def websocket_notificaciones(websocket: WebSocket):
+    """Stream del usuario del token: ?token=<JWT>&last_event_id=<id>."""
+    await _atender(websocket)
+
+
+@router.websocket("/ws/notificaciones/{id_usuario}")
+async def websocket_endpoint(websocket: WebSocket, id_usuario: int):
+    """Ruta anterior: el id de la ruta debe coincidir con el del token."""
+    await _atender(websocket, id_usuario)
+
 
 # Esta función debe llamarse desde el service de notificaciones cuando se registre una nueva notificación
-async def notificar_usuario(id_usuario: int, mensaje: str):
-    print(f"[WebSocket] notificar_usuario llamado para usuario {id_usuario} con mensaje: {mensaje}")
-    await manager.send_personal_message(mensaje, id_usuario)
+async def notificar_usuario(id_usuario: int, mensaje: str, id_notificacion: int = None):
+    hub.publicar(id_usuario, mensaje, id_notificacion)
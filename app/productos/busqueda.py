@@ -0,0 +1,217 @@
+"""
+Búsqueda de productos por relevancia (nombre, código, descripción y categoría).
+
+- PostgreSQL: pg_trgm (word_similarity, tolerante a errores de tipeo) + tsvector con
+  prefijos ('arr:*'), sobre los índices GIN de bd.sql.
+- Otros motores (SQLite en desarrollo): índice invertido en memoria por microempresa, con
+  prefijos por búsqueda binaria en el vocabulario y trigramas para errores de tipeo. Se
+  construye al primer uso, vive en una CacheTTL y se invalida con las escrituras de
+  productos y categorías.
+- En ambos se conserva la coincidencia por subcadena del nombre que tenía la búsqueda
+  anterior (ILIKE '%q%': "rroz" encuentra "Arroz"), con menos puntaje que las demás.
+
+Los resultados se ordenan por puntaje y se paginan por posición: el cursor lleva cuántos
+resultados ya se devolvieron (el orden por relevancia no tiene una clave estable para keyset).
+"""
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from sqlalchemy import select, func, or_, case, literal_column
+from sqlalchemy.orm import Session
+
+from app.core.cache import CacheTTL
+from app.core.config import BUSQUEDA_INDICE_TTL, BUSQUEDA_INDICE_MAX, BUSQUEDA_UMBRAL_SIMILITUD
+from app.core.paginacion import Pagina, codificar_cursor, decodificar_cursor
+from . import models
+
+# Peso de cada campo en el puntaje
+PESO_CODIGO = 4.0
+PESO_NOMBRE = 3.0
+PESO_CATEGORIA = 1.5
+PESO_DESCRIPCION = 1.0
+
+_SEPARADORES = re.compile(r"[^0-9a-zñ]+")
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes (la ñ se conserva)."""
+    texto = (texto or "").lower().replace("ñ", "\0")
+    texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return texto.replace("\0", "ñ")
+
+
+def tokens(texto: str):
+    return [t for t in _SEPARADORES.split(normalizar(texto)) if t]
+
+
+def _trigramas(token: str):
+    relleno = f"  {token} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+# ------------------- ÍNDICE EN MEMORIA -------------------
+
+class IndiceProductos:
+    """Índice invertido de los productos de una microempresa: token -> {id_producto: peso}."""
+
+    def __init__(self, filas):
+        self.activos = {}
+        self.postings = defaultdict(dict)
+        for id_producto, nombre, codigo, descripcion, categoria, estado in filas:
+            self.activos[id_producto] = bool(estado)
+            campos = (
+                (nombre, PESO_NOMBRE),
+                (categoria, PESO_CATEGORIA),
+                (descripcion, PESO_DESCRIPCION),
+                (codigo, PESO_CODIGO),
+            )
+            for valor, peso in campos:
+                for token in tokens(valor):
+                    self._agregar(token, id_producto, peso)
+        self.vocabulario = sorted(self.postings)
+        self.trigramas = defaultdict(set)
+        for token in self.vocabulario:
+            for trigrama in _trigramas(token):
+                self.trigramas[trigrama].add(token)
+
+    def _agregar(self, token, id_producto, peso):
+        actual = self.postings[token]
+        if peso > actual.get(id_producto, 0):
+            actual[id_producto] = peso
+
+    def _coincidencias(self, termino: str) -> dict:
+        """{token: factor}: 1.0 exacto, 0.8 prefijo, similitud de trigramas * 0.6 para errores de tipeo, 0.5 subcadena."""
+        resultado = {}
+        i = bisect_left(self.vocabulario, termino)
+        while i < len(self.vocabulario) and self.vocabulario[i].startswith(termino):
+            token = self.vocabulario[i]
+            resultado[token] = 1.0 if token == termino else 0.8
+            i += 1
+        if len(termino) >= 3:
+            trigramas_termino = _trigramas(termino)
+            comunes = Counter(t for tg in trigramas_termino for t in self.trigramas.get(tg, ()))
+            for token, n in comunes.items():
+                if token in resultado:
+                    continue
+                similitud = n / (len(trigramas_termino) + len(_trigramas(token)) - n)
+                if similitud >= BUSQUEDA_UMBRAL_SIMILITUD:
+                    resultado[token] = similitud * 0.6
+        for token in self.vocabulario:
+            if termino in token and token not in resultado:
+                resultado[token] = 0.5
+        return resultado
+
+    def buscar(self, texto: str, solo_activos: bool = True):
+        """Ids ordenados por puntaje; cada término de la búsqueda debe coincidir con algún campo."""
+        puntajes = None
+        for termino in tokens(texto):
+            por_producto = {}
+            for token, factor in self._coincidencias(termino).items():
+                for id_producto, peso in self.postings[token].items():
+                    valor = peso * factor
+                    if valor > por_producto.get(id_producto, 0):
+                        por_producto[id_producto] = valor
+            if puntajes is None:
+                puntajes = por_producto
+            else:
+                puntajes = {i: puntajes[i] + v for i, v in por_producto.items() if i in puntajes}
+            if not puntajes:
+                return []
+        if not puntajes:
+            return []
+        ids = (i for i in puntajes if self.activos[i] or not solo_activos)
+        return sorted(ids, key=lambda i: (-puntajes[i], -i))
+
+
+cache_indices = CacheTTL(max_items=BUSQUEDA_INDICE_MAX, ttl=BUSQUEDA_INDICE_TTL)
+
+
+def _filas_indice(db: Session, id_microempresa: int):
+    return db.execute(
+        select(
+            models.Producto.id_producto, models.Producto.nombre, models.Producto.codigo,
+            models.Producto.descripcion, models.Categoria.nombre, models.Producto.estado,
+        )
+        .outerjoin(models.Categoria, models.Categoria.id_categoria == models.Producto.id_categoria)
+        .where(models.Producto.id_microempresa == id_microempresa)
+    ).all()
+
+
+def obtener_indice(db: Session, id_microempresa: int) -> IndiceProductos:
+    indice = cache_indices.obtener(id_microempresa)
+    if indice is None:
+        version = cache_indices.version(id_microempresa)
+        indice = IndiceProductos(_filas_indice(db, id_microempresa))
+        cache_indices.guardar(id_microempresa, indice, version)
+    return indice
+
+
+def invalidar_indice_busqueda(id_microempresa: int):
+    cache_indices.invalidar(id_microempresa)
+
+
+# ------------------- POSTGRESQL -------------------
+
+# Mismas expresiones que los índices de bd.sql (el planner solo los usa si coinciden)
+_NOMBRE = func.lower(models.Producto.nombre)
+_CODIGO = func.lower(models.Producto.codigo)
+_CATEGORIA = func.lower(models.Categoria.nombre)
+_DOCUMENTO = literal_column(
+    "to_tsvector('simple', coalesce(producto.nombre, '') || ' ' || coalesce(producto.descripcion, ''))"
+)
+
+
+def _buscar_postgres(db: Session, id_microempresa: int, texto: str, solo_activos: bool, desde: int, limit: int):
+    # Sin quitar tildes: las columnas indexadas las conservan
+    terminos = re.findall(r"\w+", texto.lower())
+    consulta_texto = " ".join(terminos)
+    codigo_texto = texto.strip().lower()
+    prefijos = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in terminos))
+    puntaje = (
+        func.word_similarity(consulta_texto, _NOMBRE) * PESO_NOMBRE
+        + case((_CODIGO == codigo_texto, PESO_CODIGO), else_=0)
+        + func.ts_rank(_DOCUMENTO, prefijos) * PESO_DESCRIPCION
+        + func.word_similarity(consulta_texto, _CATEGORIA) * PESO_CATEGORIA
+    )
+    consulta = (
+        select(models.Producto)
+        .outerjoin(models.Categoria, models.Categoria.id_categoria == models.Producto.id_categoria)
+        .where(
+            models.Producto.id_microempresa == id_microempresa,
+            or_(
+                _NOMBRE.op("%>")(consulta_texto),
+                _NOMBRE.contains(codigo_texto, autoescape=True),  # subcadena, como el ILIKE anterior (usa el GIN de trigramas)
+                _DOCUMENTO.op("@@")(prefijos),
+                _CODIGO.startswith(codigo_texto, autoescape=True),
+                _CATEGORIA.op("%>")(consulta_texto),
+            ),
+        )
+        .order_by(puntaje.desc(), models.Producto.id_producto.desc())
+        .offset(desde)
+    )
+    if solo_activos:
+        consulta = consulta.where(models.Producto.estado == True)
+    if limit:
+        consulta = consulta.limit(limit + 1)
+    return db.scalars(consulta).all()
+
+
+# ------------------- API -------------------
+
+def buscar_productos(db: Session, id_microempresa: int, texto: str, solo_activos: bool = True, cursor: str = None, limit: int = None) -> Pagina:
+    """Productos de la microempresa que coinciden con `texto`, de mayor a menor relevancia."""
+    if not tokens(texto):
+        return Pagina([])
+    desde = decodificar_cursor(cursor)[1] if cursor else 0
+    if db.get_bind().dialect.name == "postgresql":
+        productos = _buscar_postgres(db, id_microempresa, texto, solo_activos, desde, limit)
+    else:
+        ids = obtener_indice(db, id_microempresa).buscar(texto, solo_activos)
+        ids = ids[desde:desde + limit + 1] if limit else ids[desde:]
+        por_id = {p.id_producto: p for p in db.query(models.Producto).filter(models.Producto.id_producto.in_(ids))}
+        productos = [por_id[i] for i in ids if i in por_id]
+    if not limit or len(productos) <= limit:
+        return Pagina(productos)
+    return Pagina(productos[:limit], codificar_cursor(None, desde + limit))
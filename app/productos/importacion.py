@@ -0,0 +1,215 @@
+"""
+Importación y exportación masiva del catálogo de productos.
+
+La importación tiene dos etapas:
+1. preparar_importacion (dentro del request): valida todas las filas, resuelve las
+   categorías con una sola consulta y revisa los códigos repetidos (en el archivo y contra
+   la base, con un IN por lote). No escribe nada.
+2. ejecutar_importacion (generador del StreamingResponse, con su propia sesión): inserta
+   productos, filas de stock y movimientos iniciales del kardex con executemany por lote,
+   confirma cada lote y emite el progreso en NDJSON. Al final genera un único evento
+   CATALOGO_IMPORTADO en vez de uno por producto.
+
+La exportación usa las mismas columnas que acepta la importación.
+"""
+import json
+from datetime import datetime
+from typing import NamedTuple
+
+from pydantic import ValidationError
+from sqlalchemy import select, insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import IMPORTACION_TAM_LOTE
+from app.core.importacion import describir_error
+from app.inventario.models import Stock
+from . import models, schemas
+from .busqueda import normalizar
+
+COLUMNAS_EXPORTACION = (
+    "id_producto", "codigo", "nombre", "descripcion", "id_categoria", "categoria",
+    "precio_venta", "costo_compra", "estado", "cantidad", "stock_minimo", "imagen",
+)
+
+
+class PlanImportacion(NamedTuple):
+    id_microempresa: int
+    total: int
+    productos: list  # [(linea, LineaImportacionProducto), ...] listos para insertar
+    categorias_nuevas: dict  # nombre normalizado -> nombre a crear
+    errores: list
+
+
+def _lotes(valores, tam: int = IMPORTACION_TAM_LOTE):
+    for i in range(0, len(valores), tam):
+        yield valores[i:i + tam]
+
+
+def preparar_importacion(db: Session, id_microempresa: int, filas, crear_categorias: bool = False) -> PlanImportacion:
+    """Valida el archivo completo sin escribir. Las filas con errores se reportan y se omiten."""
+    errores, validas = [], []
+    total = 0
+    for numero, fila in filas:
+        total += 1
+        try:
+            validas.append((numero, schemas.LineaImportacionProducto.model_validate(fila)))
+        except ValidationError as e:
+            errores.append({"linea": numero, "error": describir_error(e)})
+
+    # Categorías de la microempresa en una sola consulta
+    categorias = db.execute(
+        select(models.Categoria.id_categoria, models.Categoria.nombre)
+        .where(models.Categoria.id_microempresa == id_microempresa)
+    ).all()
+    ids_categoria = {c.id_categoria for c in categorias}
+    por_nombre = {normalizar(c.nombre).strip(): c.id_categoria for c in categorias}
+
+    # Códigos ya usados en la microempresa (un IN por lote)
+    codigos = list({linea.codigo.strip() for _, linea in validas if linea.codigo and linea.codigo.strip()})
+    usados = set()
+    for lote in _lotes(codigos):
+        usados.update(db.scalars(
+            select(models.Producto.codigo)
+            .where(models.Producto.id_microempresa == id_microempresa, models.Producto.codigo.in_(lote))
+        ))
+
+    productos, categorias_nuevas = [], {}
+    for numero, linea in validas:
+        linea.codigo = (linea.codigo or "").strip() or None
+        if linea.codigo in usados:
+            errores.append({"linea": numero, "error": f"Código repetido: {linea.codigo}"})
+            continue
+        if linea.id_categoria not in ids_categoria:
+            clave = normalizar(linea.categoria or "").strip()
+            if clave in por_nombre:
+                linea.id_categoria = por_nombre[clave]
+            elif clave and crear_categorias:
+                linea.id_categoria = None
+                categorias_nuevas.setdefault(clave, linea.categoria.strip())
+            else:
+                errores.append({"linea": numero, "error": f"Categoría no encontrada: {linea.categoria or linea.id_categoria}"})
+                continue
+        if linea.codigo:
+            usados.add(linea.codigo)
+        productos.append((numero, linea))
+    errores.sort(key=lambda e: e["linea"])
+    return PlanImportacion(id_microempresa, total, productos, categorias_nuevas, errores)
+
+
+def _crear_categorias(db: Session, id_microempresa: int, categorias_nuevas: dict) -> dict:
+    if not categorias_nuevas:
+        return {}
+    ahora = datetime.now()
+    claves = list(categorias_nuevas)
+    ids = db.scalars(
+        insert(models.Categoria).returning(models.Categoria.id_categoria, sort_by_parameter_order=True),
+        [
+            {"id_microempresa": id_microempresa, "nombre": categorias_nuevas[c], "activo": True, "fecha_creacion": ahora}
+            for c in claves
+        ]
+    ).all()
+    return dict(zip(claves, ids))
+
+
+def _insertar_lote(db: Session, id_microempresa: int, lote, nuevas: dict):
+    """Productos, stock y kardex del lote con executemany. Devuelve cuántos productos insertó."""
+    from app.inventario.kardex import registrar_movimientos
+    ahora = datetime.now()
+    ids = db.scalars(
+        insert(models.Producto).returning(models.Producto.id_producto, sort_by_parameter_order=True),
+        [
+            {
+                "id_microempresa": id_microempresa,
+                "id_categoria": linea.id_categoria or nuevas[normalizar(linea.categoria).strip()],
+                "nombre": linea.nombre,
+                "descripcion": linea.descripcion,
+                "precio_venta": linea.precio_venta,
+                "costo_compra": linea.costo_compra,
+                "codigo": linea.codigo,
+                "imagen": linea.imagen,
+                "estado": linea.estado,
+                "fecha_creacion": ahora,
+            }
+            for _, linea in lote
+        ]
+    ).all()
+    db.execute(insert(Stock), [
+        {"id_producto": id_producto, "cantidad": linea.cantidad, "stock_minimo": linea.stock_minimo, "ultima_actualizacion": ahora}
+        for id_producto, (_, linea) in zip(ids, lote)
+    ])
+    registrar_movimientos(db, [(id_producto, linea.cantidad, linea.cantidad) for id_producto, (_, linea) in zip(ids, lote)], "INICIAL", fecha=ahora)
+    return len(ids)
+
+
+def ejecutar_importacion(plan: PlanImportacion):
+    """Generador NDJSON: errores de validación, progreso por lote y resumen final."""
+    from app.database.session import SessionLocal
+    from .service import invalidar_catalogo
+
+    def linea(datos):
+        return (json.dumps(datos, ensure_ascii=False) + "\n").encode("utf-8")
+
+    for error in plan.errores:
+        yield linea({"evento": "error", **error})
+
+    db = SessionLocal()
+    creados = 0
+    errores = len(plan.errores)
+    try:
+        try:
+            nuevas = _crear_categorias(db, plan.id_microempresa, plan.categorias_nuevas)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            yield linea({"evento": "fin", "creados": 0, "errores": errores + len(plan.productos), "detalle": f"No se pudieron crear las categorías: {e.orig}"})
+            return
+        lotes = list(_lotes(plan.productos))
+        for i, lote in enumerate(lotes):
+            try:
+                insertados = _insertar_lote(db, plan.id_microempresa, lote, nuevas)
+                db.commit()
+                creados += insertados
+            except IntegrityError as e:
+                # Un código tomado por otra escritura mientras tanto: se descarta el lote completo
+                db.rollback()
+                errores += len(lote)
+                yield linea({"evento": "error", "linea": lote[0][0], "hasta_linea": lote[-1][0], "error": f"Lote rechazado: {e.orig}"})
+            yield linea({"evento": "progreso", "procesadas": sum(len(l) for l in lotes[:i + 1]), "creados": creados, "total": len(plan.productos)})
+        if creados:
+            _evento_importacion(db, plan.id_microempresa, creados, len(nuevas))
+        yield linea({"evento": "fin", "creados": creados, "categorias_creadas": len(nuevas), "errores": errores, "filas": plan.total})
+    finally:
+        db.close()
+        invalidar_catalogo(plan.id_microempresa)
+
+
+def _evento_importacion(db: Session, id_microempresa: int, creados: int, categorias: int):
+    """Un único evento para toda la importación (no uno por producto)."""
+    from app.notificaciones import service as notif_service
+    try:
+        notif_service.generar_evento(
+            tipo_evento="CATALOGO_IMPORTADO",
+            mensaje=f"Se importaron {creados} productos" + (f" y {categorias} categorías nuevas" if categorias else "") + " al catálogo.",
+            id_microempresa=id_microempresa,
+            db=db
+        )
+    except Exception as e:
+        print(f"[Importación] No se pudo generar el evento de importación: {e}")
+
+
+def consulta_exportacion_productos(id_microempresa: int):
+    """select() del catálogo con las columnas de la importación (categoría por nombre y stock)."""
+    consulta = (
+        select(
+            models.Producto.id_producto, models.Producto.codigo, models.Producto.nombre, models.Producto.descripcion,
+            models.Producto.id_categoria, models.Categoria.nombre, models.Producto.precio_venta,
+            models.Producto.costo_compra, models.Producto.estado, func.coalesce(Stock.cantidad, 0),
+            func.coalesce(Stock.stock_minimo, 0), models.Producto.imagen,
+        )
+        .outerjoin(models.Categoria, models.Categoria.id_categoria == models.Producto.id_categoria)
+        .outerjoin(Stock, Stock.id_producto == models.Producto.id_producto)
+        .where(models.Producto.id_microempresa == id_microempresa)
+        .order_by(models.Producto.id_producto)
+    )
+    return consulta, COLUMNAS_EXPORTACION
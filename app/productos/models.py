@@ -1,6 +1,6 @@
 # models.py para productos y categorías
 
-from sqlalchemy import Column, Integer, String, Text, Boolean, Numeric, ForeignKey, TIMESTAMP, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Boolean, Numeric, ForeignKey, TIMESTAMP, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
@@ -20,6 +20,10 @@ class Categoria(Base):
 
 class Producto(Base):
     __tablename__ = "producto"
+    __table_args__ = (
+        Index('ix_producto_microempresa_fecha_id', 'id_microempresa', 'fecha_creacion', 'id_producto'),
+        UniqueConstraint('id_microempresa', 'codigo', name='uq_producto_microempresa_codigo'),
+    )
     id_producto = Column(Integer, primary_key=True, index=True)
     id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa", ondelete="CASCADE"), nullable=False)
     id_categoria = Column(Integer, ForeignKey("categoria.id_categoria"), nullable=False)
@@ -29,6 +33,8 @@ class Producto(Base):
     costo_compra = Column(Numeric(10,2))
     codigo = Column(String(50))
     imagen = Column(Text)
+    imagen_miniatura = Column(Text)  # variantes generadas por app/core/imagenes.py
+    imagen_tarjeta = Column(Text)
     estado = Column(Boolean, default=True, nullable=False)
     fecha_creacion = Column(TIMESTAMP, nullable=False)
     categoria = relationship("Categoria", back_populates="productos")
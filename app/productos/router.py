@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Path, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Path, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database.session import get_db
+from app.database.session import get_db, get_async_db, usa_async
 from . import schemas, service
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, solo_superadmin, verificar_microempresa
 #-----------------imports para notificaciones------
 from app.notificaciones import service as notif_service
 from app.notificaciones.schemas import NotificacionCreate
 from typing import Optional
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
+from app.core.importacion import leer_filas
+from app.core.exportacion import respuesta_exportacion
+from app.core.imagenes import guardar_imagen, programar_variantes, url_publica
+from . import importacion
 
 router = APIRouter(prefix="/productos", tags=["Productos"])
 
@@ -28,25 +34,98 @@ def cambiar_estado_categoria(id_categoria: int, estado: bool = Body(...), id_mic
     return service.cambiar_estado_categoria(db, id_categoria, id_microempresa, estado)
 
 # --- ENDPOINT DEL PORTAL (PÚBLICO) ---
-@router.get("/portal/{id_microempresa}/listado", response_model=list[schemas.ProductoResponse])
-def listar_productos_portal_publico(id_microempresa: int, db: Session = Depends(get_db)):
-    """
-    Lista productos activos y con stock > 0 para el portal público.
-    No requiere autenticación.
-    """
-    return service.listar_productos_portal_publico(db, id_microempresa)
+def _respuesta_portal(request: Request, cuerpo: bytes, etag: str):
+    """JSON cacheado con ETag; si el navegador ya tiene esa versión responde 304 sin cuerpo."""
+    cabeceras = {"ETag": etag, "Cache-Control": "public, max-age=0, must-revalidate"}
+    if_none_match = request.headers.get("if-none-match", "")
+    etags_cliente = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+    if etag in etags_cliente or "*" in etags_cliente:
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
+
+@router.get("/portal/cache/metricas")
+def metricas_cache_portal(current_user = Depends(solo_superadmin)):
+    return service.cache_portal.metricas()
+
+if usa_async("productos"):
+    @router.get("/portal/{id_microempresa}/listado", response_model=list[schemas.ProductoResponse])
+    async def listar_productos_portal_publico(id_microempresa: int, request: Request, db=Depends(get_async_db)):
+        """
+        Lista productos activos y con stock > 0 para el portal público (AsyncSession).
+        No requiere autenticación. Respuesta cacheada por microempresa, con ETag.
+        """
+        cuerpo, etag = await service.obtener_portal_publico_json_async(db, id_microempresa)
+        return _respuesta_portal(request, cuerpo, etag)
+else:
+    @router.get("/portal/{id_microempresa}/listado", response_model=list[schemas.ProductoResponse])
+    def listar_productos_portal_publico(id_microempresa: int, request: Request, db: Session = Depends(get_db)):
+        """
+        Lista productos activos y con stock > 0 para el portal público.
+        No requiere autenticación. Respuesta cacheada por microempresa, con ETag.
+        """
+        cuerpo, etag = service.obtener_portal_publico_json(db, id_microempresa)
+        return _respuesta_portal(request, cuerpo, etag)
 
 # --- NUEVO ENDPOINT: Listar productos inactivos por microempresa ---
 @router.get("/microempresa/{id_microempresa}/inactivos", response_model=list[schemas.ProductoResponse])
-def listar_productos_inactivos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
+def listar_productos_inactivos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     """
     Lista todos los productos inactivos de una microempresa.
     """
-    return service.listar_productos_inactivos_por_microempresa(db, id_microempresa)
+    return responder_pagina(response, service.listar_productos_inactivos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/buscar", response_model=list[schemas.ProductoResponse])
-def filtrar_productos_por_microempresa_y_nombre(id_microempresa: int, nombre: str, db: Session = Depends(get_db)):
-    return service.filtrar_productos_por_microempresa_y_nombre(db, id_microempresa, nombre)
+def filtrar_productos_por_microempresa_y_nombre(id_microempresa: int, nombre: str, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.filtrar_productos_por_microempresa_y_nombre(db, id_microempresa, nombre, pagina.cursor, pagina.limit))
+
+@router.get("/microempresa/{id_microempresa}/busqueda", response_model=list[schemas.ProductoResponse])
+def buscar_productos(
+    id_microempresa: int,
+    response: Response,
+    q: str = Query(..., min_length=1, description="Texto a buscar en nombre, código, descripción y categoría"),
+    solo_activos: bool = Query(True),
+    pagina: ParametrosPagina = Depends(parametros_pagina),
+    db: Session = Depends(get_db)
+):
+    """Búsqueda por relevancia con prefijos y tolerancia a errores de tipeo (type-ahead del POS)."""
+    return responder_pagina(response, service.buscar_productos(db, id_microempresa, q, solo_activos, pagina.cursor, pagina.limit))
+
+@router.get("/microempresa/{id_microempresa}/codigo/{codigo}", response_model=schemas.ProductoCodigoResponse)
+def obtener_producto_por_codigo(id_microempresa: int, codigo: str, db: Session = Depends(get_db)):
+    """Producto, precio y stock actual por código de barras (escaneo en caja)."""
+    producto = service.obtener_producto_por_codigo(db, id_microempresa, codigo)
+    if not producto:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return producto
+
+@router.post("/microempresa/{id_microempresa}/codigos", response_model=schemas.ResolverCodigosResponse)
+def resolver_codigos(id_microempresa: int, data: schemas.ResolverCodigosRequest, db: Session = Depends(get_db)):
+    """Resuelve varios códigos escaneados en una sola llamada para armar la canasta."""
+    return service.resolver_codigos(db, id_microempresa, data.codigos)
+
+@router.post("/microempresa/{id_microempresa}/importar")
+def importar_catalogo(
+    id_microempresa: int,
+    archivo: UploadFile = File(...),
+    formato: Optional[str] = Form(None, description="csv, json, ndjson o xlsx; por defecto según la extensión"),
+    crear_categorias: bool = Form(False, description="Crear las categorías que no existan (por nombre)"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Carga masiva del catálogo. El archivo se valida completo antes de escribir; la respuesta es
+    NDJSON en streaming: errores por línea, progreso por lote y un resumen final.
+    """
+    verificar_microempresa(current_user, id_microempresa)
+    plan = importacion.preparar_importacion(db, id_microempresa, leer_filas(archivo, formato), crear_categorias)
+    return StreamingResponse(importacion.ejecutar_importacion(plan), media_type="application/x-ndjson")
+
+@router.get("/microempresa/{id_microempresa}/exportar")
+def exportar_catalogo(id_microempresa: int, formato: str = Query("csv", description="csv o ndjson"), current_user = Depends(get_current_user)):
+    """Exporta el catálogo con las mismas columnas que acepta la importación (incluye costo_compra), en streaming."""
+    verificar_microempresa(current_user, id_microempresa)
+    consulta, columnas = importacion.consulta_exportacion_productos(id_microempresa)
+    return respuesta_exportacion(consulta, columnas, formato, f"productos_microempresa_{id_microempresa}")
 
 # --- ENDPOINTS GLOBALES (CATEGORIAS) ---
 @router.get("/categoria/activas", response_model=list[schemas.CategoriaResponse])
@@ -162,17 +241,9 @@ def crear_producto(
     else:
         raise HTTPException(status_code=403, detail="No autorizado para crear productos")
 
-    imagen_path = None
-    if imagen:
-        import os
-        from uuid import uuid4
-        ext = os.path.splitext(imagen.filename)[1]
-        filename = f"{uuid4().hex}{ext}"
-        os.makedirs(os.path.join("public", "productos"), exist_ok=True)
-        save_path = os.path.join("public", "productos", filename)
-        with open(save_path, "wb") as f:
-            f.write(imagen.file.read())
-        imagen_path = f"/public/productos/{filename}"
+    # Original guardado por bloques con nombre = hash; las variantes se generan en segundo plano
+    imagen_guardada = guardar_imagen(imagen) if imagen and imagen.filename else None
+    imagen_path = url_publica(imagen_guardada.ruta) if imagen_guardada else None
 
     producto_data = {
         "nombre": nombre,
@@ -188,6 +259,12 @@ def crear_producto(
     
     # CORREGIDO: Se pasa id_microempresa
     nuevo_producto = service.crear_producto(db, id_microempresa, schemas.ProductoCreate(**producto_data))
+    if imagen_guardada:
+        id_producto = nuevo_producto.id_producto
+        programar_variantes(
+            imagen_guardada,
+            lambda rutas: service.registrar_variantes_imagen(id_producto, id_microempresa, imagen_path, rutas)
+        )
 
     '''
     try:
@@ -218,39 +295,37 @@ def eliminar_producto_fisico(id_producto: int, db: Session = Depends(get_db)):
     return result
 
 @router.get("/", response_model=list[schemas.ProductoResponse])
-def listar_productos_global(db: Session = Depends(get_db)):
-    return db.query(service.models.Producto).all()
+def listar_productos_global(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.paginar_productos(db.query(service.models.Producto), pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.ProductoResponse])
-def listar_productos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_productos_por_microempresa(db, id_microempresa)
+def listar_productos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/categoria/{id_categoria}", response_model=list[schemas.ProductoResponse])
-def listar_productos_por_microempresa_categoria(id_microempresa: int, id_categoria: int, db: Session = Depends(get_db)):
-    productos = db.query(service.models.Producto).filter(
-        service.models.Producto.id_microempresa == id_microempresa,
-        service.models.Producto.id_categoria == id_categoria
-    ).all()
-    return productos
+def listar_productos_por_microempresa_categoria(id_microempresa: int, id_categoria: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos(db, id_microempresa, id_categoria, None, pagina.cursor, pagina.limit))
 
 @router.get("/activos", response_model=list[schemas.ProductoResponse])
-def listar_productos_activos(db: Session = Depends(get_db)):
-    return db.query(service.models.Producto).filter(service.models.Producto.estado == True).all()
+def listar_productos_activos(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    consulta = db.query(service.models.Producto).filter(service.models.Producto.estado == True)
+    return responder_pagina(response, service.paginar_productos(consulta, pagina.cursor, pagina.limit))
 
 @router.get("/inactivos", response_model=list[schemas.ProductoResponse])
-def listar_productos_inactivos(db: Session = Depends(get_db)):
-    return db.query(service.models.Producto).filter(service.models.Producto.estado == False).all()
+def listar_productos_inactivos(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    consulta = db.query(service.models.Producto).filter(service.models.Producto.estado == False)
+    return responder_pagina(response, service.paginar_productos(consulta, pagina.cursor, pagina.limit))
 
 # --- PRODUCTOS CON STOCK GLOBALES (Aquí estaba el error 500) ---
 @router.get("/con-stock", response_model=list[schemas.ProductoResponse])
-def listar_productos_con_stock(db: Session = Depends(get_db)):
+def listar_productos_con_stock(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     # CORREGIDO: Llama al servicio
-    return service.listar_productos_con_stock_global(db)
+    return responder_pagina(response, service.listar_productos_con_stock_global(db, pagina.cursor, pagina.limit))
 
 @router.get("/sin-stock", response_model=list[schemas.ProductoResponse])
-def listar_productos_sin_stock(db: Session = Depends(get_db)):
+def listar_productos_sin_stock(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     # CORREGIDO: Llama al servicio
-    return service.listar_productos_sin_stock_global(db)
+    return responder_pagina(response, service.listar_productos_sin_stock_global(db, pagina.cursor, pagina.limit))
 
 @router.get("/{id_producto}", response_model=schemas.ProductoResponse)
 def obtener_producto_detalle(id_producto: int, db: Session = Depends(get_db)):
@@ -260,36 +335,36 @@ def obtener_producto_detalle(id_producto: int, db: Session = Depends(get_db)):
     return producto
 
 @router.get("/microempresa/{id_microempresa}/activos-con-stock", response_model=list[schemas.ProductoResponse])
-def listar_productos_activos_con_stock_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_productos_activos_con_stock_por_microempresa(db, id_microempresa)
+def listar_productos_activos_con_stock_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos_activos_con_stock_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/activos", response_model=list[schemas.ProductoResponse])
-def listar_productos_activos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_productos_activos_por_microempresa(db, id_microempresa)
+def listar_productos_activos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos_activos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 
 
 @router.get("/microempresa/{id_microempresa}/buscar-nombre", response_model=list[schemas.ProductoResponse])
-def buscar_productos_por_nombre_microempresa(id_microempresa: int, nombre: str, db: Session = Depends(get_db)):
-    return service.buscar_productos_por_nombre_microempresa(db, id_microempresa, nombre)
+def buscar_productos_por_nombre_microempresa(id_microempresa: int, nombre: str, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.buscar_productos_por_nombre_microempresa(db, id_microempresa, nombre, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/con-stock", response_model=list[schemas.ProductoResponse])
-def listar_productos_con_stock_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_productos_con_stock_por_microempresa(db, id_microempresa)
+def listar_productos_con_stock_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos_con_stock_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/sin-stock", response_model=list[schemas.ProductoResponse])
-def listar_productos_sin_stock_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
+def listar_productos_sin_stock_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
     from app.inventario.models import Stock
-    productos = db.query(service.models.Producto).join(Stock, service.models.Producto.id_producto == Stock.id_producto).filter(
+    consulta = db.query(service.models.Producto).join(Stock, service.models.Producto.id_producto == Stock.id_producto).filter(
         service.models.Producto.id_microempresa == id_microempresa,
         Stock.cantidad == 0
-    ).all()
-    return productos
+    )
+    return responder_pagina(response, service.paginar_productos(consulta, pagina.cursor, pagina.limit))
 
 @router.get("/catalogo/publico")
-def obtener_catalogo_portal(db: Session = Depends(get_db)):
-    productos = db.query(service.models.Producto).filter(service.models.Producto.estado == True).all()
-    return productos
+def obtener_catalogo_portal(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    consulta = db.query(service.models.Producto).filter(service.models.Producto.estado == True)
+    return responder_pagina(response, service.paginar_productos(consulta, pagina.cursor, pagina.limit))
 
 # --- PRODUCTOS (Endpoints por URL con ID explícito) ---
 @router.post("/microempresas/{id_microempresa}/productos", response_model=schemas.ProductoResponse)
@@ -297,8 +372,8 @@ def crear_producto_por_url(id_microempresa: int, producto: schemas.ProductoCreat
     return service.crear_producto(db, id_microempresa, producto)
 
 @router.get("/microempresas/{id_microempresa}/productos", response_model=list[schemas.ProductoResponse])
-def listar_productos_con_filtros(id_microempresa: int, id_categoria: int = Query(None), estado: bool = Query(None), db: Session = Depends(get_db)):
-    return service.listar_productos(db, id_microempresa, id_categoria, estado)
+def listar_productos_con_filtros(id_microempresa: int, response: Response, id_categoria: int = Query(None), estado: bool = Query(None), pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_productos(db, id_microempresa, id_categoria, estado, pagina.cursor, pagina.limit))
 
 @router.get("/productos/{id_producto}", response_model=schemas.ProductoResponse)
 def obtener_producto_por_id(id_producto: int, db: Session = Depends(get_db)):
@@ -1,6 +1,6 @@
 # schemas.py para productos y categorías
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional
 
 class CategoriaBase(BaseModel):
@@ -42,6 +42,54 @@ class ProductoUpdate(ProductoBase):
 
 class ProductoResponse(ProductoBase):
     id_producto: int
+    imagen_miniatura: Optional[str] = None
+    imagen_tarjeta: Optional[str] = None
     fecha_creacion: datetime
     class Config:
         from_attributes = True
+
+# --- BÚSQUEDA POR CÓDIGO (POS) ---
+
+class ProductoCodigoResponse(BaseModel):
+    id_producto: int
+    codigo: str
+    nombre: str
+    precio_venta: float
+    estado: bool
+    id_categoria: int
+    imagen: Optional[str] = None
+    imagen_miniatura: Optional[str] = None
+    cantidad_stock: int
+    class Config:
+        from_attributes = True
+
+class ResolverCodigosRequest(BaseModel):
+    codigos: list[str] = Field(..., min_length=1, max_length=500)
+
+class ResolverCodigosResponse(BaseModel):
+    productos: list[ProductoCodigoResponse]
+    no_encontrados: list[str]
+
+# --- IMPORTACIÓN MASIVA DEL CATÁLOGO ---
+
+class LineaImportacionProducto(BaseModel):
+    """Fila de la importación masiva: la categoría va por id_categoria o por su nombre (categoria)."""
+    nombre: str = Field(..., max_length=150)
+    descripcion: Optional[str] = None
+    precio_venta: float = Field(..., ge=0)
+    costo_compra: Optional[float] = Field(None, ge=0)
+    codigo: Optional[str] = Field(None, max_length=50)
+    imagen: Optional[str] = None
+    estado: bool = True
+    id_categoria: Optional[int] = None
+    categoria: Optional[str] = Field(None, max_length=100)
+    cantidad: int = Field(0, ge=0)
+    stock_minimo: int = Field(0, ge=0)
+    class Config:
+        coerce_numbers_to_str = True
+
+    @model_validator(mode="after")
+    def categoria_identificada(self):
+        if self.id_categoria is None and not self.categoria:
+            raise ValueError("Debe indicar id_categoria o categoria")
+        return self
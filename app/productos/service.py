@@ -1,6 +1,14 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from pydantic import TypeAdapter
+import hashlib
 from . import models, schemas
 from datetime import datetime
+from app.core.cache import CacheTTL
+from app.core.paginacion import paginar
+from app.core.config import PORTAL_CACHE_TTL, PORTAL_CACHE_MAX
+from .busqueda import buscar_productos, invalidar_indice_busqueda
 
 # --- FUNCIONES DE ESCRITURA (Crear/Editar/Eliminar) ---
 
@@ -32,6 +40,7 @@ def actualizar_categoria(db: Session, id_categoria: int, categoria: schemas.Cate
         setattr(db_categoria, key, value)
     db.commit()
     db.refresh(db_categoria)
+    invalidar_indice_busqueda(db_categoria.id_microempresa)
     return db_categoria
 
 def eliminar_categoria(db: Session, id_categoria: int):
@@ -44,6 +53,7 @@ def eliminar_categoria(db: Session, id_categoria: int):
         nombre_categoria = db_categoria.nombre
         db.delete(db_categoria)
         db.commit()
+        invalidar_indice_busqueda(id_microempresa)
         # Notificar al admin de la microempresa
         admin = db.query(AdminMicroempresa).filter(AdminMicroempresa.id_microempresa == id_microempresa).first()
         if admin:
@@ -57,6 +67,37 @@ def eliminar_categoria(db: Session, id_categoria: int):
             notif_service.crear_notificacion(db, notificacion)
     return db_categoria
 
+CODIGO_REPETIDO = "Ya existe un producto con ese código en la microempresa."
+
+def _validar_codigo_unico(db: Session, id_microempresa: int, codigo: str, id_producto: int = None):
+    if not codigo:
+        return
+    consulta = db.query(models.Producto.id_producto).filter(
+        models.Producto.id_microempresa == id_microempresa,
+        models.Producto.codigo == codigo
+    )
+    if id_producto is not None:
+        consulta = consulta.filter(models.Producto.id_producto != id_producto)
+    if consulta.first():
+        from fastapi import HTTPException
+        raise HTTPException(status_code=409, detail=CODIGO_REPETIDO)
+
+def _confirmar_producto(db: Session):
+    """
+    Commit de un alta o edición de producto. Dos requests con el mismo código pueden pasar
+    _validar_codigo_unico a la vez: el segundo choca con uq_producto_microempresa_codigo y
+    responde el mismo 409 en vez de un 500.
+    """
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        mensaje = str(e.orig)
+        if "uq_producto_microempresa_codigo" in mensaje or "producto.codigo" in mensaje:
+            from fastapi import HTTPException
+            raise HTTPException(status_code=409, detail=CODIGO_REPETIDO)
+        raise
+
 def crear_producto(db: Session, id_microempresa: int, producto: schemas.ProductoCreate):
     # Validar que la categoría pertenezca a la microempresa
     categoria = db.query(models.Categoria).filter(
@@ -69,12 +110,15 @@ def crear_producto(db: Session, id_microempresa: int, producto: schemas.Producto
     
     # Crear producto
     data = producto.dict()
+    data["codigo"] = (data.get("codigo") or "").strip() or None
+    _validar_codigo_unico(db, id_microempresa, data["codigo"])
     data["id_microempresa"] = id_microempresa
     data["fecha_creacion"] = datetime.now()
     db_producto = models.Producto(**data)
     db.add(db_producto)
-    db.commit()
+    _confirmar_producto(db)
     db.refresh(db_producto)
+    invalidar_catalogo(id_microempresa)
     
     # Crear registro en stock con cantidad = 0
     from app.inventario.models import Stock
@@ -91,14 +135,41 @@ def crear_producto(db: Session, id_microempresa: int, producto: schemas.Producto
     )
     return db_producto
 
+def registrar_variantes_imagen(id_producto: int, id_microempresa: int, imagen_original: str, rutas: dict):
+    """
+    Callback del pool de imágenes: reemplaza el original por sus variantes. Si el producto
+    cambió de imagen mientras tanto, no se toca.
+    """
+    from app.database.session import SessionLocal
+    from app.core.imagenes import url_publica
+    db = SessionLocal()
+    try:
+        db.query(models.Producto).filter(
+            models.Producto.id_producto == id_producto,
+            models.Producto.imagen == imagen_original
+        ).update({
+            "imagen": url_publica(rutas["completa"]),
+            "imagen_miniatura": url_publica(rutas["miniatura"]),
+            "imagen_tarjeta": url_publica(rutas["tarjeta"]),
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    invalidar_catalogo(id_microempresa)
+
 def actualizar_producto(db: Session, id_producto: int, producto: schemas.ProductoUpdate):
     db_producto = db.query(models.Producto).filter(models.Producto.id_producto == id_producto).first()
     if not db_producto:
         return None
-    for key, value in producto.dict(exclude_unset=True).items():
+    datos = producto.dict(exclude_unset=True)
+    if "codigo" in datos:
+        datos["codigo"] = (datos["codigo"] or "").strip() or None
+        _validar_codigo_unico(db, db_producto.id_microempresa, datos["codigo"], id_producto)
+    for key, value in datos.items():
         setattr(db_producto, key, value)
-    db.commit()
+    _confirmar_producto(db)
     db.refresh(db_producto)
+    invalidar_catalogo(db_producto.id_microempresa)
     return db_producto
 
 def activar_producto(db: Session, id_producto: int):
@@ -107,6 +178,7 @@ def activar_producto(db: Session, id_producto: int):
         db_producto.estado = True
         db.commit()
         db.refresh(db_producto)
+        invalidar_catalogo(db_producto.id_microempresa)
     return db_producto
 
 def desactivar_producto(db: Session, id_producto: int):
@@ -115,6 +187,7 @@ def desactivar_producto(db: Session, id_producto: int):
         db_producto.estado = False
         db.commit()
         db.refresh(db_producto)
+        invalidar_catalogo(db_producto.id_microempresa)
         # Evento: Producto desactivado
         from app.notificaciones import service as notif_service
         notif_service.generar_evento(
@@ -136,6 +209,7 @@ def eliminar_producto_fisico(db: Session, id_producto: int):
         nombre_producto = db_producto.nombre
         db.delete(db_producto)
         db.commit()
+        invalidar_catalogo(id_microempresa)
         # Notificar al admin de la microempresa
         admin = db.query(AdminMicroempresa).filter(AdminMicroempresa.id_microempresa == id_microempresa).first()
         if admin:
@@ -153,6 +227,7 @@ def baja_logica_producto(db: Session, id_producto: int):
     if db_producto:
         db_producto.estado = False
         db.commit()
+        invalidar_catalogo(db_producto.id_microempresa)
     return db_producto
 
 # --- FUNCIONES DE LECTURA (CATEGORÍAS) ---
@@ -175,87 +250,165 @@ def listar_categorias_inactivas(db: Session):
 
 # --- FUNCIONES DE LECTURA (PRODUCTOS) ---
 
-def listar_productos(db: Session, id_microempresa: int, id_categoria: int = None, estado: bool = None):
+def paginar_productos(consulta, cursor: str = None, limit: int = None):
+    return paginar(consulta, models.Producto.id_producto, models.Producto.fecha_creacion, cursor, limit)
+
+def listar_productos(db: Session, id_microempresa: int, id_categoria: int = None, estado: bool = None, cursor: str = None, limit: int = None):
     query = db.query(models.Producto).filter(models.Producto.id_microempresa == id_microempresa)
     if id_categoria is not None:
         query = query.filter(models.Producto.id_categoria == id_categoria)
     if estado is not None:
         query = query.filter(models.Producto.estado == estado)
-    return query.all()
+    return paginar_productos(query, cursor, limit)
 
-def listar_productos_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Producto).filter(models.Producto.id_microempresa == id_microempresa).all()
+def listar_productos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Producto).filter(models.Producto.id_microempresa == id_microempresa)
+    return paginar_productos(consulta, cursor, limit)
 
-def filtrar_productos_por_microempresa_y_nombre(db: Session, id_microempresa: int, nombre: str):
-    return db.query(models.Producto).filter(
-        models.Producto.id_microempresa == id_microempresa,
-        models.Producto.nombre.ilike(f"%{nombre}%")
-    ).all()
+def filtrar_productos_por_microempresa_y_nombre(db: Session, id_microempresa: int, nombre: str, cursor: str = None, limit: int = None):
+    # Antes ILIKE '%nombre%' (recorría todos los productos); ahora ordena por relevancia
+    return buscar_productos(db, id_microempresa, nombre, solo_activos=False, cursor=cursor, limit=limit)
 
 # --- FUNCIONES DE PRODUCTOS CON STOCK (NUEVAS Y NECESARIAS PARA EVITAR ERRORES) ---
 
-def listar_productos_con_stock_global(db: Session):
+def listar_productos_con_stock_global(db: Session, cursor: str = None, limit: int = None):
     """Devuelve productos de todo el sistema que tienen stock > 0"""
     from app.inventario.models import Stock
-    return db.query(models.Producto).join(Stock, models.Producto.id_producto == Stock.id_producto).filter(Stock.cantidad > 0).all()
+    consulta = db.query(models.Producto).join(Stock, models.Producto.id_producto == Stock.id_producto).filter(Stock.cantidad > 0)
+    return paginar_productos(consulta, cursor, limit)
 
-def listar_productos_sin_stock_global(db: Session):
+def listar_productos_sin_stock_global(db: Session, cursor: str = None, limit: int = None):
     """Devuelve productos de todo el sistema que tienen stock = 0"""
     from app.inventario.models import Stock
-    return db.query(models.Producto).join(Stock, models.Producto.id_producto == Stock.id_producto).filter(Stock.cantidad == 0).all()
+    consulta = db.query(models.Producto).join(Stock, models.Producto.id_producto == Stock.id_producto).filter(Stock.cantidad == 0)
+    return paginar_productos(consulta, cursor, limit)
 
-def listar_productos_portal_publico(db: Session, id_microempresa: int):
-    """Lógica del portal"""
+def _consulta_portal_publico(id_microempresa: int):
     from app.inventario.models import Stock
     return (
-        db.query(models.Producto)
+        select(models.Producto)
         .join(Stock, models.Producto.id_producto == Stock.id_producto)
-        .filter(
+        .where(
             models.Producto.id_microempresa == id_microempresa,
             models.Producto.estado == True,
-            Stock.cantidad > 0 
+            Stock.cantidad > 0
         )
-        .all()
     )
 
-def listar_productos_activos_con_stock_por_microempresa(db: Session, id_microempresa: int):
+def listar_productos_portal_publico(db: Session, id_microempresa: int):
+    """Lógica del portal"""
+    return db.scalars(_consulta_portal_publico(id_microempresa)).all()
+
+async def listar_productos_portal_publico_async(db, id_microempresa: int):
+    """Variante async del portal (AsyncSession), misma consulta"""
+    resultado = await db.scalars(_consulta_portal_publico(id_microempresa))
+    return resultado.all()
+
+# --- CACHE DEL PORTAL PÚBLICO ---
+# JSON ya serializado + ETag por microempresa. Se invalida explícitamente desde las
+# escrituras que cambian lo que ve el portal (productos, stock, ventas, compras).
+
+cache_portal = CacheTTL(max_items=PORTAL_CACHE_MAX, ttl=PORTAL_CACHE_TTL)
+_adaptador_portal = TypeAdapter(list[schemas.ProductoResponse])
+
+def _serializar_portal(productos):
+    cuerpo = _adaptador_portal.dump_json(_adaptador_portal.validate_python(productos, from_attributes=True))
+    etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+    return cuerpo, etag
+
+def obtener_portal_publico_json(db: Session, id_microempresa: int):
+    """Devuelve (cuerpo_json, etag) del portal; solo consulta la BD si no está en cache."""
+    entrada = cache_portal.obtener(id_microempresa)
+    if entrada is None:
+        version = cache_portal.version(id_microempresa)
+        entrada = _serializar_portal(listar_productos_portal_publico(db, id_microempresa))
+        cache_portal.guardar(id_microempresa, entrada, version)
+    return entrada
+
+async def obtener_portal_publico_json_async(db, id_microempresa: int):
+    entrada = cache_portal.obtener(id_microempresa)
+    if entrada is None:
+        version = cache_portal.version(id_microempresa)
+        entrada = _serializar_portal(await listar_productos_portal_publico_async(db, id_microempresa))
+        cache_portal.guardar(id_microempresa, entrada, version)
+    return entrada
+
+def invalidar_cache_portal(id_microempresa: int):
+    cache_portal.invalidar(id_microempresa)
+
+def invalidar_catalogo(id_microempresa: int):
+    """Cambios en productos: afectan al portal y al índice de búsqueda."""
+    invalidar_cache_portal(id_microempresa)
+    invalidar_indice_busqueda(id_microempresa)
+
+def listar_productos_activos_con_stock_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
     from app.inventario.models import Stock
-    return (
+    consulta = (
         db.query(models.Producto)
         .join(Stock, models.Producto.id_producto == Stock.id_producto)
         .filter(models.Producto.id_microempresa == id_microempresa)
         .filter(models.Producto.estado == True)
         .filter(Stock.cantidad > 0)
-        .all()
     )
+    return paginar_productos(consulta, cursor, limit)
 
 
-def listar_productos_activos_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Producto).filter(
+def listar_productos_activos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Producto).filter(
         models.Producto.id_microempresa == id_microempresa,
         models.Producto.estado == True
-    ).all()
+    )
+    return paginar_productos(consulta, cursor, limit)
 
 # NUEVA FUNCIÓN: Listar productos inactivos por microempresa
-def listar_productos_inactivos_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Producto).filter(
+def listar_productos_inactivos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = db.query(models.Producto).filter(
         models.Producto.id_microempresa == id_microempresa,
         models.Producto.estado == False
-    ).all()
+    )
+    return paginar_productos(consulta, cursor, limit)
 
 
-def listar_productos_con_stock_por_microempresa(db: Session, id_microempresa: int):
+def listar_productos_con_stock_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
     from app.inventario.models import Stock
-    return (
+    consulta = (
         db.query(models.Producto)
         .join(Stock, models.Producto.id_producto == Stock.id_producto)
         .filter(models.Producto.id_microempresa == id_microempresa)
         .filter(Stock.cantidad > 0)
-        .all()
     )
+    return paginar_productos(consulta, cursor, limit)
 
-def buscar_productos_por_nombre_microempresa(db: Session, id_microempresa: int, nombre: str):
-    return db.query(models.Producto).filter(
-        models.Producto.id_microempresa == id_microempresa,
-        models.Producto.nombre.ilike(f"%{nombre}%")
-    ).all()
\ No newline at end of file
+def buscar_productos_por_nombre_microempresa(db: Session, id_microempresa: int, nombre: str, cursor: str = None, limit: int = None):
+    return buscar_productos(db, id_microempresa, nombre, solo_activos=False, cursor=cursor, limit=limit)
+
+# --- BÚSQUEDA POR CÓDIGO (POS) ---
+# Producto + precio + stock en una sola consulta, por el índice único (id_microempresa, codigo)
+
+def _consulta_por_codigos(id_microempresa: int, codigos):
+    from app.inventario.models import Stock
+    return (
+        select(
+            models.Producto.id_producto, models.Producto.codigo, models.Producto.nombre,
+            models.Producto.precio_venta, models.Producto.estado, models.Producto.id_categoria,
+            models.Producto.imagen, models.Producto.imagen_miniatura,
+            func.coalesce(Stock.cantidad, 0).label("cantidad_stock"),
+        )
+        .outerjoin(Stock, Stock.id_producto == models.Producto.id_producto)
+        .where(
+            models.Producto.id_microempresa == id_microempresa,
+            models.Producto.codigo.in_(codigos)
+        )
+    )
+
+def obtener_producto_por_codigo(db: Session, id_microempresa: int, codigo: str):
+    return db.execute(_consulta_por_codigos(id_microempresa, [codigo.strip()])).first()
+
+def resolver_codigos(db: Session, id_microempresa: int, codigos: list[str]):
+    """Resuelve una canasta de códigos escaneados en una sola consulta (los repetidos se resuelven una vez)."""
+    unicos = list(dict.fromkeys(c.strip() for c in codigos if c and c.strip()))
+    por_codigo = {fila.codigo: fila for fila in db.execute(_consulta_por_codigos(id_microempresa, unicos))} if unicos else {}
+    return {
+        "productos": [por_codigo[c] for c in unicos if c in por_codigo],
+        "no_encontrados": [c for c in unicos if c not in por_codigo],
+    }
@@ -0,0 +1,20 @@
+# models.py para el módulo de reportes
+from sqlalchemy import Column, Integer, String, Date, Numeric, ForeignKey, UniqueConstraint
+from app.database.base import Base
+
+class ResumenDiario(Base):
+    """
+    Totales diarios por microempresa, mantenidos de forma incremental:
+    - VENTA: ventas PAGADAS (se resta si una venta pagada se cancela)
+    - COMPRA: compras CONFIRMADAS / FINALIZADAS
+    """
+    __tablename__ = "resumen_diario"
+    __table_args__ = (
+        UniqueConstraint('id_microempresa', 'fecha', 'tipo', name='uq_resumen_diario_microempresa_fecha_tipo'),
+    )
+    id_resumen = Column(Integer, primary_key=True, index=True)
+    id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa", ondelete="CASCADE"), nullable=False)
+    fecha = Column(Date, nullable=False)
+    tipo = Column(String(10), nullable=False)  # VENTA, COMPRA
+    total = Column(Numeric(12,2), nullable=False, default=0)
+    cantidad = Column(Integer, nullable=False, default=0)
@@ -1,11 +1,46 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.database.session import get_db
+from app.database.session import get_db, get_async_db, usa_async
+from app.core.dependencies import get_current_user, get_user_role
 from app.reportes import service
 
 router = APIRouter(prefix="/reportes", tags=["Reportes"])
 
-@router.get("/dashboard")
-def obtener_dashboard(periodo: str = "mes", id_microempresa: int = None, db: Session = Depends(get_db)):
-    # periodo puede ser: 'mes', 'trimestre', 'anio'
-    return service.obtener_datos_dashboard(db, id_microempresa, periodo)
\ No newline at end of file
+if usa_async("reportes"):
+    @router.get("/dashboard")
+    async def obtener_dashboard(periodo: str = "mes", id_microempresa: int = None, db=Depends(get_async_db)):
+        # periodo puede ser: 'mes', 'trimestre', 'anio'
+        return await service.obtener_datos_dashboard_async(db, id_microempresa, periodo)
+else:
+    @router.get("/dashboard")
+    def obtener_dashboard(periodo: str = "mes", id_microempresa: int = None, db: Session = Depends(get_db)):
+        # periodo puede ser: 'mes', 'trimestre', 'anio'
+        return service.obtener_datos_dashboard(db, id_microempresa, periodo)
+
+def _microempresa_resumen(user, db: Session, id_microempresa: int = None):
+    """
+    Alcance de verificar/reconstruir: un superadmin puede operar sobre todas las microempresas
+    (id_microempresa None); un adminmicroempresa solo sobre la suya.
+    """
+    rol = get_user_role(user, db)
+    if rol == 'superadmin':
+        return id_microempresa
+    if rol == 'adminmicroempresa':
+        propia = user.admin_microempresa.id_microempresa
+        if id_microempresa not in (None, propia):
+            raise HTTPException(status_code=403, detail="No autorizado para esta microempresa")
+        return propia
+    raise HTTPException(status_code=403, detail="No autorizado")
+
+@router.get("/resumen-diario/verificar")
+def verificar_resumen_diario(id_microempresa: int = None, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    # Compara resumen_diario contra los totales de venta/compra
+    id_microempresa = _microempresa_resumen(user, db, id_microempresa)
+    return service.verificar_resumen_diario(db, id_microempresa)
+
+@router.post("/resumen-diario/reconstruir")
+def reconstruir_resumen_diario(id_microempresa: int = None, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    # Sin id_microempresa reconstruye toda la tabla: solo superadmin
+    id_microempresa = _microempresa_resumen(user, db, id_microempresa)
+    filas = service.reconstruir_resumen_diario(db, id_microempresa)
+    return {"filas": filas, **service.verificar_resumen_diario(db, id_microempresa)}
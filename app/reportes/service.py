@@ -1,11 +1,146 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy import func, select, update, insert, delete, literal, union_all
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 from app.compras.models import Compra
 # 👇 IMPORTANTE: Importa tu modelo de Venta
 from app.ventas.models import Venta 
+from app.reportes.models import ResumenDiario
 
-def obtener_datos_dashboard(db: Session, id_microempresa: int, periodo: str):
+# Estados que cuentan en el resumen diario (y por lo tanto en el dashboard)
+ESTADOS_VENTA_RESUMEN = ("PAGADA",)
+ESTADOS_COMPRA_RESUMEN = ("CONFIRMADA", "FINALIZADA")
+
+# --- MANTENIMIENTO INCREMENTAL DEL RESUMEN DIARIO ---
+
+def acumular_resumen_diario(db: Session, id_microempresa: int, fecha, tipo: str, total, cantidad: int = 1):
+    """
+    Suma total/cantidad a la fila (id_microempresa, día, tipo) con un upsert.
+    No hace commit: se confirma junto con la venta/compra que lo origina.
+    """
+    dia = fecha.date() if isinstance(fecha, datetime) else (fecha or date.today())
+    valores = {
+        "id_microempresa": id_microempresa,
+        "fecha": dia,
+        "tipo": tipo,
+        "total": total,
+        "cantidad": cantidad,
+    }
+    dialecto = db.get_bind().dialect.name
+    if dialecto in ("postgresql", "sqlite"):
+        if dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+        stmt = insert_dialecto(ResumenDiario).values(**valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id_microempresa", "fecha", "tipo"],
+            set_={
+                "total": ResumenDiario.total + stmt.excluded.total,
+                "cantidad": ResumenDiario.cantidad + stmt.excluded.cantidad,
+            },
+        )
+        db.execute(stmt)
+        return
+    # Otros motores: UPDATE y, si no existía la fila, INSERT
+    actualizadas = db.execute(
+        update(ResumenDiario)
+        .where(
+            ResumenDiario.id_microempresa == id_microempresa,
+            ResumenDiario.fecha == dia,
+            ResumenDiario.tipo == tipo,
+        )
+        .values(total=ResumenDiario.total + total, cantidad=ResumenDiario.cantidad + cantidad)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not actualizadas:
+        db.execute(insert(ResumenDiario).values(**valores))
+
+def registrar_venta_en_resumen(db: Session, venta, signo: int = 1):
+    """signo=1 al quedar PAGADA, signo=-1 si una venta pagada se cancela."""
+    acumular_resumen_diario(db, venta.id_microempresa, venta.fecha, "VENTA", signo * venta.total, signo)
+
+def registrar_compra_en_resumen(db: Session, compra, total=None, cantidad: int = 1):
+    """Por defecto suma la compra completa; total/cantidad permiten registrar solo un delta."""
+    acumular_resumen_diario(
+        db, compra.id_microempresa, compra.fecha, "COMPRA",
+        compra.total if total is None else total, cantidad
+    )
+
+# --- RECONSTRUCCIÓN Y VERIFICACIÓN ---
+
+def _agregados_crudos(id_microempresa: int = None):
+    """Totales por (microempresa, día, tipo) calculados desde venta y compra."""
+    ventas = select(
+        Venta.id_microempresa.label("id_microempresa"),
+        func.date(Venta.fecha).label("fecha"),
+        literal("VENTA").label("tipo"),
+        func.sum(Venta.total).label("total"),
+        func.count().label("cantidad"),
+    ).where(Venta.estado.in_(ESTADOS_VENTA_RESUMEN), Venta.fecha.isnot(None))
+    compras = select(
+        Compra.id_microempresa.label("id_microempresa"),
+        func.date(Compra.fecha).label("fecha"),
+        literal("COMPRA").label("tipo"),
+        func.sum(Compra.total).label("total"),
+        func.count().label("cantidad"),
+    ).where(Compra.estado.in_(ESTADOS_COMPRA_RESUMEN))
+    if id_microempresa is not None:
+        ventas = ventas.where(Venta.id_microempresa == id_microempresa)
+        compras = compras.where(Compra.id_microempresa == id_microempresa)
+    ventas = ventas.group_by(Venta.id_microempresa, func.date(Venta.fecha))
+    compras = compras.group_by(Compra.id_microempresa, func.date(Compra.fecha))
+    return union_all(ventas, compras)
+
+def reconstruir_resumen_diario(db: Session, id_microempresa: int = None):
+    """Recalcula el resumen desde cero (backfill inicial o corrección). Devuelve las filas escritas."""
+    borrar = delete(ResumenDiario)
+    if id_microempresa is not None:
+        borrar = borrar.where(ResumenDiario.id_microempresa == id_microempresa)
+    db.execute(borrar)
+    crudos = _agregados_crudos(id_microempresa).subquery()
+    resultado = db.execute(
+        insert(ResumenDiario).from_select(
+            ["id_microempresa", "fecha", "tipo", "total", "cantidad"],
+            select(crudos.c.id_microempresa, crudos.c.fecha, crudos.c.tipo, crudos.c.total, crudos.c.cantidad),
+        )
+    )
+    db.commit()
+    return resultado.rowcount
+
+def verificar_resumen_diario(db: Session, id_microempresa: int = None):
+    """Compara el resumen con los totales calculados desde venta/compra y lista las diferencias."""
+    esperado = {
+        (r.id_microempresa, str(r.fecha), r.tipo): (Decimal(str(r.total or 0)), r.cantidad)
+        for r in db.execute(_agregados_crudos(id_microempresa)).all()
+    }
+    consulta = select(ResumenDiario)
+    if id_microempresa is not None:
+        consulta = consulta.where(ResumenDiario.id_microempresa == id_microempresa)
+    actual = {
+        (r.id_microempresa, str(r.fecha), r.tipo): (Decimal(str(r.total)), r.cantidad)
+        for r in db.scalars(consulta).all()
+    }
+    sin_datos = (Decimal("0"), 0)
+    diferencias = []
+    for clave in sorted(set(esperado) | set(actual)):
+        total_esperado, cantidad_esperada = esperado.get(clave, sin_datos)
+        total_actual, cantidad_actual = actual.get(clave, sin_datos)
+        if abs(total_esperado - total_actual) > Decimal("0.005") or cantidad_esperada != cantidad_actual:
+            diferencias.append({
+                "id_microempresa": clave[0],
+                "fecha": clave[1],
+                "tipo": clave[2],
+                "total_esperado": float(total_esperado),
+                "total_resumen": float(total_actual),
+                "cantidad_esperada": cantidad_esperada,
+                "cantidad_resumen": cantidad_actual,
+            })
+    return {"consistente": not diferencias, "revisadas": len(set(esperado) | set(actual)), "diferencias": diferencias}
+
+# --- DASHBOARD ---
+
+def _rango_periodo(periodo: str):
     now = datetime.now()
     fecha_inicio = now
 
@@ -16,42 +151,25 @@ def obtener_datos_dashboard(db: Session, id_microempresa: int, periodo: str):
         fecha_inicio = now - timedelta(days=90)
     elif periodo == 'anio':
         fecha_inicio = now.replace(month=1, day=1)
+    return now, fecha_inicio
 
-    # 2. Consultar Totales GASTOS (Compras)
-    gastos = db.query(func.sum(Compra.total))\
-        .filter(Compra.id_microempresa == id_microempresa)\
-        .filter(Compra.fecha >= fecha_inicio)\
-        .scalar() or 0
+def _consulta_dashboard(id_microempresa: int, fecha_inicio: datetime):
+    """Una sola lectura de O(días) filas del resumen, compartida por la variante sync y la async."""
+    return select(ResumenDiario.fecha, ResumenDiario.tipo, ResumenDiario.total).where(
+        ResumenDiario.id_microempresa == id_microempresa,
+        ResumenDiario.fecha >= fecha_inicio.date()
+    )
 
-    # 3. Consultar Totales INGRESOS (Ventas) ✅ AHORA SÍ FUNCIONA
-    ingresos = db.query(func.sum(Venta.total))\
-        .filter(Venta.id_microempresa == id_microempresa)\
-        .filter(Venta.fecha >= fecha_inicio)\
-        .scalar() or 0
+def _armar_dashboard(now, fecha_inicio, filas):
+    mapa_ventas = {}
+    mapa_compras = {}
+    for f in filas:
+        mapa = mapa_ventas if f.tipo == "VENTA" else mapa_compras
+        mapa[str(f.fecha)] = float(f.total)
+    ingresos = sum(mapa_ventas.values())
+    gastos = sum(mapa_compras.values())
 
-    # 4. Construir Gráfico (Mezclando Ventas y Compras por día)
-    
-    # A) Agrupar Compras por día
-    compras_query = db.query(
-        func.date(Compra.fecha).label('fecha'),
-        func.sum(Compra.total).label('total')
-    ).filter(
-        Compra.id_microempresa == id_microempresa,
-        Compra.fecha >= fecha_inicio
-    ).group_by(func.date(Compra.fecha)).all()
-    mapa_compras = {str(c.fecha): float(c.total) for c in compras_query}
-
-    # B) Agrupar Ventas por día ✅
-    ventas_query = db.query(
-        func.date(Venta.fecha).label('fecha'),
-        func.sum(Venta.total).label('total')
-    ).filter(
-        Venta.id_microempresa == id_microempresa,
-        Venta.fecha >= fecha_inicio
-    ).group_by(func.date(Venta.fecha)).all()
-    mapa_ventas = {str(v.fecha): float(v.total) for v in ventas_query}
-
-    # C) Unificar en una linea de tiempo
+    # Unificar en una linea de tiempo
     grafico = []
     delta_dias = (now - fecha_inicio).days + 1
     
@@ -71,4 +189,14 @@ def obtener_datos_dashboard(db: Session, id_microempresa: int, periodo: str):
         "gastos_totales": gastos,
         "ganancia_neta": ingresos - gastos,
         "grafico": grafico
-    }
\ No newline at end of file
+    }
+
+def obtener_datos_dashboard(db: Session, id_microempresa: int, periodo: str):
+    now, fecha_inicio = _rango_periodo(periodo)
+    filas = db.execute(_consulta_dashboard(id_microempresa, fecha_inicio)).all()
+    return _armar_dashboard(now, fecha_inicio, filas)
+
+async def obtener_datos_dashboard_async(db, id_microempresa: int, periodo: str):
+    now, fecha_inicio = _rango_periodo(periodo)
+    filas = (await db.execute(_consulta_dashboard(id_microempresa, fecha_inicio))).all()
+    return _armar_dashboard(now, fecha_inicio, filas)
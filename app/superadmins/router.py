@@ -4,7 +4,7 @@ from app.database.session import get_db
 from app.auth.models import SuperAdmin
 from app.auth.base_user import Usuario
 from app.users.schemas import UsuarioResponse
-from app.core.dependencies import get_current_user, get_user_role
+from app.core.dependencies import get_current_user, get_user_role, invalidar_principal
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(
@@ -45,6 +45,7 @@ def eliminar_superadmin(id_usuario: int, db: Session = Depends(get_db), user=Dep
         raise HTTPException(status_code=404, detail="SuperAdmin no encontrado")
     db.delete(superadmin)
     db.commit()
+    invalidar_principal(id_usuario)
     return {"detail": "SuperAdmin eliminado"}
 
 @router.put("/{id_usuario}", response_model=UsuarioResponse)
@@ -63,5 +64,6 @@ def actualizar_superadmin(id_usuario: int, data: SuperAdminUpdate, db: Session =
     usuario.nombre = data.nombre
     usuario.email = data.email
     db.commit()
+    invalidar_principal(id_usuario)
     db.refresh(usuario)
     return usuario
@@ -20,7 +20,8 @@ def get_me(user=Depends(get_current_user), db: Session = Depends(get_db)):
     if rol not in ["superadmin", "adminmicroempresa", "vendedor", "usuario"]:
         rol = "usuario"
 
-    id_microempresa = service.obtener_id_microempresa_por_usuario(db, user.id_usuario, rol)
+    # get_current_user ya resolvió la microempresa junto con el rol
+    id_microempresa = user.id_microempresa
 
     return {
         "id_usuario": user.id_usuario,
@@ -53,22 +54,7 @@ def crear_usuario(usuario: schemas.UsuarioCreate, db: Session = Depends(get_db))
 
 @router.get("/", response_model=list[schemas.UsuarioResponse])
 def listar_usuarios(db: Session = Depends(get_db)):
-    usuarios = service.listar_usuarios(db)
-    usuarios_con_rol = []
-    for user in usuarios:
-        rol = get_user_role(user, db)
-        if rol not in ["superadmin", "adminmicroempresa", "vendedor", "usuario"]:
-            rol = "usuario"
-        id_microempresa = service.obtener_id_microempresa_por_usuario(db, user.id_usuario, rol)
-        usuarios_con_rol.append({
-            "id_usuario": user.id_usuario,
-            "nombre": user.nombre,
-            "email": user.email,
-            "estado": user.estado,
-            "rol": rol,
-            "id_microempresa": id_microempresa
-        })
-    return usuarios_con_rol
+    return service.listar_directorio_usuarios(db)
 
 
 @router.get("/{id_usuario}", response_model=schemas.UsuarioResponse)
@@ -1,5 +1,57 @@
+from sqlalchemy import select, case, literal
+from sqlalchemy.orm import Session
+from app.users.models import Usuario
+from app.auth.models import SuperAdmin
+from app.core.security import hash_password
+from app.core.dependencies import invalidar_principal
 from .models import AdminMicroempresa, Vendedor
 
+# Rol con la misma precedencia que get_user_role: superadmin > adminmicroempresa > vendedor > usuario
+_ROL_USUARIO = case(
+    (SuperAdmin.id_usuario.isnot(None), "superadmin"),
+    (AdminMicroempresa.id_usuario.isnot(None), "adminmicroempresa"),
+    (Vendedor.id_usuario.isnot(None), "vendedor"),
+    else_="usuario",
+)
+_MICROEMPRESA_USUARIO = case(
+    (SuperAdmin.id_usuario.isnot(None), None),
+    (AdminMicroempresa.id_usuario.isnot(None), AdminMicroempresa.id_microempresa),
+    else_=Vendedor.id_microempresa,
+)
+
+def consulta_directorio_usuarios():
+    """select() de usuarios con rol e id_microempresa resueltos por LEFT JOIN: una fila por usuario."""
+    return (
+        select(
+            Usuario.id_usuario, Usuario.nombre, Usuario.email, Usuario.estado,
+            _ROL_USUARIO.label("rol"),
+            _MICROEMPRESA_USUARIO.label("id_microempresa"),
+        )
+        .outerjoin(SuperAdmin, SuperAdmin.id_usuario == Usuario.id_usuario)
+        .outerjoin(AdminMicroempresa, AdminMicroempresa.id_usuario == Usuario.id_usuario)
+        .outerjoin(Vendedor, Vendedor.id_usuario == Usuario.id_usuario)
+    )
+
+def listar_directorio_usuarios(db: Session):
+    """Todos los usuarios con su rol e id_microempresa en una sola consulta."""
+    consulta = consulta_directorio_usuarios().order_by(Usuario.id_usuario)
+    return [dict(fila._mapping) for fila in db.execute(consulta)]
+
+def listar_directorio_por_rol(db: Session, modelo_rol, rol: str, **filtros):
+    """Usuarios de una tabla de rol (Vendedor o AdminMicroempresa); filtros sobre sus columnas, p. ej. id_microempresa."""
+    consulta = (
+        select(
+            Usuario.id_usuario, Usuario.nombre, Usuario.email, Usuario.estado,
+            literal(rol).label("rol"),
+            modelo_rol.id_microempresa,
+        )
+        .join(modelo_rol, modelo_rol.id_usuario == Usuario.id_usuario)
+        .order_by(Usuario.id_usuario)
+    )
+    for campo, valor in filtros.items():
+        consulta = consulta.where(getattr(modelo_rol, campo) == valor)
+    return [dict(fila._mapping) for fila in db.execute(consulta)]
+
 def obtener_id_microempresa_por_usuario(db: Session, id_usuario: int, rol: str):
     """Devuelve el id_microempresa para un usuario según su rol (adminmicroempresa o vendedor) usando ORM."""
     if rol == "adminmicroempresa":
@@ -20,6 +72,7 @@ def eliminar_usuario(db: Session, id_usuario: int):
         return False
     db.delete(usuario)
     db.commit()
+    invalidar_principal(id_usuario)
     return True
 def obtener_usuario(db: Session, id_usuario: int):
     from app.auth.base_user import Usuario
@@ -36,9 +89,9 @@ def actualizar_usuario(db: Session, id_usuario: int, usuario_data):
     if hasattr(usuario_data, 'estado') and usuario_data.estado is not None:
         usuario.estado = usuario_data.estado
     db.commit()
+    invalidar_principal(id_usuario)
     db.refresh(usuario)
     return usuario
-from app.core.security import hash_password
 def crear_usuario(db: Session, usuario_data):
     from app.auth.base_user import Usuario
     # Verificar que el email no exista
@@ -56,8 +109,6 @@ def crear_usuario(db: Session, usuario_data):
     return nuevo_usuario
 def listar_usuarios(db: Session):
     return db.query(Usuario).all()
-from sqlalchemy.orm import Session
-from app.users.models import Usuario
 
 def get_user_by_email(db: Session, email: str):
     return db.query(Usuario).filter(Usuario.email == email).first()
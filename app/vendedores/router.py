@@ -5,7 +5,8 @@ from app.database.session import get_db
 from app.users.models import Vendedor
 from app.auth.base_user import Usuario
 from app.users.schemas import UsuarioResponse
-from app.core.dependencies import get_current_user, get_user_role
+from app.users.service import listar_directorio_por_rol
+from app.core.dependencies import get_current_user, get_user_role, invalidar_principal
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(
@@ -23,21 +24,11 @@ class VendedorUpdate(BaseModel):
 @router.get("/", response_model=list[UsuarioResponse])
 def listar_vendedores(db: Session = Depends(get_db), user=Depends(get_current_user)):
     rol = get_user_role(user, db)
-    def build_response(v):
-        usuario = v.usuario
-        return {
-            "id_usuario": usuario.id_usuario,
-            "nombre": usuario.nombre,
-            "email": usuario.email,
-            "estado": usuario.estado,
-            "rol": "vendedor",
-            "id_microempresa": v.id_microempresa
-        }
     if rol == 'superadmin':
-        return [build_response(v) for v in db.query(Vendedor).all()]
+        return listar_directorio_por_rol(db, Vendedor, "vendedor")
     elif rol == 'adminmicroempresa' and hasattr(user, 'admin_microempresa') and user.admin_microempresa:
         id_micro = user.admin_microempresa.id_microempresa
-        return [build_response(v) for v in db.query(Vendedor).filter_by(id_microempresa=id_micro).all()]
+        return listar_directorio_por_rol(db, Vendedor, "vendedor", id_microempresa=id_micro)
     elif rol == 'vendedor' and hasattr(user, 'vendedor') and user.vendedor:
         return [{
             "id_usuario": user.id_usuario,
@@ -83,6 +74,7 @@ def eliminar_vendedor(id_usuario: int, db: Session = Depends(get_db), user=Depen
     if rol == 'superadmin' or (rol == 'vendedor' and user.id_usuario == id_usuario):
         db.delete(vendedor)
         db.commit()
+        invalidar_principal(id_usuario)
         return {"detail": "Vendedor eliminado"}
     else:
         raise HTTPException(status_code=403, detail="No autorizado")
@@ -107,6 +99,7 @@ def actualizar_vendedor(id_usuario: int, data: VendedorUpdate, db: Session = Dep
         if data.password and len(data.password) >= 6:
             usuario.password_hash = hash_password(data.password)
         db.commit()
+        invalidar_principal(id_usuario)
         db.refresh(usuario)
         return {
             "id_usuario": usuario.id_usuario,
@@ -129,6 +122,7 @@ def baja_logica_vendedor(id_usuario: int, db: Session = Depends(get_db), user=De
     if rol == 'superadmin' or (rol == 'adminmicroempresa' and user.admin_microempresa.id_microempresa == vendedor.id_microempresa) or (rol == 'vendedor' and user.id_usuario == id_usuario):
         usuario.estado = False
         db.commit()
+        invalidar_principal(id_usuario)
         return {"detail": "Vendedor dado de baja lógicamente"}
     else:
         raise HTTPException(status_code=403, detail="No autorizado")
\ No newline at end of file
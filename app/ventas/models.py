@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, ForeignKey, TIMESTAMP, DECIMAL
+from sqlalchemy import Column, Integer, String, Text, Numeric, ForeignKey, TIMESTAMP, DECIMAL, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
 class Venta(Base):
     __tablename__ = "venta"
+    __table_args__ = (
+        # Keyset de listados: WHERE id_microempresa = ? ORDER BY fecha DESC, id_venta DESC
+        Index('ix_venta_microempresa_fecha_id', 'id_microempresa', 'fecha', 'id_venta'),
+    )
     id_venta = Column(Integer, primary_key=True, index=True)
     id_microempresa = Column(Integer, ForeignKey("microempresas.id_microempresa"), nullable=False)
     id_cliente = Column(Integer, ForeignKey("cliente.id_cliente"), nullable=True)
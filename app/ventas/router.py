@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from sqlalchemy.orm import Session
-from app.database.session import get_db
+from app.database.session import get_db, get_async_db, usa_async
 from . import schemas, service
+from app.core.paginacion import ParametrosPagina, parametros_pagina, responder_pagina
+from app.core.exportacion import respuesta_exportacion
+from app.core.idempotencia import ContextoIdempotencia, contexto_idempotencia
+from app.core.dependencies import get_current_user, verificar_microempresa
 
 router = APIRouter(prefix="/ventas", tags=["Ventas"])
 
@@ -9,9 +13,14 @@ router = APIRouter(prefix="/ventas", tags=["Ventas"])
 def crear_venta(venta: schemas.VentaCreate, db: Session = Depends(get_db)):
     return service.crear_venta(db, venta)
 
-@router.get("/", response_model=list[schemas.VentaResponse])
-def listar_ventas(db: Session = Depends(get_db)):
-    return service.listar_ventas(db)
+if usa_async("ventas"):
+    @router.get("/", response_model=list[schemas.VentaResponse])
+    async def listar_ventas(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db=Depends(get_async_db)):
+        return responder_pagina(response, await service.listar_ventas_async(db, pagina.cursor, pagina.limit))
+else:
+    @router.get("/", response_model=list[schemas.VentaResponse])
+    def listar_ventas(response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+        return responder_pagina(response, service.listar_ventas(db, pagina.cursor, pagina.limit))
 
 @router.get("/{id_venta}", response_model=schemas.VentaResponse)
 def obtener_venta(id_venta: int, db: Session = Depends(get_db)):
@@ -32,29 +41,34 @@ def listar_pagos_venta(id_venta: int, db: Session = Depends(get_db)):
 def listar_detalles_venta(id_venta: int, db: Session = Depends(get_db)):
     return service.listar_detalles_venta(db, id_venta)
 
-@router.get("/microempresa/{id_microempresa}", response_model=list[schemas.VentaResponse])
-def listar_ventas_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_ventas_por_microempresa(db, id_microempresa)
+if usa_async("ventas"):
+    @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.VentaResponse])
+    async def listar_ventas_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db=Depends(get_async_db)):
+        return responder_pagina(response, await service.listar_ventas_por_microempresa_async(db, id_microempresa, pagina.cursor, pagina.limit))
+else:
+    @router.get("/microempresa/{id_microempresa}", response_model=list[schemas.VentaResponse])
+    def listar_ventas_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+        return responder_pagina(response, service.listar_ventas_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/pagos", response_model=list[schemas.PagoVentaResponse])
-def listar_pagos_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_pagos_por_microempresa(db, id_microempresa)
+def listar_pagos_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_pagos_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.get("/microempresa/{id_microempresa}/detalles", response_model=list[schemas.DetalleVentaResponse])
-def listar_detalles_por_microempresa(id_microempresa: int, db: Session = Depends(get_db)):
-    return service.listar_detalles_por_microempresa(db, id_microempresa)
+def listar_detalles_por_microempresa(id_microempresa: int, response: Response, pagina: ParametrosPagina = Depends(parametros_pagina), db: Session = Depends(get_db)):
+    return responder_pagina(response, service.listar_detalles_por_microempresa(db, id_microempresa, pagina.cursor, pagina.limit))
 
 @router.post("/microempresas/{id_microempresa}/ventas", response_model=schemas.VentaResponse)
-def crear_venta_presencial(id_microempresa: int, venta: schemas.VentaCreate, db: Session = Depends(get_db)):
-    return service.crear_venta_presencial(db, id_microempresa, venta)
+def crear_venta_presencial(id_microempresa: int, venta: schemas.VentaCreate, db: Session = Depends(get_db), idempotencia: ContextoIdempotencia = Depends(contexto_idempotencia)):
+    return idempotencia.ejecutar(lambda: service.crear_venta_presencial(db, id_microempresa, venta), schemas.VentaResponse, db=db)
 
 @router.post("/ventas/checkout", response_model=schemas.VentaResponse)
-def crear_venta_online(venta: schemas.VentaCreate = Body(...), cliente: dict = Body(...), db: Session = Depends(get_db)):
-    return service.crear_venta_online(db, venta, cliente)
+def crear_venta_online(venta: schemas.VentaCreate = Body(...), cliente: dict = Body(...), db: Session = Depends(get_db), idempotencia: ContextoIdempotencia = Depends(contexto_idempotencia)):
+    return idempotencia.ejecutar(lambda: service.crear_venta_online(db, venta, cliente), schemas.VentaResponse, db=db)
 
 @router.post("/ventas/{id_venta}/pago", response_model=schemas.PagoVentaResponse)
-def crear_pago_venta_pendiente(id_venta: int, pago: schemas.PagoVentaCreate = Body(...), db: Session = Depends(get_db)):
-    return service.crear_pago_venta_pendiente(db, id_venta, pago)
+def crear_pago_venta_pendiente(id_venta: int, pago: schemas.PagoVentaCreate = Body(...), db: Session = Depends(get_db), idempotencia: ContextoIdempotencia = Depends(contexto_idempotencia)):
+    return idempotencia.ejecutar(lambda: service.crear_pago_venta_pendiente(db, id_venta, pago), schemas.PagoVentaResponse, db=db)
 
 @router.put("/ventas/{id_venta}/pago/validar", response_model=schemas.VentaResponse)
 def validar_pago_venta(id_venta: int, db: Session = Depends(get_db)):
@@ -67,10 +81,29 @@ def rechazar_pago_venta(id_venta: int, db: Session = Depends(get_db)):
 @router.get("/microempresas/{id_microempresa}/ventas", response_model=list[schemas.VentaResponse])
 def listar_ventas_filtrado(
     id_microempresa: int,
+    response: Response,
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
     estado: str = Query(None),
     tipo: str = Query(None),
+    pagina: ParametrosPagina = Depends(parametros_pagina),
     db: Session = Depends(get_db)
 ):
-    return service.listar_ventas_filtrado(db, id_microempresa, fecha_inicio, fecha_fin, estado, tipo)
+    ventas = service.listar_ventas_filtrado(db, id_microempresa, fecha_inicio, fecha_fin, estado, tipo, pagina.cursor, pagina.limit)
+    return responder_pagina(response, ventas)
+
+@router.get("/microempresas/{id_microempresa}/exportar/{conjunto}")
+def exportar_ventas(
+    id_microempresa: int,
+    conjunto: str,
+    formato: str = Query("ndjson", description="ndjson o csv"),
+    fecha_inicio: str = Query(None),
+    fecha_fin: str = Query(None),
+    estado: str = Query(None),
+    tipo: str = Query(None),
+    current_user = Depends(get_current_user),
+):
+    """Exporta ventas, detalles o pagos de la microempresa en NDJSON/CSV, en streaming."""
+    verificar_microempresa(current_user, id_microempresa)
+    consulta, columnas = service.consulta_exportacion_ventas(conjunto, id_microempresa, fecha_inicio, fecha_fin, estado, tipo)
+    return respuesta_exportacion(consulta, columnas, formato, f"{conjunto}_microempresa_{id_microempresa}")
@@ -1,46 +1,25 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from . import models, schemas
 from datetime import datetime
 from fastapi import HTTPException
-from sqlalchemy import and_
+from sqlalchemy import and_, select, insert
 from app.inventario.models import Stock
-from app.inventario.service import ajuste_stock
+from app.inventario.service import ajuste_stock, verificar_stock_carrito, descontar_stock_carrito
 from app.notificaciones.service import crear_notificacion
 from app.notificaciones.schemas import NotificacionCreate
 from app.productos.models import Producto
 from app.clientes.models import Cliente
+from app.reportes.service import registrar_venta_en_resumen, ESTADOS_VENTA_RESUMEN
+from app.productos.service import invalidar_cache_portal
 from sqlalchemy import text
+from app.core.paginacion import aplicar_keyset, cerrar_pagina, paginar
+from app.database.session import al_confirmar
 
 # --- CRUD BÁSICO ---
 
 def crear_venta(db: Session, venta: schemas.VentaCreate):
-    # Validar stock antes de registrar la venta
-    from app.inventario.models import Stock
-    errores_stock = []
-    for det in venta.detalles:
-        stock = db.query(Stock).filter(Stock.id_producto == det.id_producto).first()
-        if not stock:
-            errores_stock.append({
-                "id_producto": det.id_producto,
-                "error": "Producto no encontrado en inventario",
-                "cantidad_solicitada": det.cantidad,
-                "stock_disponible": 0
-            })
-        elif stock.cantidad < det.cantidad:
-            errores_stock.append({
-                "id_producto": det.id_producto,
-                "error": "Stock insuficiente",
-                "cantidad_solicitada": det.cantidad,
-                "stock_disponible": stock.cantidad
-            })
-    if errores_stock:
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "mensaje": "No se puede registrar la venta por problemas de stock.",
-                "errores": errores_stock
-            }
-        )
+    # Validar stock de todo el carrito en una sola consulta antes de registrar la venta
+    verificar_stock_carrito(db, venta.detalles)
 
     db_venta = models.Venta(
         id_microempresa=venta.id_microempresa,
@@ -74,6 +53,8 @@ def crear_venta(db: Session, venta: schemas.VentaCreate):
                 fecha=pag.fecha or datetime.now()
             )
             db.add(db_pag)
+    if db_venta.estado in ESTADOS_VENTA_RESUMEN:
+        registrar_venta_en_resumen(db, db_venta)
     db.commit()
     db.refresh(db_venta)
     # Notificación y evento: Venta registrada
@@ -87,14 +68,49 @@ def crear_venta(db: Session, venta: schemas.VentaCreate):
     )
     return db_venta
 
-def listar_ventas(db: Session):
-    return db.query(models.Venta).all()
+def _filtrar_ventas(consulta, id_microempresa: int = None, fecha_inicio=None, fecha_fin=None, estado=None, tipo=None):
+    """Filtros de los listados de ventas; sirve tanto para Query como para select()."""
+    if id_microempresa is not None:
+        consulta = consulta.filter(models.Venta.id_microempresa == id_microempresa)
+    if fecha_inicio:
+        consulta = consulta.filter(models.Venta.fecha >= fecha_inicio)
+    if fecha_fin:
+        consulta = consulta.filter(models.Venta.fecha <= fecha_fin)
+    if estado:
+        consulta = consulta.filter(models.Venta.estado == estado)
+    if tipo:
+        consulta = consulta.filter(models.Venta.tipo == tipo)
+    return consulta
+
+def _consulta_ventas(cursor: str = None, limit: int = None, **filtros):
+    # VentaResponse incluye detalles y pagos: se cargan en bloque para no disparar lazy loads por venta
+    consulta = select(models.Venta).options(
+        selectinload(models.Venta.detalles),
+        selectinload(models.Venta.pagos),
+    )
+    consulta = _filtrar_ventas(consulta, **filtros)
+    return aplicar_keyset(consulta, models.Venta.id_venta, models.Venta.fecha, cursor, limit)
+
+def _pagina_ventas(filas, limit: int = None):
+    return cerrar_pagina(filas, models.Venta.id_venta, models.Venta.fecha, limit)
+
+def listar_ventas(db: Session, cursor: str = None, limit: int = None):
+    return _pagina_ventas(db.scalars(_consulta_ventas(cursor, limit)).all(), limit)
+
+async def listar_ventas_async(db, cursor: str = None, limit: int = None):
+    resultado = await db.scalars(_consulta_ventas(cursor, limit))
+    return _pagina_ventas(resultado.all(), limit)
 
 def obtener_venta(db: Session, id_venta: int):
     return db.query(models.Venta).filter(models.Venta.id_venta == id_venta).first()
 
-def listar_ventas_por_microempresa(db: Session, id_microempresa: int):
-    return db.query(models.Venta).filter(models.Venta.id_microempresa == id_microempresa).order_by(models.Venta.fecha.desc()).all()
+def listar_ventas_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = _consulta_ventas(cursor, limit, id_microempresa=id_microempresa)
+    return _pagina_ventas(db.scalars(consulta).all(), limit)
+
+async def listar_ventas_por_microempresa_async(db, id_microempresa: int, cursor: str = None, limit: int = None):
+    resultado = await db.scalars(_consulta_ventas(cursor, limit, id_microempresa=id_microempresa))
+    return _pagina_ventas(resultado.all(), limit)
 
 # --- PAGOS Y DETALLES ---
 
@@ -117,29 +133,64 @@ def listar_pagos_venta(db: Session, id_venta: int):
 def listar_detalles_venta(db: Session, id_venta: int):
     return db.query(models.DetalleVenta).filter(models.DetalleVenta.id_venta == id_venta).all()
 
-def listar_pagos_por_microempresa(db: Session, id_microempresa: int):
-    return (
+def listar_pagos_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = (
         db.query(models.PagoVenta)
         .join(models.Venta, models.PagoVenta.id_venta == models.Venta.id_venta)
         .filter(models.Venta.id_microempresa == id_microempresa)
-        .all()
     )
+    return paginar(consulta, models.PagoVenta.id_pago, models.PagoVenta.fecha, cursor, limit)
 
-def listar_detalles_por_microempresa(db: Session, id_microempresa: int):
-    return (
+def listar_detalles_por_microempresa(db: Session, id_microempresa: int, cursor: str = None, limit: int = None):
+    consulta = (
         db.query(models.DetalleVenta)
         .join(models.Venta, models.DetalleVenta.id_venta == models.Venta.id_venta)
         .filter(models.Venta.id_microempresa == id_microempresa)
-        .all()
     )
+    return paginar(consulta, models.DetalleVenta.id_detalle, cursor=cursor, limit=limit)
 
 # --- LÓGICA DE NEGOCIO AVANZADA (Presencial vs Online) ---
 
+def _insertar_detalles(db: Session, id_venta: int, detalles):
+    """Inserta todos los detalles de la venta en un solo INSERT multi-fila (sin commit)."""
+    if not detalles:
+        return
+    db.execute(insert(models.DetalleVenta), [
+        {
+            "id_venta": id_venta,
+            "id_producto": det.id_producto,
+            "cantidad": det.cantidad,
+            "precio_unitario": det.precio_unitario,
+            "subtotal": det.cantidad * det.precio_unitario,
+        }
+        for det in detalles
+    ])
+
+def _programar_eventos_venta(db: Session, tipo_evento: str, mensaje: str, id_microempresa: int, id_venta: int, saldos=()):
+    """El evento de la venta y las alertas de stock se generan recién cuando la venta se confirma."""
+    from app.notificaciones import service as notif_service
+
+    def emitir(sesion: Session):
+        notif_service.generar_evento(
+            tipo_evento=tipo_evento,
+            mensaje=mensaje,
+            id_microempresa=id_microempresa,
+            referencia_id=id_venta,
+            db=sesion
+        )
+        _eventos_stock_bajo(sesion, id_microempresa, saldos)
+
+    al_confirmar(db, emitir)
+
 def crear_venta_presencial(db: Session, id_microempresa: int, venta: schemas.VentaCreate):
-    """Crea venta presencial, marca como PAGADA y descuenta stock inmediatamente"""
+    """
+    Crea venta presencial, marca como PAGADA y descuenta stock inmediatamente.
+    Venta, detalles, descuento de stock y resumen diario se confirman en un solo commit;
+    los eventos se generan después del commit.
+    """
     # Calcular total automáticamente
     total = sum([d.cantidad * d.precio_unitario for d in venta.detalles])
-    
+
     db_venta = models.Venta(
         id_microempresa=id_microempresa,
         id_cliente=venta.id_cliente,
@@ -149,47 +200,43 @@ def crear_venta_presencial(db: Session, id_microempresa: int, venta: schemas.Ven
         fecha=datetime.now()
     )
     db.add(db_venta)
-    db.commit()
-    db.refresh(db_venta)
-    # Crear detalles y descontar stock
-    from app.notificaciones import service as notif_service
-    for det in venta.detalles:
-        db_det = models.DetalleVenta(
-            id_venta=db_venta.id_venta,
-            id_producto=det.id_producto,
-            cantidad=det.cantidad,
-            precio_unitario=det.precio_unitario,
-            subtotal=det.cantidad * det.precio_unitario
-        )
-        db.add(db_det)
-    db.commit()
-    db.refresh(db_venta)
+    db.flush()  # Obtener id_venta (origen de los movimientos del kardex)
+    # Descontar stock de todo el carrito (bloqueo + UPDATE único); falla si no alcanza
+    saldos = descontar_stock_carrito(db, venta.detalles, db_venta.id_venta)
+    _insertar_detalles(db, db_venta.id_venta, venta.detalles)
+    registrar_venta_en_resumen(db, db_venta)
     # Evento de venta pagada
-    notif_service.generar_evento(
+    _programar_eventos_venta(
+        db,
         tipo_evento="VENTA_REALIZADA",
-        mensaje=f"Venta presencial pagada (ID: {db_venta.id_venta}) por un total de {db_venta.total}.",
+        mensaje=f"Venta presencial pagada (ID: {db_venta.id_venta}) por un total de {total:.2f}.",
         id_microempresa=id_microempresa,
-        referencia_id=db_venta.id_venta,
-        db=db
+        id_venta=db_venta.id_venta,
+        saldos=saldos
     )
+    db.commit()
+    invalidar_cache_portal(id_microempresa)
     return db_venta
 
 def crear_venta_online(db: Session, venta: schemas.VentaCreate, cliente_data: dict):
     """
-    Crea venta online:
+    Crea venta online en una sola transacción:
     1. Busca o crea cliente (CORREGIDO: ASIGNA ID_MICROEMPRESA)
     2. Crea venta en estado PENDIENTE_PAGO.
     3. NO descuenta stock (se hace al validar el pago).
     """
-    from datetime import datetime
-    from app.clientes.models import Cliente
-    
     # 1. Buscar o crear cliente
     telefono = cliente_data.get("telefono")
     
     # Intentamos buscar al cliente por teléfono
     db_cliente = db.query(Cliente).filter(Cliente.telefono == telefono).first()
-    
+
+    # 2. Calcular total automáticamente
+    total_calculado = sum([d.cantidad * d.precio_unitario for d in venta.detalles])
+
+    # Validar stock de todo el carrito en una sola consulta antes de registrar la venta online
+    verificar_stock_carrito(db, venta.detalles)
+
     if not db_cliente:
         # CORRECCIÓN: Inyectamos el id_microempresa de la venta al cliente nuevo
         cliente_data["id_microempresa"] = venta.id_microempresa
@@ -198,39 +245,7 @@ def crear_venta_online(db: Session, venta: schemas.VentaCreate, cliente_data: di
         
         db_cliente = Cliente(**cliente_data)
         db.add(db_cliente)
-        db.commit()
-        db.refresh(db_cliente)
-    
-    # 2. Calcular total automáticamente
-    total_calculado = sum([d.cantidad * d.precio_unitario for d in venta.detalles])
-
-    # Validar stock antes de registrar la venta online
-    from app.inventario.models import Stock
-    errores_stock = []
-    for det in venta.detalles:
-        stock = db.query(Stock).filter(Stock.id_producto == det.id_producto).first()
-        if not stock:
-            errores_stock.append({
-                "id_producto": det.id_producto,
-                "error": "Producto no encontrado en inventario",
-                "cantidad_solicitada": det.cantidad,
-                "stock_disponible": 0
-            })
-        elif stock.cantidad < det.cantidad:
-            errores_stock.append({
-                "id_producto": det.id_producto,
-                "error": "Stock insuficiente",
-                "cantidad_solicitada": det.cantidad,
-                "stock_disponible": stock.cantidad
-            })
-    if errores_stock:
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "mensaje": "No se puede registrar la venta por problemas de stock.",
-                "errores": errores_stock
-            }
-        )
+        db.flush()  # Obtener id_cliente
 
     # 3. Crear Venta
     db_venta = models.Venta(
@@ -242,21 +257,11 @@ def crear_venta_online(db: Session, venta: schemas.VentaCreate, cliente_data: di
         fecha=datetime.now()
     )
     db.add(db_venta)
-    db.commit()
-    db.refresh(db_venta)
+    db.flush()  # Obtener id_venta
 
     # 4. Crear detalles (NO descontar stock aquí)
-    for det in venta.detalles:
-        db_det = models.DetalleVenta(
-            id_venta=db_venta.id_venta,
-            id_producto=det.id_producto,
-            cantidad=det.cantidad,
-            precio_unitario=det.precio_unitario,
-            subtotal=det.cantidad * det.precio_unitario
-        )
-        db.add(db_det)
+    _insertar_detalles(db, db_venta.id_venta, venta.detalles)
     db.commit()
-    db.refresh(db_venta)
     return db_venta
 
 def crear_pago_venta_pendiente(db: Session, id_venta: int, pago: schemas.PagoVentaCreate):
@@ -276,17 +281,30 @@ def crear_pago_venta_pendiente(db: Session, id_venta: int, pago: schemas.PagoVen
 def validar_pago_venta(db: Session, id_venta: int):
     """Valida el pago y DESCUENTA EL STOCK"""
     from datetime import datetime
-    venta = db.query(models.Venta).filter(models.Venta.id_venta == id_venta).first()
+    venta = db.query(models.Venta).filter(models.Venta.id_venta == id_venta).with_for_update().first()
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
-    
+    if venta.estado == "PAGADA":
+        # Ya validada (p. ej. doble clic o reintento): no volver a descontar stock
+        return venta
+
+    # Descontar stock de todo el carrito en un solo UPDATE (falla si ya no alcanza)
+    detalles = db.query(models.DetalleVenta).filter(models.DetalleVenta.id_venta == id_venta).all()
+    saldos = descontar_stock_carrito(db, detalles, id_venta)
+
     # Cambiar estado de venta
     venta.estado = "PAGADA"
+    if venta.fecha is None:
+        venta.fecha = datetime.now()
+    registrar_venta_en_resumen(db, venta)
 
     # Validar pago asociado 
     pago = db.query(models.PagoVenta).filter(models.PagoVenta.id_venta == id_venta).order_by(models.PagoVenta.fecha.desc()).first()
     if pago:
         pago.estado = "VALIDADO"
+    db.commit()
+    db.refresh(venta)
+    invalidar_cache_portal(venta.id_microempresa)
 
     # Evento de venta pagada
     from app.notificaciones import service as notif_service
@@ -297,44 +315,51 @@ def validar_pago_venta(db: Session, id_venta: int):
         referencia_id=venta.id_venta,
         db=db
     )
-    # Descontar stock
-    detalles = db.query(models.DetalleVenta).filter(models.DetalleVenta.id_venta == id_venta).all()
-    for det in detalles:
-        stock = db.query(Stock).filter(Stock.id_producto == det.id_producto).first()
-        if stock:
-            stock.cantidad -= det.cantidad
-            stock.ultima_actualizacion = datetime.now()
-            producto = db.query(Producto).filter(Producto.id_producto == det.id_producto).first()
-            if stock.cantidad == 0:
-                notif_service.generar_evento(
-                    tipo_evento="STOCK_AGOTADO",
-                    mensaje=f"El producto '{producto.nombre}' se ha agotado (stock=0)",
-                    id_microempresa=venta.id_microempresa,
-                    referencia_id=producto.id_producto,
-                    db=db
-                )
-            elif stock.cantidad <= stock.stock_minimo:
-                notif_service.generar_evento(
-                    tipo_evento="STOCK_BAJO",
-                    mensaje=f"El producto '{producto.nombre}' está bajo el stock mínimo.",
-                    id_microempresa=venta.id_microempresa,
-                    referencia_id=producto.id_producto,
-                    db=db
-                )
-    db.commit()
-    db.refresh(venta)
+    _eventos_stock_bajo(db, venta.id_microempresa, saldos)
     return venta
 
+def _eventos_stock_bajo(db: Session, id_microempresa: int, saldos):
+    """Genera los eventos STOCK_AGOTADO / STOCK_BAJO para los saldos resultantes de un descuento de carrito."""
+    alertas = [s for s in saldos if s.cantidad <= s.stock_minimo]
+    if not alertas:
+        return
+    from app.notificaciones import service as notif_service
+    nombres = dict(
+        db.query(Producto.id_producto, Producto.nombre)
+        .filter(Producto.id_producto.in_([s.id_producto for s in alertas]))
+        .all()
+    )
+    for s in alertas:
+        nombre = nombres.get(s.id_producto, s.id_producto)
+        if s.cantidad == 0:
+            notif_service.generar_evento(
+                tipo_evento="STOCK_AGOTADO",
+                mensaje=f"El producto '{nombre}' se ha agotado (stock=0)",
+                id_microempresa=id_microempresa,
+                referencia_id=s.id_producto,
+                db=db
+            )
+        else:
+            notif_service.generar_evento(
+                tipo_evento="STOCK_BAJO",
+                mensaje=f"El producto '{nombre}' está bajo el stock mínimo.",
+                id_microempresa=id_microempresa,
+                referencia_id=s.id_producto,
+                db=db
+            )
+
 def rechazar_pago_venta(db: Session, id_venta: int):
-    venta = db.query(models.Venta).filter(models.Venta.id_venta == id_venta).first()
+    venta = db.query(models.Venta).filter(models.Venta.id_venta == id_venta).with_for_update().first()
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
+    if venta.estado in ESTADOS_VENTA_RESUMEN:
+        # Una venta ya pagada que se cancela deja de contar en el resumen diario
+        registrar_venta_en_resumen(db, venta, signo=-1)
     venta.estado = "CANCELADA"
-    db.commit()
     pago = db.query(models.PagoVenta).filter(models.PagoVenta.id_venta == id_venta).order_by(models.PagoVenta.fecha.desc()).first()
     if pago:
         pago.estado = "RECHAZADO"
-        db.commit()
+    db.commit()
     # Evento de venta cancelada
     from app.notificaciones import service as notif_service
     notif_service.generar_evento(
@@ -346,14 +371,49 @@ def rechazar_pago_venta(db: Session, id_venta: int):
     )
     return venta
 
-def listar_ventas_filtrado(db: Session, id_microempresa: int, fecha_inicio=None, fecha_fin=None, estado=None, tipo=None):
-    query = db.query(models.Venta).filter(models.Venta.id_microempresa == id_microempresa)
-    if fecha_inicio:
-        query = query.filter(models.Venta.fecha >= fecha_inicio)
-    if fecha_fin:
-        query = query.filter(models.Venta.fecha <= fecha_fin)
-    if estado:
-        query = query.filter(models.Venta.estado == estado)
-    if tipo:
-        query = query.filter(models.Venta.tipo == tipo)
-    return query.all()
\ No newline at end of file
+def listar_ventas_filtrado(db: Session, id_microempresa: int, fecha_inicio=None, fecha_fin=None, estado=None, tipo=None, cursor: str = None, limit: int = None):
+    consulta = _consulta_ventas(
+        cursor, limit,
+        id_microempresa=id_microempresa, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, estado=estado, tipo=tipo
+    )
+    return _pagina_ventas(db.scalars(consulta).all(), limit)
+
+# ------------------- EXPORTACIÓN EN STREAMING -------------------
+# Columnas planas (no entidades ORM): las filas se serializan sin mantener la identity map.
+
+COLUMNAS_EXPORTACION = {
+    "ventas": (
+        models.Venta.id_venta, models.Venta.fecha, models.Venta.id_cliente,
+        models.Venta.total, models.Venta.estado, models.Venta.tipo,
+    ),
+    "detalles": (
+        models.Venta.id_venta, models.Venta.fecha, models.Venta.estado, models.Venta.tipo,
+        models.DetalleVenta.id_detalle, models.DetalleVenta.id_producto, models.DetalleVenta.cantidad,
+        models.DetalleVenta.precio_unitario, models.DetalleVenta.subtotal,
+    ),
+    "pagos": (
+        models.Venta.id_venta, models.Venta.estado.label("estado_venta"),
+        models.PagoVenta.id_pago, models.PagoVenta.metodo, models.PagoVenta.estado,
+        models.PagoVenta.fecha, models.PagoVenta.comprobante_url,
+    ),
+}
+
+def consulta_exportacion_ventas(conjunto: str, id_microempresa: int, fecha_inicio=None, fecha_fin=None, estado=None, tipo=None):
+    """select() de columnas para exportar; filtros iguales a listar_ventas_filtrado. Devuelve (consulta, nombres)."""
+    if conjunto not in COLUMNAS_EXPORTACION:
+        raise HTTPException(status_code=400, detail=f"Conjunto no soportado. Use: {', '.join(COLUMNAS_EXPORTACION)}")
+    columnas = COLUMNAS_EXPORTACION[conjunto]
+    consulta = select(*columnas)
+    if conjunto == "detalles":
+        consulta = consulta.join(models.DetalleVenta, models.DetalleVenta.id_venta == models.Venta.id_venta)
+        orden = (models.Venta.fecha, models.Venta.id_venta, models.DetalleVenta.id_detalle)
+    elif conjunto == "pagos":
+        consulta = consulta.join(models.PagoVenta, models.PagoVenta.id_venta == models.Venta.id_venta)
+        orden = (models.Venta.fecha, models.Venta.id_venta, models.PagoVenta.id_pago)
+    else:
+        consulta = consulta.select_from(models.Venta)
+        orden = (models.Venta.fecha, models.Venta.id_venta)
+    consulta = _filtrar_ventas(
+        consulta, id_microempresa=id_microempresa, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, estado=estado, tipo=tipo
+    )
+    return consulta.order_by(*orden), [c.key for c in columnas]
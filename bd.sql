@@ -468,3 +468,106 @@ CREATE TABLE notificacion_email_log (
 
     FOREIGN KEY (id_notificacion) REFERENCES notificacion(id_notificacion)
 );
+
+--NUEVA TABLA
+-- Totales diarios para el dashboard de reportes (se llena con reconstruir_resumen_diario.py)
+CREATE TABLE resumen_diario (
+    id_resumen SERIAL PRIMARY KEY,
+    id_microempresa INTEGER NOT NULL,
+    fecha DATE NOT NULL,
+    tipo VARCHAR(10) NOT NULL,          -- VENTA, COMPRA
+    total NUMERIC(12,2) NOT NULL DEFAULT 0,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+
+    FOREIGN KEY (id_microempresa) REFERENCES microempresas(id_microempresa) ON DELETE CASCADE,
+
+    CONSTRAINT uq_resumen_diario_microempresa_fecha_tipo UNIQUE (id_microempresa, fecha, tipo)
+);
+
+-- Índices para la paginación por cursor (fecha, id) de los listados
+CREATE INDEX ix_venta_microempresa_fecha_id ON venta (id_microempresa, fecha, id_venta);
+CREATE INDEX ix_compra_microempresa_fecha_id ON compra (id_microempresa, fecha, id_compra);
+CREATE INDEX ix_cliente_microempresa_fecha_id ON cliente (id_microempresa, fecha_creacion, id_cliente);
+CREATE INDEX ix_producto_microempresa_fecha_id ON producto (id_microempresa, fecha_creacion, id_producto);
+CREATE INDEX ix_notificacion_usuario_fecha_id ON notificacion (id_usuario, fecha_creacion, id_notificacion);
+CREATE INDEX ix_notificacion_microempresa_fecha_id ON notificacion (id_microempresa, fecha_creacion, id_notificacion);
+CREATE INDEX ix_evento_sistema_microempresa_fecha_id ON evento_sistema (id_microempresa, fecha_evento, id_evento);
+
+-- Búsqueda de productos (app/productos/busqueda.py): trigramas y texto completo
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX ix_producto_nombre_trgm ON producto USING gin (lower(nombre) gin_trgm_ops);
+CREATE INDEX ix_producto_codigo_trgm ON producto USING gin (lower(codigo) gin_trgm_ops);
+CREATE INDEX ix_producto_documento_fts ON producto USING gin (to_tsvector('simple', coalesce(nombre, '') || ' ' || coalesce(descripcion, '')));
+CREATE INDEX ix_categoria_nombre_trgm ON categoria USING gin (lower(nombre) gin_trgm_ops);
+
+-- Código de producto único por microempresa (búsqueda por código de barras en caja).
+-- Antes de aplicarlo, revisar duplicados:
+--   SELECT id_microempresa, codigo, COUNT(*) FROM producto WHERE codigo IS NOT NULL GROUP BY 1, 2 HAVING COUNT(*) > 1;
+UPDATE producto SET codigo = NULL WHERE trim(codigo) = '';
+ALTER TABLE producto ADD CONSTRAINT uq_producto_microempresa_codigo UNIQUE (id_microempresa, codigo);
+
+--NUEVA TABLA
+-- Respuestas guardadas por Idempotency-Key (checkout, venta presencial y pagos)
+CREATE TABLE idempotencia (
+    id_idempotencia SERIAL PRIMARY KEY,
+    alcance VARCHAR(50) NOT NULL,       -- usuario:<id_usuario> o anonimo
+    clave VARCHAR(100) NOT NULL,
+    ruta VARCHAR(200) NOT NULL,
+    huella VARCHAR(64) NOT NULL,
+    estado VARCHAR(20) NOT NULL,        -- EN_CURSO, EJECUTADA, COMPLETADA
+    codigo_estado INTEGER,
+    respuesta TEXT,
+    fecha_creacion TIMESTAMP NOT NULL,
+    fecha_expiracion TIMESTAMP NOT NULL,
+
+    CONSTRAINT uq_idempotencia_alcance_ruta_clave UNIQUE (alcance, ruta, clave)
+);
+CREATE INDEX ix_idempotencia_expiracion ON idempotencia (fecha_expiracion);
+
+--NUEVA TABLA
+-- Kardex: un movimiento por cada cambio de stock (solo INSERT; compactar_kardex.py resume el historial viejo)
+CREATE TABLE movimiento_stock (
+    id_movimiento SERIAL PRIMARY KEY,
+    id_producto INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL,           -- + entra, - sale
+    saldo INTEGER NOT NULL,              -- stock resultante
+    tipo_origen VARCHAR(20) NOT NULL,    -- VENTA, COMPRA, AJUSTE, EDICION, INICIAL, BAJA, CIERRE
+    id_origen INTEGER,                   -- id_venta / id_compra según tipo_origen
+    fecha TIMESTAMP NOT NULL,
+
+    FOREIGN KEY (id_producto) REFERENCES producto(id_producto) ON DELETE CASCADE
+);
+CREATE INDEX ix_movimiento_stock_producto_fecha_id ON movimiento_stock (id_producto, fecha, id_movimiento);
+
+-- Saldo de apertura del kardex con el stock actual
+INSERT INTO movimiento_stock (id_producto, cantidad, saldo, tipo_origen, fecha)
+SELECT id_producto, cantidad, cantidad, 'CIERRE', NOW() FROM stock;
+
+-- Variantes redimensionadas de la imagen del producto (app/core/imagenes.py)
+ALTER TABLE producto ADD COLUMN imagen_miniatura TEXT;
+ALTER TABLE producto ADD COLUMN imagen_tarjeta TEXT;
+
+-- notificacion_email_log pasa a ser también la cola de correo saliente (app/notificaciones/correo.py)
+ALTER TABLE notificacion_email_log ALTER COLUMN id_notificacion DROP NOT NULL;
+ALTER TABLE notificacion_email_log ALTER COLUMN fecha_envio DROP DEFAULT;
+ALTER TABLE notificacion_email_log ADD COLUMN asunto VARCHAR(200);
+ALTER TABLE notificacion_email_log ADD COLUMN cuerpo TEXT;
+ALTER TABLE notificacion_email_log ADD COLUMN intentos INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notificacion_email_log ADD COLUMN proximo_intento TIMESTAMP;
+ALTER TABLE notificacion_email_log ADD COLUMN error TEXT;
+ALTER TABLE notificacion_email_log ADD COLUMN fecha_creacion TIMESTAMP;
+CREATE INDEX ix_notificacion_email_log_estado_proximo ON notificacion_email_log (estado, proximo_intento);
+
+-- Reposición del stream de notificaciones desde el último id recibido (app/notificaciones/stream.py)
+CREATE INDEX ix_notificacion_usuario_id ON notificacion (id_usuario, id_notificacion);
+
+-- Contador de notificaciones no leídas por usuario (app/notificaciones/contador.py)
+CREATE TABLE notificacion_contador (
+    id_usuario INTEGER PRIMARY KEY,
+    no_leidas INTEGER NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP NOT NULL,
+
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario) ON DELETE CASCADE
+);
+INSERT INTO notificacion_contador (id_usuario, no_leidas, fecha_actualizacion)
+SELECT id_usuario, COUNT(*), NOW() FROM notificacion WHERE leido = FALSE GROUP BY id_usuario;
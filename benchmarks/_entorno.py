@@ -0,0 +1,59 @@
+"""
+Entorno común de los benchmarks: base propia (BENCH_DATABASE_URL o un SQLite temporal) fijada
+antes de importar la app, todos los modelos registrados y utilidades de medición.
+
+Se ejecutan desde la raíz del repo: python -m benchmarks.<nombre>
+"""
+import importlib
+import os
+import statistics
+import tempfile
+import time
+
+if os.getenv("BENCH_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+else:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from app.database.base import Base
+from app.database.session import engine, SessionLocal
+
+for _modulo in ("microempresas", "users", "auth", "productos", "inventario", "clientes", "suscripciones",
+                "planes", "ventas", "compras", "proveedores", "notificaciones", "reportes"):
+    try:
+        importlib.import_module(f"app.{_modulo}.models")
+    except ModuleNotFoundError:
+        pass
+
+
+def crear_esquema():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def crear_microempresa(db, id_microempresa: int = 1):
+    from app.microempresas.models import Microempresa, Rubro
+    if db.get(Rubro, 1) is None:
+        db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=id_microempresa, nombre=f"Tienda {id_microempresa}", nit=str(id_microempresa),
+                        tipo_atencion="presencial", id_rubro=1))
+    db.commit()
+
+
+def medir(funcion, repeticiones: int = 20) -> float:
+    """Mediana en milisegundos de `repeticiones` llamadas a funcion()."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+
+def tabla(encabezados, filas):
+    anchos = [max(len(str(x)) for x in columna) for columna in zip(encabezados, *filas)]
+    for fila in [encabezados, ["-" * a for a in anchos], *filas]:
+        print("  ".join(str(x).rjust(a) for x, a in zip(fila, anchos)))
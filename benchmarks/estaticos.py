@@ -0,0 +1,100 @@
+"""
+/public: StaticFiles de Starlette contra ArchivosEstaticos (app/core/estaticos.py).
+
+Llama a cada app ASGI directamente (sin red ni servidor) con CONCURRENCIA solicitudes en
+vuelo durante SEGUNDOS por caso y reporta solicitudes por segundo. Los archivos se generan en
+una carpeta temporal con la misma estructura que /public (imágenes con hash en imagenes/).
+
+    python -m benchmarks.estaticos
+    SEGUNDOS=5 CONCURRENCIA=8 python -m benchmarks.estaticos
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks._entorno import tabla
+from fastapi.staticfiles import StaticFiles
+from app.core.estaticos import ArchivosEstaticos
+
+SEGUNDOS = float(os.getenv("SEGUNDOS", 2))
+CONCURRENCIA = int(os.getenv("CONCURRENCIA", 1))
+
+HASH = "0123456789abcdef0123456789abcdef"
+ARCHIVOS = (
+    ("CSS de 3 KB", "css/app.css", 3 * 1024),
+    ("Imagen de 8 KB", f"imagenes/{HASH}_thumb.webp", 8 * 1024),
+    ("Imagen de 300 KB", f"imagenes/{HASH}.webp", 300 * 1024),
+)
+
+
+def _crear_archivos(carpeta: str):
+    for _, ruta, tamano in ARCHIVOS:
+        destino = os.path.join(carpeta, ruta)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, "wb") as archivo:
+            archivo.write(os.urandom(tamano))
+
+
+async def _solicitar(app, ruta: str, cabeceras=()):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/" + ruta, "raw_path": ("/" + ruta).encode(),
+        "root_path": "", "query_string": b"", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"host", b"bench"), (b"accept-encoding", b"gzip, br"), *cabeceras],
+    }
+    estado = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensaje):
+        if mensaje["type"] == "http.response.start":
+            estado["codigo"] = mensaje["status"]
+            estado["cabeceras"] = dict(mensaje["headers"])
+
+    await app(scope, receive, send)
+    return estado
+
+
+async def _por_segundo(app, ruta: str, cabeceras=()) -> float:
+    fin = time.perf_counter() + SEGUNDOS
+    hechas = 0
+
+    async def cliente():
+        nonlocal hechas
+        while time.perf_counter() < fin:
+            await _solicitar(app, ruta, cabeceras)
+            hechas += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(CONCURRENCIA)))
+    return hechas / (time.perf_counter() - inicio)
+
+
+async def main():
+    carpeta = tempfile.mkdtemp(prefix="bench-public-")
+    _crear_archivos(carpeta)
+    simple = StaticFiles(directory=carpeta)
+    nueva = ArchivosEstaticos(directory=carpeta, carpetas_inmutables=["imagenes"])
+    filas = []
+    for nombre, ruta, _ in ARCHIVOS:
+        await _por_segundo(nueva, ruta)  # calienta el LRU
+        filas.append((nombre, f"{await _por_segundo(simple, ruta):.0f}", f"{await _por_segundo(nueva, ruta):.0f}"))
+
+    # Revalidación: el navegador reenvía el ETag y recibe 304 sin cuerpo
+    ruta_css = ARCHIVOS[0][1]
+    etag = (await _solicitar(nueva, ruta_css))["cabeceras"][b"etag"]
+    assert (await _solicitar(nueva, ruta_css, [(b"if-none-match", etag)]))["codigo"] == 304
+    etag_simple = (await _solicitar(simple, ruta_css))["cabeceras"][b"etag"]
+    filas.append((
+        "CSS con If-None-Match (304)",
+        f"{await _por_segundo(simple, ruta_css, [(b'if-none-match', etag_simple)]):.0f}",
+        f"{await _por_segundo(nueva, ruta_css, [(b'if-none-match', etag)]):.0f}",
+    ))
+    print(f"req/s, {CONCURRENCIA} en vuelo, {SEGUNDOS:g} s por caso")
+    tabla(("archivo", "StaticFiles", "ArchivosEstaticos"), filas)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
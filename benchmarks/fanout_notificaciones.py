@@ -0,0 +1,91 @@
+"""
+Costo del fan-out de VENTA_REALIZADA según la cantidad de destinatarios.
+
+Para cada valor de DESTINATARIOS crea una microempresa con ese número de vendedores y mide
+generar_evento (fan-out masivo: un SELECT de destinatarios con anti-join y un INSERT
+multi-fila) contra crear una notificación por usuario con crear_notificacion_usuario, que era
+el camino anterior. Reporta la mediana en ms y las sentencias SQL por evento.
+
+    python -m benchmarks.fanout_notificaciones
+    DESTINATARIOS=1,10,100,1000,5000 python -m benchmarks.fanout_notificaciones
+"""
+import os
+import statistics
+import time
+
+from sqlalchemy import event, insert
+
+from benchmarks._entorno import SessionLocal, crear_esquema, crear_microempresa, engine, tabla
+from app.auth.base_user import Usuario
+from app.notificaciones import service
+from app.notificaciones.models import Notificacion
+from app.users.models import Vendedor
+
+DESTINATARIOS = [int(d) for d in os.getenv("DESTINATARIOS", "1,10,100,1000,5000").split(",")]
+REPETICIONES = int(os.getenv("REPETICIONES", 5))
+
+sentencias = []
+event.listen(engine, "before_cursor_execute", lambda *args: sentencias.append(1))
+
+
+def cargar(db, id_microempresa: int, cantidad: int):
+    crear_microempresa(db, id_microempresa)
+    primero = id_microempresa * 100000
+    ids = list(range(primero, primero + cantidad))
+    db.execute(insert(Usuario), [{"id_usuario": i, "nombre": f"v{i}", "email": f"v{i}@bench.com", "password_hash": "x"} for i in ids])
+    db.execute(insert(Vendedor), [{"id_usuario": i, "id_microempresa": id_microempresa} for i in ids])
+    db.commit()
+    return ids
+
+
+def medir(funcion, preparar=None):
+    """Mediana en ms y sentencias por llamada; preparar() corre antes de cada una, fuera de la medición."""
+    tiempos, cantidades = [], []
+    for repeticion in range(REPETICIONES):
+        if preparar is not None:
+            preparar()
+        sentencias.clear()
+        inicio = time.perf_counter()
+        funcion(repeticion)
+        tiempos.append(time.perf_counter() - inicio)
+        cantidades.append(len(sentencias))
+    return statistics.median(tiempos) * 1000, max(cantidades)
+
+
+def main():
+    crear_esquema()
+    db = SessionLocal()
+    filas = []
+    for n, cantidad in enumerate(DESTINATARIOS, start=1):
+        ids = cargar(db, n, cantidad)
+
+        def masivo(repeticion):
+            # referencia_id distinto: cada evento es nuevo y no lo descarta la deduplicación de eventos
+            service.generar_evento("VENTA_REALIZADA", "Venta registrada", n, referencia_id=repeticion, db=db)
+
+        def sin_notificaciones_recientes():
+            # Las notificaciones iguales del último minuto se omiten: se borran para medir el fan-out completo
+            db.query(Notificacion).filter_by(id_microempresa=n).delete()
+            db.commit()
+
+        def por_usuario(repeticion):
+            for id_usuario in ids:
+                service.crear_notificacion_usuario(db, n, id_usuario, "VENTA_REALIZADA", "IN_APP", "Venta registrada")
+            db.commit()
+
+        def creadas():
+            return db.query(Notificacion).filter_by(id_microempresa=n, tipo_evento="VENTA_REALIZADA").count()
+
+        ms_masivo, sql_masivo = medir(masivo, sin_notificaciones_recientes)
+        assert creadas() == cantidad
+        ms_usuario, sql_usuario = medir(por_usuario, sin_notificaciones_recientes)
+        assert creadas() == cantidad
+        filas.append((cantidad, f"{ms_masivo:.1f}", sql_masivo, f"{ms_masivo * 1000 / cantidad:.0f}",
+                      f"{ms_usuario:.1f}", sql_usuario))
+    db.close()
+    print(f"VENTA_REALIZADA, mediana de {REPETICIONES} eventos ({engine.dialect.name})")
+    tabla(("destinatarios", "masivo_ms", "masivo_sql", "us_por_destinatario", "por_usuario_ms", "por_usuario_sql"), filas)
+
+
+if __name__ == "__main__":
+    main()
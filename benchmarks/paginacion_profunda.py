@@ -0,0 +1,77 @@
+"""
+Costo de una página según su profundidad: OFFSET contra el cursor keyset de app/core/paginacion.py.
+
+Carga VENTAS ventas de una microempresa (más ruido de otras) y mide la mediana de pedir
+LIMITE filas a distintas profundidades con la misma consulta de listado (WHERE id_microempresa
+ORDER BY fecha DESC, id_venta DESC). Con OFFSET el costo crece con la profundidad; con el
+cursor se mantiene plano gracias al índice (id_microempresa, fecha, id_venta).
+
+    python -m benchmarks.paginacion_profunda
+    VENTAS=500000 BENCH_DATABASE_URL=postgresql://... python -m benchmarks.paginacion_profunda
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from benchmarks._entorno import SessionLocal, crear_esquema, crear_microempresa, medir, tabla
+from app.core.paginacion import aplicar_keyset, cerrar_pagina, codificar_cursor
+from app.ventas.models import Venta
+
+VENTAS = int(os.getenv("VENTAS", 200000))
+LIMITE = int(os.getenv("LIMITE", 100))
+
+
+def cargar(db):
+    crear_microempresa(db, 1)
+    crear_microempresa(db, 2)
+    inicio = datetime(2024, 1, 1)
+    lote = []
+    for i in range(VENTAS * 5 // 4):
+        # Una de cada cinco ventas es de otra microempresa; varias ventas comparten fecha
+        lote.append({"id_microempresa": 2 if i % 5 == 4 else 1, "fecha": inicio + timedelta(seconds=30 * (i // 3)),
+                     "total": 10, "estado": "completada", "tipo": "presencial"})
+        if len(lote) == 10000:
+            db.execute(insert(Venta), lote)
+            lote.clear()
+    if lote:
+        db.execute(insert(Venta), lote)
+    db.commit()
+
+
+def consulta_base():
+    return select(Venta).where(Venta.id_microempresa == 1).order_by(Venta.fecha.desc(), Venta.id_venta.desc())
+
+
+def main():
+    crear_esquema()
+    db = SessionLocal()
+    cargar(db)
+    profundidades = [0, 1000, 10000, 50000, VENTAS - LIMITE]
+    filas = []
+    for profundidad in profundidades:
+        def por_offset():
+            return db.scalars(consulta_base().offset(profundidad).limit(LIMITE)).all()
+
+        # Cursor de la fila anterior a la página, como lo devolvería X-Next-Cursor
+        cursor = None
+        if profundidad:
+            anterior = db.execute(consulta_base().offset(profundidad - 1).limit(1)).scalar_one()
+            cursor = codificar_cursor(anterior.fecha, anterior.id_venta)
+
+        def por_cursor():
+            consulta = aplicar_keyset(consulta_base(), Venta.id_venta, Venta.fecha, cursor, LIMITE)
+            return cerrar_pagina(db.scalars(consulta).all(), Venta.id_venta, Venta.fecha, LIMITE)
+
+        # Ambas estrategias devuelven la misma página
+        assert [v.id_venta for v in por_offset()] == [v.id_venta for v in por_cursor()]
+        db.expunge_all()
+        filas.append((profundidad, f"{medir(por_offset):.2f}", f"{medir(por_cursor):.2f}"))
+        db.expunge_all()
+    db.close()
+    print(f"{VENTAS} ventas, páginas de {LIMITE} ({SessionLocal.kw['bind'].dialect.name})")
+    tabla(("profundidad", "offset_ms", "cursor_ms"), filas)
+
+
+if __name__ == "__main__":
+    main()
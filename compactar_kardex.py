@@ -0,0 +1,48 @@
+"""
+Compacta el kardex (movimiento_stock) y verifica que cuadre con la tabla stock.
+Pensado para correr periódicamente (cron).
+
+    python compactar_kardex.py                  # compacta lo anterior a KARDEX_RETENCION_DIAS
+    python compactar_kardex.py --dias 90        # otro período de retención
+    python compactar_kardex.py 3                # solo la microempresa 3
+    python compactar_kardex.py --verificar      # solo compara, no escribe
+    python compactar_kardex.py --reparar        # además iguala stock al saldo del kardex
+"""
+import sys
+from datetime import datetime, timedelta
+from app.core.config import KARDEX_RETENCION_DIAS
+from app.database.session import SessionLocal
+# Registrar todos los modelos para que las relaciones se resuelvan
+from app.auth.base_user import Usuario
+from app.users.models import AdminMicroempresa, Vendedor
+from app.microempresas.models import Microempresa
+from app.clientes.models import Cliente
+from app.productos.models import Producto
+from app.inventario.models import Stock
+from app.proveedores.models import Proveedor
+from app.compras.models import Compra
+from app.ventas.models import Venta
+from app.notificaciones.models import Notificacion
+from app.inventario.kardex import compactar_kardex, verificar_kardex, reconstruir_stock
+
+dias = KARDEX_RETENCION_DIAS
+if "--dias" in sys.argv:
+    dias = int(sys.argv[sys.argv.index("--dias") + 1])
+argumentos = [a for i, a in enumerate(sys.argv[1:], 1) if not a.startswith("--") and sys.argv[i - 1] != "--dias"]
+id_microempresa = int(argumentos[0]) if argumentos else None
+
+db = SessionLocal()
+if "--verificar" not in sys.argv:
+    resultado = compactar_kardex(db, datetime.now() - timedelta(days=dias), id_microempresa)
+    print(f"Kardex compactado: {resultado['productos']} productos, {resultado['movimientos_eliminados']} movimientos resumidos")
+    if "--reparar" in sys.argv:
+        print(f"Stock reconstruido desde el kardex: {reconstruir_stock(db, id_microempresa)} productos")
+
+resultado = verificar_kardex(db, id_microempresa)
+if resultado["consistente"]:
+    print(f"Kardex consistente ({resultado['revisados']} productos revisados)")
+else:
+    for d in resultado["diferencias"]:
+        print(f"Diferencia: {d}")
+db.close()
+sys.exit(0 if resultado["consistente"] else 1)
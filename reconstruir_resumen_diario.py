@@ -0,0 +1,38 @@
+"""
+Reconstruye la tabla resumen_diario desde venta/compra y verifica que cuadre.
+
+    python reconstruir_resumen_diario.py                 # todas las microempresas
+    python reconstruir_resumen_diario.py 3               # solo la microempresa 3
+    python reconstruir_resumen_diario.py --verificar     # solo compara, no escribe
+"""
+import sys
+from app.database.session import SessionLocal
+# Registrar todos los modelos para que las relaciones se resuelvan
+from app.auth.base_user import Usuario
+from app.users.models import AdminMicroempresa, Vendedor
+from app.microempresas.models import Microempresa
+from app.clientes.models import Cliente
+from app.productos.models import Producto
+from app.inventario.models import Stock
+from app.proveedores.models import Proveedor
+from app.compras.models import Compra
+from app.ventas.models import Venta
+from app.notificaciones.models import Notificacion
+from app.reportes.service import reconstruir_resumen_diario, verificar_resumen_diario
+
+argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+id_microempresa = int(argumentos[0]) if argumentos else None
+
+db = SessionLocal()
+if "--verificar" not in sys.argv:
+    filas = reconstruir_resumen_diario(db, id_microempresa)
+    print(f"Resumen diario reconstruido: {filas} filas")
+
+resultado = verificar_resumen_diario(db, id_microempresa)
+if resultado["consistente"]:
+    print(f"Resumen consistente ({resultado['revisadas']} días/tipo revisados)")
+else:
+    for d in resultado["diferencias"]:
+        print(f"Diferencia: {d}")
+db.close()
+sys.exit(0 if resultado["consistente"] else 1)
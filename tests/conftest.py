@@ -0,0 +1,55 @@
+"""
+Pruebas sobre SQLite: DATABASE_URL se fija antes de importar la app (load_dotenv no pisa
+variables ya definidas) y cada prueba arranca con el esquema recién creado.
+"""
+import importlib
+import os
+import tempfile
+
+_ARCHIVO_DB = os.path.join(tempfile.mkdtemp(prefix="backend-taller-"), "pruebas.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_ARCHIVO_DB}"
+os.environ.setdefault("SECRET_KEY", "pruebas")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("EVENTOS_ASINCRONOS", "false")
+os.environ.setdefault("CORREO_ASINCRONO", "false")
+
+import pytest
+from sqlalchemy import event
+
+from app.database.base import Base
+from app.database.session import engine, SessionLocal
+
+# Todos los modelos registrados en Base.metadata (como init_db)
+for _modulo in ("microempresas", "users", "auth", "productos", "inventario", "clientes", "suscripciones",
+                "planes", "ventas", "compras", "proveedores", "notificaciones", "reportes"):
+    try:
+        importlib.import_module(f"app.{_modulo}.models")
+    except ModuleNotFoundError:
+        pass
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def contar_consultas():
+    """Devuelve una lista que acumula las sentencias ejecutadas por el engine mientras dura la prueba."""
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, "before_cursor_execute", _registrar)
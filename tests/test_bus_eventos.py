@@ -0,0 +1,76 @@
+"""Un lote que falla no pierde eventos: se reintentan uno por uno y los fallidos se difieren con backoff."""
+import queue
+from datetime import datetime
+
+from app.notificaciones import service
+from app.notificaciones.bus import BusEventos, EventoPendiente
+
+
+def _evento(referencia_id: int):
+    return EventoPendiente("VENTA_REALIZADA", "Venta registrada", 1, referencia_id, datetime.now())
+
+
+def _bus(**kwargs):
+    bus = BusEventos(workers=0, backoff_base=60, **kwargs)
+    bus.activar_modo_prueba()
+    return bus
+
+
+def test_evento_defectuoso_no_descarta_el_lote(db, monkeypatch):
+    procesados = []
+
+    def procesar(db, eventos):
+        if any(ev.referencia_id == 2 for ev in eventos):
+            raise RuntimeError("evento defectuoso")
+        procesados.extend(ev.referencia_id for ev in eventos)
+        return len(eventos)
+
+    monkeypatch.setattr(service, "procesar_lote_eventos", procesar)
+    bus = _bus(max_intentos=3)
+    for referencia_id in (1, 2, 3):
+        bus.publicar(_evento(referencia_id))
+
+    bus.drenar(db)
+    assert sorted(procesados) == [1, 3]
+    # El evento 2 espera su backoff fuera de la cola; el fallo del lote no se cuenta aparte
+    metricas = bus.metricas()
+    assert (metricas["fallidos"], metricas["reintentos"], metricas["diferidos"]) == (1, 1, 1)
+
+    bus.drenar(db, incluir_diferidos=True)
+    metricas = bus.metricas()
+    assert (metricas["fallidos"], metricas["reintentos"], metricas["descartados"], metricas["diferidos"]) == (3, 2, 1, 0)
+
+
+def test_falla_en_linea_con_cola_llena_se_difiere(db, monkeypatch):
+    fallas = [RuntimeError("base no disponible")]
+    procesados = []
+
+    def procesar(db, eventos):
+        if fallas:
+            raise fallas.pop()
+        procesados.extend(ev.referencia_id for ev in eventos)
+        return len(eventos)
+
+    monkeypatch.setattr(service, "procesar_lote_eventos", procesar)
+    bus = _bus()
+    bus.cola = queue.Queue(maxsize=1)
+    bus.espera_max = 0
+    bus.publicar(_evento(1))
+    bus.publicar(_evento(2))  # cola llena: se procesa en línea y falla
+
+    bus.drenar(db)
+    assert procesados == [1]
+    assert bus.metricas()["diferidos"] == 1
+    bus.drenar(db, incluir_diferidos=True)
+    assert procesados == [1, 2]
+    metricas = bus.metricas()
+    assert (metricas["fallidos"], metricas["reintentos"], metricas["descartados"]) == (1, 1, 0)
+
+
+def test_backoff_exponencial(monkeypatch):
+    bus = BusEventos(workers=0, max_intentos=10, backoff_base=1, backoff_max=5)
+    bus.activar_modo_prueba()
+    monkeypatch.setattr("app.notificaciones.bus.time.monotonic", lambda: 100.0)
+    for intentos in range(4):
+        bus._diferir(_evento(1)._replace(intentos=intentos))
+    assert sorted(vence for vence, _, _ in bus._diferidos) == [101, 102, 104, 105]
@@ -0,0 +1,48 @@
+"""Búsqueda de productos (índice en memoria en SQLite): exacta, prefijo, error de tipeo y subcadena."""
+from datetime import datetime
+
+import pytest
+
+from app.microempresas.models import Microempresa, Rubro
+from app.productos import busqueda, models
+
+NOMBRES = {1: "Arroz blanco", 2: "Azúcar rubia", 3: "Aceite de girasol", 4: "Harina de trigo"}
+
+
+@pytest.fixture
+def catalogo(db):
+    busqueda.cache_indices.limpiar()
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.add(models.Categoria(id_categoria=1, id_microempresa=1, nombre="Abarrotes", fecha_creacion=datetime.now()))
+    for id_producto, nombre in NOMBRES.items():
+        db.add(models.Producto(id_producto=id_producto, id_microempresa=1, id_categoria=1, nombre=nombre,
+                               codigo=f"750{id_producto}", precio_venta=5, estado=True, fecha_creacion=datetime.now()))
+    db.commit()
+    yield lambda texto, **kwargs: [p.nombre for p in busqueda.buscar_productos(db, 1, texto, **kwargs)]
+    busqueda.cache_indices.limpiar()
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("arroz", "Arroz blanco"),          # exacta
+    ("azucar", "Azúcar rubia"),         # sin tildes
+    ("gira", "Aceite de girasol"),      # prefijo
+    ("aroz", "Arroz blanco"),           # error de tipeo
+    ("rroz", "Arroz blanco"),           # subcadena, como el ILIKE anterior
+    ("7503", "Aceite de girasol"),      # código
+])
+def test_primer_resultado(catalogo, texto, esperado):
+    assert catalogo(texto)[0] == esperado
+
+
+def test_coincidencia_exacta_antes_que_subcadena(catalogo):
+    # "de" es palabra de dos nombres y subcadena de ninguno más
+    assert catalogo("de") == ["Harina de trigo", "Aceite de girasol"]
+    assert catalogo("xyz") == []
+
+
+def test_pagina_por_posicion(catalogo):
+    todos = catalogo("a")
+    assert sorted(todos) == sorted(NOMBRES.values())
+    primera = catalogo("a", limit=2)
+    assert primera == todos[:2]
@@ -0,0 +1,30 @@
+"""La exportación del catálogo (incluye costo_compra) solo la descarga alguien de la microempresa."""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import Principal, get_current_user
+from app.microempresas.models import Microempresa, Rubro
+from app.productos.router import router as router_productos
+
+
+def _cliente(principal=None):
+    app = FastAPI()
+    app.include_router(router_productos)
+    if principal is not None:
+        app.dependency_overrides[get_current_user] = lambda: principal
+    return TestClient(app)
+
+
+def test_exportar_catalogo_exige_pertenecer_a_la_microempresa(db):
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.commit()
+    ruta = "/productos/microempresa/1/exportar"
+
+    assert _cliente().get(ruta).status_code == 401
+    assert _cliente(Principal(2, "a", "a@prueba.com", True, "adminmicroempresa", 2)).get(ruta).status_code == 403
+    assert _cliente(Principal(3, "u", "u@prueba.com", True, "usuario")).get(ruta).status_code == 403
+    respuesta = _cliente(Principal(4, "v", "v@prueba.com", True, "vendedor", 1)).get(ruta)
+    assert respuesta.status_code == 200
+    assert "costo_compra" in respuesta.text.splitlines()[0]
+    assert _cliente(Principal(5, "s", "s@prueba.com", True, "superadmin")).get(ruta).status_code == 200
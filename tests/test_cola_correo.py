@@ -0,0 +1,85 @@
+"""Si se cae la conexión SMTP a mitad de lote, solo el correo que falló cuenta el intento."""
+import smtplib
+
+from app.notificaciones import correo
+from app.notificaciones.correo import ColaCorreo, encolar_correo
+from app.notificaciones.models import NotificacionEmailLog
+
+
+class SMTPQueSeCae:
+    """Envía los primeros `exitosos` correos y después pierde la conexión."""
+    conexiones = 0
+    timeout = 20
+
+    def __init__(self, exitosos: int):
+        self.exitosos = exitosos
+        self.destinos = []
+
+    def enviar(self, remitente, destino, mensaje):
+        if len(self.destinos) >= self.exitosos:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.destinos.append(destino)
+
+    def cerrar(self):
+        pass
+
+
+def test_caida_de_conexion_cuenta_intento_solo_al_correo_que_fallo(db, monkeypatch):
+    cola = ColaCorreo(asincrona=False)
+    cola.activar_modo_prueba()
+    monkeypatch.setattr(correo, "cola_correo", cola)
+    cola.smtp = SMTPQueSeCae(exitosos=1)
+    for i in range(4):
+        encolar_correo(db, f"c{i}@prueba.com", "Asunto", "Cuerpo")
+    db.commit()
+
+    assert cola.procesar_lote(db) == 4
+    db.expire_all()
+    correos = db.query(NotificacionEmailLog).order_by(NotificacionEmailLog.id_log).all()
+    assert [(c.estado, c.intentos) for c in correos] == [
+        ("ENVIADO", 1), ("PENDIENTE", 1), ("PENDIENTE", 0), ("PENDIENTE", 0),
+    ]
+    assert all(c.proximo_intento is not None for c in correos[1:])
+    metricas = cola.metricas()
+    assert (metricas["reintentos"], metricas["reprogramados_por_caida"]) == (1, 2)
+
+
+def test_enviados_y_fallidos_no_guardan_el_cuerpo(db, monkeypatch):
+    cola = ColaCorreo(asincrona=False)
+    cola.activar_modo_prueba()
+    monkeypatch.setattr(correo, "cola_correo", cola)
+    monkeypatch.setattr(correo, "CORREO_MAX_INTENTOS", 1)
+    cola.smtp = SMTPQueSeCae(exitosos=1)
+    encolar_correo(db, "a@prueba.com", "Recuperar", "token=secreto")
+    encolar_correo(db, "b@prueba.com", "Recuperar", "token=secreto")
+    db.commit()
+
+    cola.procesar_lote(db)
+    db.expire_all()
+    correos = db.query(NotificacionEmailLog).order_by(NotificacionEmailLog.id_log).all()
+    assert [(c.estado, c.cuerpo) for c in correos] == [("ENVIADO", None), ("FALLIDO", None)]
+
+
+def test_arrendamiento_se_renueva_durante_un_lote_lento(db, monkeypatch):
+    cola = ColaCorreo(asincrona=False)
+    cola.activar_modo_prueba()
+    monkeypatch.setattr(correo, "cola_correo", cola)
+    reloj = [0.0]
+    monkeypatch.setattr(correo.time, "monotonic", lambda: reloj[0])
+    arrendamientos = []
+    arrendar = cola._arrendar
+    monkeypatch.setattr(cola, "_arrendar", lambda db, ids: arrendamientos.append(reloj[0]) or arrendar(db, ids))
+
+    class SMTPLento(SMTPQueSeCae):
+        def enviar(self, remitente, destino, mensaje):
+            reloj[0] += 100  # cada envío tarda 100 s; el arrendamiento es de 300 s
+            super().enviar(remitente, destino, mensaje)
+
+    cola.smtp = SMTPLento(exitosos=10)
+    for i in range(6):
+        encolar_correo(db, f"c{i}@prueba.com", "Asunto", "Cuerpo")
+    db.commit()
+
+    assert cola.procesar_lote(db) == 6
+    # Se renueva antes de quedar menos de 4 * timeout (80 s) de arrendamiento
+    assert arrendamientos == [0, 300]
@@ -0,0 +1,40 @@
+"""La importación de facturas de compra solo la hace alguien de la microempresa."""
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.compras import service
+from app.compras.router import router as router_compras
+from app.core.dependencies import Principal, get_current_user
+
+
+def _cliente(principal=None):
+    app = FastAPI()
+    app.include_router(router_compras)
+    if principal is not None:
+        app.dependency_overrides[get_current_user] = lambda: principal
+    return TestClient(app)
+
+
+def _importar(cliente):
+    return cliente.post(
+        "/compras/importar",
+        data={"id_microempresa": 1, "id_proveedor": 1},
+        files={"archivo": ("factura.csv", b"codigo,cantidad,precio_unitario\n7501,2,5\n", "text/csv")},
+    )
+
+
+def test_importar_factura_exige_pertenecer_a_la_microempresa(db, monkeypatch):
+    importadas = []
+
+    def importar(db, id_microempresa, *args):
+        importadas.append(id_microempresa)
+        raise HTTPException(status_code=422, detail="Producto no encontrado: 7501")
+
+    monkeypatch.setattr(service, "importar_factura_compra", importar)
+
+    assert _importar(_cliente()).status_code == 401
+    assert _importar(_cliente(Principal(2, "a", "a@prueba.com", True, "adminmicroempresa", 2))).status_code == 403
+    assert _importar(_cliente(Principal(3, "u", "u@prueba.com", True, "usuario"))).status_code == 403
+    assert importadas == []
+    assert _importar(_cliente(Principal(4, "v", "v@prueba.com", True, "vendedor", 1))).status_code == 422
+    assert importadas == [1]
@@ -0,0 +1,61 @@
+"""El directorio de usuarios hace las mismas consultas con N o con M usuarios (sin N+1)."""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth.base_user import Usuario
+from app.auth.models import SuperAdmin
+from app.microempresas.models import Microempresa, Rubro
+from app.users.models import AdminMicroempresa, Vendedor
+from app.users.router import router as router_usuarios
+from app.users.service import listar_directorio_por_rol
+
+
+def _cargar_usuarios(db, desde: int, cantidad: int):
+    """`cantidad` usuarios de cada tipo: vendedores, administradores, superadmins y sin rol."""
+    for i in range(desde, desde + cantidad):
+        for j, rol in enumerate(("vendedor", "admin", "superadmin", "usuario")):
+            id_usuario = i * 10 + j
+            db.add(Usuario(id_usuario=id_usuario, nombre=f"u{id_usuario}", email=f"u{id_usuario}@prueba.com", password_hash="x"))
+            if rol == "vendedor":
+                db.add(Vendedor(id_usuario=id_usuario, id_microempresa=1))
+            elif rol == "admin":
+                db.add(AdminMicroempresa(id_usuario=id_usuario, id_microempresa=1))
+            elif rol == "superadmin":
+                db.add(SuperAdmin(id_usuario=id_usuario))
+    db.commit()
+
+
+def _consultas_directorio(cliente, db, contar_consultas):
+    """Sentencias de GET /usuarios/ y de los listados por rol; devuelve también los tamaños."""
+    contar_consultas.clear()
+    respuesta = cliente.get("/usuarios/")
+    assert respuesta.status_code == 200
+    usuarios = respuesta.json()
+    consultas_listado = len(contar_consultas)
+
+    contar_consultas.clear()
+    vendedores = listar_directorio_por_rol(db, Vendedor, "vendedor", id_microempresa=1)
+    admins = listar_directorio_por_rol(db, AdminMicroempresa, "adminmicroempresa")
+    consultas_por_rol = len(contar_consultas)
+    return consultas_listado, consultas_por_rol, len(usuarios), len(vendedores), len(admins)
+
+
+def test_directorio_usuarios_consultas_constantes(db, contar_consultas):
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(router_usuarios)
+    cliente = TestClient(app)
+
+    _cargar_usuarios(db, 1, 3)
+    pocos = _consultas_directorio(cliente, db, contar_consultas)
+    _cargar_usuarios(db, 4, 40)
+    muchos = _consultas_directorio(cliente, db, contar_consultas)
+
+    assert pocos[2:] == (12, 3, 3)
+    assert muchos[2:] == (172, 43, 43)
+    # Misma cantidad de sentencias con 12 que con 172 usuarios
+    assert muchos[:2] == pocos[:2]
+    assert pocos[:2] == (1, 2)
@@ -0,0 +1,126 @@
+"""Idempotency-Key: una operación confirmada no se repite aunque falle todo lo que viene después."""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from app.core import idempotencia
+from app.core.idempotencia import ContextoIdempotencia, SolicitudIdempotente, alcance_de_token
+from app.core.security import create_access_token
+from app.database.session import SessionLocal
+from app.microempresas.models import Rubro
+
+
+class RubroResponse(BaseModel):
+    id_rubro: int
+    nombre: str
+
+    class Config:
+        from_attributes = True
+
+
+def _contexto(clave: str, alcance: str = "anonimo"):
+    return ContextoIdempotencia(clave, "POST /pruebas", "huella", alcance)
+
+
+def _crear_rubro(db, nombre: str):
+    def funcion():
+        rubro = Rubro(nombre=nombre)
+        db.add(rubro)
+        db.commit()
+        db.refresh(rubro)
+        return rubro
+    return funcion
+
+
+def _rubros(db):
+    db.expire_all()
+    return db.query(Rubro).count()
+
+
+def _fila(db, clave: str):
+    db.expire_all()
+    return db.query(SolicitudIdempotente).filter_by(clave=clave).one_or_none()
+
+
+def test_reintento_devuelve_la_respuesta_guardada(db):
+    primera = _contexto("k1").ejecutar(_crear_rubro(db, "a"), RubroResponse, db=db)
+    idempotencia.cache_idempotencia.invalidar(_contexto("k1").llave)
+    repetida = _contexto("k1").ejecutar(_crear_rubro(db, "a"), RubroResponse, db=db)
+    assert repetida.body == primera.body
+    assert repetida.headers[idempotencia.CABECERA_REPETIDA] == "true"
+    assert _rubros(db) == 1
+    assert _fila(db, "k1").estado == "COMPLETADA"
+
+
+def test_falla_al_serializar_despues_del_commit_no_libera_la_clave(db, monkeypatch):
+    monkeypatch.setattr(idempotencia, "IDEMPOTENCIA_ARRENDAMIENTO", 0)
+
+    def sin_nombre():
+        _crear_rubro(db, "b")()
+        return {"id_rubro": 1}  # no valida contra RubroResponse
+
+    with pytest.raises(Exception):
+        _contexto("k2").ejecutar(sin_nombre, RubroResponse, db=db)
+    assert _fila(db, "k2").estado == "EJECUTADA"
+    with pytest.raises(HTTPException) as error:
+        _contexto("k2").ejecutar(_crear_rubro(db, "b"), RubroResponse, db=db)
+    assert error.value.status_code == 409
+    assert _rubros(db) == 1
+
+
+def test_error_antes_del_commit_libera_la_clave(db):
+    def falla():
+        db.add(Rubro(nombre="c"))
+        raise HTTPException(status_code=400, detail="Stock insuficiente")
+
+    with pytest.raises(HTTPException):
+        _contexto("k3").ejecutar(falla, RubroResponse, db=db)
+    db.rollback()
+    assert _fila(db, "k3") is None
+    _contexto("k3").ejecutar(_crear_rubro(db, "c"), RubroResponse, db=db)
+    assert _rubros(db) == 1
+
+
+def test_clave_en_curso_de_un_proceso_caido_se_recupera(db, monkeypatch):
+    monkeypatch.setattr(idempotencia, "IDEMPOTENCIA_ARRENDAMIENTO", 60)
+    hace_rato = datetime.now() - timedelta(minutes=5)
+    db.add(SolicitudIdempotente(alcance="anonimo", clave="k4", ruta="POST /pruebas", huella="huella", estado="EN_CURSO",
+                                fecha_creacion=hace_rato, fecha_expiracion=hace_rato + timedelta(hours=24)))
+    db.commit()
+    respuesta = _contexto("k4").ejecutar(_crear_rubro(db, "d"), RubroResponse, db=db)
+    assert respuesta.status_code == 200
+    assert _fila(db, "k4").estado == "COMPLETADA"
+
+
+def test_dueno_original_no_confirma_si_le_recuperaron_la_clave(db, monkeypatch):
+    monkeypatch.setattr(idempotencia, "IDEMPOTENCIA_ARRENDAMIENTO", 0)
+    otra = SessionLocal()
+    try:
+        def recuperada_durante_la_operacion():
+            # Mientras la original trabaja, un reintento de otro proceso la da por caída y toma la clave
+            idempotencia._en_curso.pop(_contexto("k5").llave)
+            _contexto("k5").ejecutar(_crear_rubro(otra, "reintento"), RubroResponse, db=otra)
+            return _crear_rubro(db, "original")()
+
+        with pytest.raises(HTTPException) as error:
+            _contexto("k5").ejecutar(recuperada_durante_la_operacion, RubroResponse, db=db)
+        assert error.value.status_code == 409
+        db.rollback()
+        assert [r.nombre for r in db.query(Rubro)] == ["reintento"]
+    finally:
+        otra.close()
+
+
+def test_misma_clave_de_otro_usuario_no_recibe_la_respuesta_guardada(db):
+    ana = alcance_de_token(create_access_token(data={"sub": "1"}, expires_minutes=5))
+    beto = alcance_de_token(create_access_token(data={"sub": "2"}, expires_minutes=5))
+    assert (ana, beto, alcance_de_token("no-es-un-jwt"), alcance_de_token(None)) == ("usuario:1", "usuario:2", "anonimo", "anonimo")
+
+    primera = _contexto("k6", ana).ejecutar(_crear_rubro(db, "de ana"), RubroResponse, db=db)
+    segunda = _contexto("k6", beto).ejecutar(_crear_rubro(db, "de beto"), RubroResponse, db=db)
+    assert idempotencia.CABECERA_REPETIDA not in segunda.headers
+    assert segunda.body != primera.body
+    assert _rubros(db) == 2
+    assert _contexto("k6", ana).ejecutar(_crear_rubro(db, "otra"), RubroResponse, db=db).body == primera.body
@@ -0,0 +1,58 @@
+"""El kardex solo lo consulta alguien de la microempresa; la verificación global es de superadmin."""
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import Principal, get_current_user
+from app.inventario import kardex
+from app.inventario.router import router as router_inventario
+from app.microempresas.models import Microempresa, Rubro
+from app.productos.models import Categoria, Producto
+
+
+@pytest.fixture
+def como(db):
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.add(Categoria(id_categoria=1, id_microempresa=1, nombre="General", fecha_creacion=datetime.now()))
+    db.add(Producto(id_producto=1, id_microempresa=1, id_categoria=1, nombre="Arroz", precio_venta=5, fecha_creacion=datetime.now()))
+    db.commit()
+    app = FastAPI()
+    app.include_router(router_inventario)
+
+    def cliente(rol: str = None, id_microempresa: int = None):
+        app.dependency_overrides.clear()
+        if rol:
+            principal = Principal(1, "u", "u@prueba.com", True, rol, id_microempresa)
+            app.dependency_overrides[get_current_user] = lambda: principal
+        return TestClient(app)
+
+    return cliente
+
+
+RUTAS = [
+    "/inventario/producto/1/movimientos",
+    "/inventario/producto/1/stock-a-fecha?fecha=2030-01-01T00:00:00",
+    "/inventario/microempresas/1/stock-a-fecha?fecha=2030-01-01T00:00:00",
+    "/inventario/kardex/verificar?id_microempresa=1",
+]
+
+
+@pytest.mark.parametrize("ruta", RUTAS)
+def test_kardex_exige_pertenecer_a_la_microempresa(como, ruta):
+    assert como().get(ruta).status_code == 401
+    assert como("adminmicroempresa", 2).get(ruta).status_code == 403
+    assert como("usuario").get(ruta).status_code == 403
+    assert como("vendedor", 1).get(ruta).status_code == 200
+    assert como("superadmin").get(ruta).status_code == 200
+
+
+def test_verificar_sin_microempresa_solo_es_global_para_superadmin(como, monkeypatch):
+    alcances = []
+    monkeypatch.setattr(kardex, "verificar_kardex", lambda db, id_microempresa=None: alcances.append(id_microempresa) or {})
+    assert como("adminmicroempresa", 1).get("/inventario/kardex/verificar").status_code == 200
+    assert como("usuario").get("/inventario/kardex/verificar").status_code == 403
+    assert como("superadmin").get("/inventario/kardex/verificar").status_code == 200
+    assert alcances == [1, None]
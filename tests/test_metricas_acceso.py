@@ -0,0 +1,46 @@
+"""Los endpoints de métricas operativas solo los ve un superadmin."""
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import Principal, get_current_user, solo_superadmin
+from app.notificaciones.router import router as router_notificaciones
+from app.productos.router import router as router_productos
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/metricas/prueba")
+    def metricas_prueba(user=Depends(solo_superadmin)):
+        return {"ok": True}
+
+    return app
+
+
+def _con(router):
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def _cliente(app, principal=None):
+    if principal is not None:
+        app.dependency_overrides[get_current_user] = lambda: principal
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("app, ruta", [
+    (_app(), "/metricas/prueba"),
+    (_con(router_productos), "/productos/portal/cache/metricas"),
+    (_con(router_notificaciones), "/notificaciones/eventos/metricas"),
+    (_con(router_notificaciones), "/notificaciones/correo/metricas"),
+    (_con(router_notificaciones), "/notificaciones/ws/metricas"),
+    (_con(router_notificaciones), "/notificaciones/contador/metricas"),
+])
+def test_metricas_solo_para_superadmin(db, app, ruta):
+    assert _cliente(app).get(ruta).status_code == 401
+    assert _cliente(app, Principal(1, "a", "a@prueba.com", True, "adminmicroempresa", 1)).get(ruta).status_code == 403
+    assert _cliente(app, Principal(2, "v", "v@prueba.com", True, "vendedor", 1)).get(ruta).status_code == 403
+    assert _cliente(app, Principal(3, "s", "s@prueba.com", True, "superadmin")).get(ruta).status_code == 200
+    app.dependency_overrides.clear()
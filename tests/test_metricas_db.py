@@ -0,0 +1,19 @@
+"""Las sentencias que fallan no dejan su inicio en la pila de tiempos de la conexión."""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database.session import MetricasRequest
+
+
+def test_sentencia_fallida_libera_la_pila_de_tiempos(db):
+    metricas = MetricasRequest()
+    db.info["metricas_request"] = metricas
+    db.execute(text("SELECT 1"))
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            db.execute(text("SELECT * FROM tabla_inexistente"))
+        db.rollback()
+    db.execute(text("SELECT 1"))
+    assert db.connection().info.get("inicio_consulta") == []
+    assert metricas.consultas == 5
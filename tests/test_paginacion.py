@@ -0,0 +1,69 @@
+"""Sin cursor ni limit los listados devuelven todo; con limit se pagina por X-Next-Cursor."""
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from app.notificaciones.models import Notificacion
+from app.notificaciones.router import router as router_notificaciones
+from app.ventas import service as ventas_service
+from app.ventas.models import Venta
+
+TOTAL = 250
+
+
+def _cliente(db):
+    inicio = datetime(2024, 1, 1)
+    db.execute(insert(Notificacion), [
+        {"id_microempresa": 1, "id_usuario": 7, "tipo_evento": "VENTA_REALIZADA", "canal": "IN_APP",
+         "mensaje": f"n{i}", "leido": False, "enviado": False, "fecha_creacion": inicio + timedelta(minutes=i // 2)}
+        for i in range(TOTAL)
+    ])
+    db.commit()
+    app = FastAPI()
+    app.include_router(router_notificaciones)
+    return TestClient(app)
+
+
+def test_sin_parametros_devuelve_la_lista_completa(db):
+    respuesta = _cliente(db).get("/notificaciones/usuario/7/no-leidas")
+    assert respuesta.status_code == 200
+    assert len(respuesta.json()) == TOTAL
+    assert "x-next-cursor" not in respuesta.headers
+
+
+def test_con_limit_recorre_todas_las_paginas(db):
+    cliente = _cliente(db)
+    ids, params = [], {"limit": 100}
+    while True:
+        respuesta = cliente.get("/notificaciones/usuario/7/no-leidas", params=params)
+        assert len(respuesta.json()) <= 100
+        ids += [n["id_notificacion"] for n in respuesta.json()]
+        cursor = respuesta.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        # Con cursor y sin limit se usa PAGINACION_LIMITE
+        params = {"cursor": cursor}
+    assert len(ids) == len(set(ids)) == TOTAL
+
+
+def test_ventas_sin_fecha_no_se_pierden_entre_paginas(db):
+    inicio = datetime(2024, 1, 1)
+    db.execute(insert(Venta), [
+        {"id_venta": i, "id_microempresa": 1, "fecha": None if i % 4 == 0 else inicio + timedelta(hours=i // 3),
+         "total": 10, "estado": "PAGADA", "tipo": "presencial"}
+        for i in range(1, 31)
+    ])
+    db.commit()
+    ids, cursor = [], None
+    while True:
+        pagina = ventas_service.listar_ventas(db, cursor, 4)
+        ids += [v.id_venta for v in pagina]
+        cursor = pagina.siguiente_cursor
+        if not cursor:
+            break
+    assert sorted(ids) == list(range(1, 31))
+    assert ids == [v.id_venta for v in ventas_service.listar_ventas(db)]
+    # Primero las sin fecha (por id), después las fechadas
+    assert ids[:7] == [28, 24, 20, 16, 12, 8, 4]
@@ -0,0 +1,54 @@
+"""Los claims de rol del JWT solo valen con JWT_CLAIMS_PRINCIPAL y mientras coincidan con el usuario actual."""
+import pytest
+from fastapi import HTTPException
+
+from app.auth.base_user import Usuario
+from app.core import dependencies
+from app.core.dependencies import cache_principal, invalidar_principal, principal_desde_token
+from app.core.security import create_access_token
+from app.microempresas.models import Microempresa, Rubro
+from app.users.models import AdminMicroempresa
+
+
+@pytest.fixture
+def admin(db):
+    cache_principal.limpiar()
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.add(Usuario(id_usuario=1, nombre="Ana", email="ana@prueba.com", password_hash="x"))
+    db.add(AdminMicroempresa(id_usuario=1, id_microempresa=1))
+    db.commit()
+    yield
+    cache_principal.limpiar()
+
+
+def _token_con_claims(db):
+    claims = dependencies.cargar_principal(db, 1).a_claims()
+    return create_access_token(data={"sub": "1", **claims}, expires_minutes=5)
+
+
+def test_claims_se_ignoran_con_la_opcion_apagada(db, admin, monkeypatch):
+    monkeypatch.setattr(dependencies, "JWT_CLAIMS_PRINCIPAL", False)
+    token = create_access_token(data={"sub": "1", "rol": "superadmin", "id_microempresa": None}, expires_minutes=5)
+    assert principal_desde_token(token, db).rol == "adminmicroempresa"
+
+
+@pytest.mark.parametrize("cambio", ["baja", "desactivado", "degradado"])
+def test_token_con_claims_se_revoca_al_cambiar_el_usuario(db, admin, monkeypatch, cambio):
+    monkeypatch.setattr(dependencies, "JWT_CLAIMS_PRINCIPAL", True)
+    token = _token_con_claims(db)
+    assert principal_desde_token(token, db).id_microempresa == 1
+
+    if cambio == "baja":
+        db.query(AdminMicroempresa).delete()
+        db.query(Usuario).delete()
+    elif cambio == "desactivado":
+        db.query(Usuario).update({"estado": False})
+    else:
+        db.query(AdminMicroempresa).delete()
+    db.commit()
+    invalidar_principal(1)
+
+    with pytest.raises(HTTPException) as error:
+        principal_desde_token(token, db)
+    assert error.value.status_code == 401
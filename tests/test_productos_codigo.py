@@ -0,0 +1,39 @@
+"""Dos altas con el mismo código que pasan la validación a la vez: la segunda responde 409, no 500."""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.microempresas.models import Microempresa, Rubro
+from app.productos import models, schemas, service
+
+
+@pytest.fixture
+def categoria(db):
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.add(models.Categoria(id_categoria=1, id_microempresa=1, nombre="General", fecha_creacion=datetime.now()))
+    db.commit()
+    return 1
+
+
+def _producto(codigo: str, nombre: str = "Arroz"):
+    return schemas.ProductoCreate(nombre=nombre, precio_venta=5, codigo=codigo, id_categoria=1)
+
+
+def test_codigo_repetido_en_carrera_responde_409(db, categoria, monkeypatch):
+    service.crear_producto(db, 1, _producto("7501"))
+    # La otra solicitud ya pasó la validación previa cuando se confirma esta
+    monkeypatch.setattr(service, "_validar_codigo_unico", lambda *args, **kwargs: None)
+
+    with pytest.raises(HTTPException) as error:
+        service.crear_producto(db, 1, _producto("7501", "Arroz 2"))
+    assert error.value.status_code == 409
+    assert error.value.detail == service.CODIGO_REPETIDO
+
+    otro = service.crear_producto(db, 1, _producto("7502", "Azúcar"))
+    with pytest.raises(HTTPException) as error:
+        service.actualizar_producto(db, otro.id_producto, schemas.ProductoUpdate(nombre="Azúcar", precio_venta=5, codigo="7501", id_categoria=1))
+    assert error.value.status_code == 409
+    # La sesión sigue usable después del rollback
+    assert db.query(models.Producto).count() == 2
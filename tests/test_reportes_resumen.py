@@ -0,0 +1,52 @@
+"""verificar/reconstruir resumen_diario exigen token y quedan acotados a la microempresa del admin."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import Principal, get_current_user
+from app.reportes import service
+from app.reportes.router import router as router_reportes
+
+
+@pytest.fixture
+def cliente(db, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(service, "reconstruir_resumen_diario", lambda db, id_microempresa=None: llamadas.append(id_microempresa) or 0)
+    app = FastAPI()
+    app.include_router(router_reportes)
+
+    def como(rol: str = None, id_microempresa: int = None):
+        app.dependency_overrides.clear()
+        if rol:
+            principal = Principal(1, "u", "u@prueba.com", True, rol, id_microempresa)
+            app.dependency_overrides[get_current_user] = lambda: principal
+        return TestClient(app)
+
+    como.llamadas = llamadas
+    return como
+
+
+def test_sin_token_responde_401(cliente):
+    assert cliente().post("/reportes/resumen-diario/reconstruir").status_code == 401
+    assert cliente().get("/reportes/resumen-diario/verificar").status_code == 401
+    assert cliente.llamadas == []
+
+
+@pytest.mark.parametrize("rol", ["vendedor", "usuario"])
+def test_roles_sin_permiso_responden_403(cliente, rol):
+    assert cliente(rol, 1).post("/reportes/resumen-diario/reconstruir").status_code == 403
+    assert cliente.llamadas == []
+
+
+def test_admin_queda_acotado_a_su_microempresa(cliente):
+    admin = cliente("adminmicroempresa", 1)
+    assert admin.post("/reportes/resumen-diario/reconstruir", params={"id_microempresa": 2}).status_code == 403
+    assert admin.post("/reportes/resumen-diario/reconstruir").status_code == 200
+    assert admin.get("/reportes/resumen-diario/verificar").status_code == 200
+    # Sin id_microempresa se reconstruye solo la suya, nunca la tabla completa
+    assert cliente.llamadas == [1]
+
+
+def test_superadmin_puede_reconstruir_todo(cliente):
+    assert cliente("superadmin").post("/reportes/resumen-diario/reconstruir").status_code == 200
+    assert cliente.llamadas == [None]
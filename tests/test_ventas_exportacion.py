@@ -0,0 +1,28 @@
+"""La exportación de ventas y pagos solo la descarga alguien de la microempresa."""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import Principal, get_current_user
+from app.microempresas.models import Microempresa, Rubro
+from app.ventas.router import router as router_ventas
+
+
+def _cliente(principal=None):
+    app = FastAPI()
+    app.include_router(router_ventas)
+    if principal is not None:
+        app.dependency_overrides[get_current_user] = lambda: principal
+    return TestClient(app)
+
+
+def test_exportar_ventas_exige_pertenecer_a_la_microempresa(db):
+    db.add(Rubro(id_rubro=1, nombre="Comercio"))
+    db.add(Microempresa(id_microempresa=1, nombre="Tienda", nit="1", tipo_atencion="presencial", id_rubro=1))
+    db.commit()
+    ruta = "/ventas/microempresas/1/exportar/pagos"
+
+    assert _cliente().get(ruta).status_code == 401
+    assert _cliente(Principal(2, "a", "a@prueba.com", True, "adminmicroempresa", 2)).get(ruta).status_code == 403
+    assert _cliente(Principal(3, "u", "u@prueba.com", True, "usuario")).get(ruta).status_code == 403
+    assert _cliente(Principal(4, "a", "a@prueba.com", True, "adminmicroempresa", 1)).get(ruta).status_code == 200
+    assert _cliente(Principal(5, "s", "s@prueba.com", True, "superadmin")).get(ruta, params={"formato": "csv"}).status_code == 200